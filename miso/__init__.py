@@ -65,7 +65,7 @@
    
 '''
 
-import os, sys
+import os, sys, threading
 import config
 
 # entity enumerations
@@ -92,9 +92,29 @@ ENT_VERSION     = 'Version'
 ENT_VIDEO_CLIP  = 'Clip'
 
 
+class _NotFetched(object):
+    '''
+    The value of the entity attributes whose fields were left out of the query, see the fields projection of 
+    Project.list_versions.  The attribute is fetched from database the first time it is read.
+    '''
+    def __repr__(self):
+        return 'NOT_FETCHED'
+    
+    def __nonzero__(self):
+        return False
+    
+NOT_FETCHED = _NotFetched()
+
+
 # store the connections to the project
 _PROJ_SESSION = {}
 
+# store the non blocking facades of the project sessions
+_ASYNC_PROJ_SESSION = {}
+
+# guards the creation of the project sessions, shared by the threads.
+_PROJ_SESSION_LOCK = threading.RLock()
+
 def project(*arg_list, **arg_hash):
     return get_project ( *arg_list, **arg_hash )
     
@@ -119,10 +139,36 @@ def get_project(show=None, flg_dev=False):
     
     session_key = (show, flg_dev)
     
-    if not _PROJ_SESSION.has_key(session_key):
-        _PROJ_SESSION[session_key] = _create_project_session(show, flg_dev)
+    # the session is created once, the threads asking for it meanwhile wait and share it.
+    session = _PROJ_SESSION.get(session_key)
+    
+    if session==None:
+        with _PROJ_SESSION_LOCK:
+            if not _PROJ_SESSION.has_key(session_key):
+                _PROJ_SESSION[session_key] = _create_project_session(show, flg_dev)
+            
+            session = _PROJ_SESSION[session_key]
     
-    return _PROJ_SESSION[session_key]
+    return session
+
+
+def get_async_project(show=None, flg_dev=False):
+    '''
+    Non blocking facade of the project session, the project calls return pending results.
+    @param show name [optional] inherit from environment ex: APERO_PROJ
+    @param flg_dev [optional] connect to dev environment
+    @rtype: miso.async_project.AsyncProject
+    '''
+    proj = get_project(show, flg_dev)
+    
+    session_key = (proj.entity_code(), flg_dev)
+    
+    with _PROJ_SESSION_LOCK:
+        if not _ASYNC_PROJ_SESSION.has_key(session_key):
+            from miso.async_project import AsyncProject
+            _ASYNC_PROJ_SESSION[session_key] = AsyncProject(proj)
+        
+        return _ASYNC_PROJ_SESSION[session_key]
 
 
 def _create_project_session(show, flg_dev):
@@ -138,12 +184,26 @@ def _create_project_session(show, flg_dev):
     prod_db_type = config.prod_db_conn_param[(show, dev_type)]['type']
     prod_db_conn = None
 
+    # optional local snapshot, for the project session to start with warm cache.
+    snapshot = None
+    if config.entity_snapshot_root:
+        from miso.entity_snapshot import EntitySnapshot
+        snapshot = EntitySnapshot( os.path.join(config.entity_snapshot_root, '%s_%s.sqlite' % (show, dev_type)) )
+
     if prod_db_type == 'shotgun':      
         from miso.pdb_plugins import shotgun_session            
         prod_db_conn = shotgun_session.ShotgunSession( config.prod_db_conn_param[(show, dev_type)] )
         
         import entity_factory
-        return entity_factory.Project( prod_db_conn )
+        return entity_factory.Project( prod_db_conn, snapshot )
+    
+    elif prod_db_type == 'mock_shotgun':
+        from miso.pdb_plugins import shotgun_session, mock_shotgun
+        show_config  = config.prod_db_conn_param[(show, dev_type)]
+        prod_db_conn = shotgun_session.ShotgunSession( show_config, sg_class = mock_shotgun.connector(show_config) )
+        
+        import entity_factory
+        return entity_factory.Project( prod_db_conn, snapshot )
     
     
 from exceptions import Exception
@@ -158,4 +218,8 @@ class MisoError(Exception):
 
 class TaskNotFoundError(MisoError):
     # failed to turn the meta data from production database into an entity objet.
-    pass
\ No newline at end of file
+    pass
+
+class WriteError(MisoError):
+    # the production database rejected the write, ex: invalid field value.  Sending it again would fail the same.
+    pass
@@ -0,0 +1,143 @@
+'''
+\namespace miso.async_project
+
+ Non blocking facade over the Project.  The project calls run on worker threads and return straight away
+ with the pending result, so a service can serve many requests at once from one warm project session.
+
+ The facade shares the project, and its entity cache, with the blocking callers of miso.get_project.
+
+        bbb = miso.get_async_project('bbb')
+
+        pending_shot_list = [ bbb.shot( shot_code ) for shot_code in shot_code_list ]
+
+        # collect the results, the first exception of the calls is raised.
+        shot_list = bbb.gather( pending_shot_list )
+
+        # entity functions are run through submit.
+        pending = bbb.submit( shot_list[0].list_versions, latest_only=True )
+        pending.get( timeout=30 )
+'''
+from multiprocessing.pool import ThreadPool
+
+from miso import entity_factory
+from miso.config import get_logger, async_max_workers
+
+LOG = get_logger()
+
+# the Project methods that hit the database, these return pending results.
+ASYNC_METHODS = [ 'list_sequences',
+                  'sequence',
+                  'shot',
+                  'asset',
+                  'get_version',
+                  'get_shot_audio',
+                  'list_shots',
+                  'sequence_cut',
+                  'list_sequence_cuts',
+                  'cut_duration',
+                  'list_assets',
+                  'get_entity_from_meta',
+                  'get_entities_from_meta',
+                  'get_user',
+                  'get_task',
+                  'get_tasks',
+                  'get_users',
+                  'get_status',
+                  'get_statuses',
+                  'get_task_type',
+                  'get_source_path',
+                  'list_task_types',
+                  'list_submission_types',
+                  'list_status_types',
+                  'list_tasks',
+                  'prefetch_tasks',
+                  'list_clips',
+                  'list_versions',
+                  'prefetch_versions',
+                  'list_clips_from_versions',
+                  'code_index',
+                  'batch_list_entities',
+                  'sync',
+                  'create_version',
+                  'create_frame_submission',
+                  'set_task_status' ]
+
+
+class AsyncProject:
+
+    def __init__(self, project, max_workers=None):
+        '''
+        @param project the project session
+        @type project: miso.entity_factory.Project
+        @param max_workers [optional] maximum number of calls in flight, default config.async_max_workers
+        '''
+        self._project = project
+        self._pool    = ThreadPool( max_workers or async_max_workers )
+
+
+    def project(self):
+        '''
+        @return the blocking project session behind the facade.
+        '''
+        return self._project
+
+
+    def submit(self, func, *arg_list, **arg_hash):
+        '''
+        Run any function on the worker threads, ex: entity functions such as shot.list_versions.
+        @return the pending result
+        @rtype: multiprocessing.pool.AsyncResult
+        '''
+        return self._pool.apply_async( func, arg_list, arg_hash )
+
+
+    def gather(self, pending_list, timeout=None):
+        '''
+        Wait for the pending results.
+        @param pending_list list of pending results
+        @param timeout [optional] seconds to wait for each result
+        @return list of the results, in the order of the pending results.
+        '''
+        return [ pending.get(timeout) for pending in pending_list ]
+
+
+    def close(self):
+        '''
+        Stop the worker threads once the calls in flight are done.
+        '''
+        self._pool.close()
+        self._pool.join()
+
+
+    # the calls without database round trip stay blocking.
+    def entity_code(self):
+        return self._project.entity_code()
+
+
+    def db_access_metric(self):
+        return self._project.db_access_metric()
+
+
+    def query_profiler(self):
+        return self._project.query_profiler()
+
+
+    def cache_metric(self):
+        return self._project.cache_metric()
+
+
+def _async_method(name):
+    '''
+    @return method running the Project method of the name on the worker threads.
+    '''
+    def method(self, *arg_list, **arg_hash):
+        return self.submit( getattr(self._project, name), *arg_list, **arg_hash )
+
+    method.__name__ = name
+    method.__doc__  = '%s\n        @return the pending result of Project.%s' % (
+                                                        getattr(entity_factory.Project, name).__doc__ or '', name )
+    return method
+
+
+for _name in ASYNC_METHODS:
+    setattr( AsyncProject, _name, _async_method(_name) )
@@ -0,0 +1,139 @@
+'''
+\namespace miso.batch_loader
+
+ Collect the lookups of many entities by key, and resolve them with one batch query.
+
+ The lookups are queued, the first one to be read sends the batch query for all the queued keys at once.
+ For example, the rows of a version table queue the artist of each version, reading the artist of the first
+ row fetches the artists of all the rows.
+
+        loader = BatchLoader( lambda id_list: dict( fetch_users(id_list) ) )
+
+        pending_list = loader.load_many( [ 3, 5, 8 ] )      # queued, no query yet
+
+        pending_list[0].get()                               # one query for the ids 3, 5 and 8
+        pending_list[1].get()                               # no query
+
+ The same key queued twice is fetched once.  The loaded values are not kept once resolved, the caller keeps
+ them, ex: in the entity cache.
+'''
+import sys, threading
+
+# maximum number of keys per batch query.
+MAX_BATCH_SIZE = 500
+
+
+class _Pending(object):
+    '''
+    The value of a queued key, resolved by the batch query.
+    '''
+    __slots__ = ('_loader', 'key', 'value', 'error', 'done')
+
+    def __init__(self, loader, key):
+        self._loader    = loader
+        self.key        = key
+        self.value      = None
+        self.error      = None
+        self.done       = threading.Event()
+
+
+    def get(self):
+        '''
+        @return the value of the key, None if not found.  The queued keys are fetched if not done yet.
+        '''
+        if not self.done.is_set():
+            self._loader.dispatch()
+            self.done.wait()
+
+        if self.error!=None:
+            raise self.error[0], self.error[1], self.error[2]
+
+        return self.value
+
+
+class BatchLoader:
+
+    def __init__(self, batch_func, max_batch_size=MAX_BATCH_SIZE):
+        '''
+        @param batch_func function given the list of keys, returning the dict of key to value.
+        @param max_batch_size [optional] maximum number of keys per call of batch_func.
+        '''
+        self._batch_func        = batch_func
+        self._max_batch_size    = max_batch_size
+
+        self._queue             = []
+        self._pending           = {}        # key -> _Pending, queued or in flight
+        self._metric            = {'batch':0, 'key':0}
+        self._lock              = threading.Lock()
+
+
+    def load(self, key):
+        '''
+        Queue the key, the value is fetched with the next batch.
+        @rtype: _Pending
+        '''
+        with self._lock:
+            pending = self._pending.get(key)
+
+            if pending==None:
+                pending = self._pending[key] = _Pending(self, key)
+                self._queue.append(pending)
+
+        return pending
+
+
+    def load_many(self, key_list):
+        '''
+        @return list of the pending values of the keys.
+        '''
+        return [ self.load(key) for key in key_list ]
+
+
+    def get_many(self, key_list):
+        '''
+        @return list of the values of the keys, fetched with the other queued keys.
+        '''
+        return [ pending.get() for pending in self.load_many(key_list) ]
+
+
+    def dispatch(self):
+        '''
+        Fetch the queued keys, max_batch_size keys per batch query.
+        '''
+        with self._lock:
+            queue, self._queue = self._queue, []
+
+        for i in range(0, len(queue), self._max_batch_size):
+            chunk = queue[i:i+self._max_batch_size]
+
+            try:
+                value_hash = self._batch_func( [ pending.key for pending in chunk ] ) or {}
+
+                for pending in chunk:
+                    pending.value = value_hash.get(pending.key)
+
+            except:
+                error = sys.exc_info()
+
+                for pending in chunk:
+                    pending.error = error
+
+            finally:
+                with self._lock:
+                    self._metric['batch'] += 1
+                    self._metric['key']   += len(chunk)
+
+                    for pending in chunk:
+                        self._pending.pop(pending.key, None)
+
+                for pending in chunk:
+                    pending.done.set()
+
+
+    def metric(self):
+        '''
+        @return number of batch queries sent, and number of keys fetched.
+        @rtype: dict
+        '''
+        with self._lock:
+            return dict(self._metric)
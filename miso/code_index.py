@@ -0,0 +1,129 @@
+'''
+\namespace miso.code_index
+
+ Sorted index of the entity codes, to search the entities by code without querying the database.
+
+ The codes are kept sorted, a prefix is found by bisecting to the first code with the prefix.  A regular
+ expression is only matched against the codes of its literal prefix when it is anchored, ex: '^bike[0-9]',
+ otherwise against all the codes.
+
+        index = CodeIndex( [ (ENT_ASSET, 12, 'bike'), (ENT_SHOT, 5, 'bunny_010_0010'), ... ] )
+
+        index.prefix('bun')                 # [ (ENT_SHOT, 5, 'bunny_010_0010'), ... ]
+        index.search('^bike[0-9]')
+        index.find_codes(['bike', 'car'])
+
+ Each entry is a tuple ( entity_type, entity_id, entity_code ), the results are ordered by code.
+'''
+import bisect, re
+
+# characters with a special meaning in a regular expression, the literal prefix stops at the first one.
+_REGEX_SPECIAL = set('.^$*+?{}[]\\|()')
+
+
+def literal_prefix(pattern):
+    '''
+    @return the literal prefix of the anchored regular expression, '' if the pattern is not anchored.
+            ex: '^bike[0-9]' -> 'bike'
+    '''
+    # an alternative may match other codes, ex: '^bike|car'
+    if not pattern.startswith('^') or '|' in pattern:
+        return ''
+
+    prefix = []
+    for c in pattern[1:]:
+        if c in _REGEX_SPECIAL:
+            # a quantifier applies to the character before, ex: '^bikes?'
+            if c in '*?{' and prefix:
+                prefix.pop()
+            break
+
+        prefix.append(c)
+
+    return ''.join(prefix)
+
+
+class CodeIndex:
+
+    def __init__(self, entry_list):
+        '''
+        @param entry_list list of tuple ( entity_type, entity_id, entity_code )
+        '''
+        self._entry_list    = sorted( [ e for e in entry_list if e[2]!=None ], key=lambda e: e[2] )
+        self._code_list     = [ e[2] for e in self._entry_list ]
+
+        # ( entity_type, entity_id ) -> entry, and entity_id -> [ entry ]
+        self._entity        = dict( [ ((e[0], e[1]), e) for e in self._entry_list ] )
+        self._id_hash       = {}
+
+        for e in self._entry_list:
+            self._id_hash.setdefault( e[1], [] ).append(e)
+
+
+    def __len__(self):
+        return len(self._entry_list)
+
+
+    def _prefix_range(self, prefix):
+        lo = bisect.bisect_left(self._code_list, prefix)
+        hi = lo
+
+        while hi < len(self._code_list) and self._code_list[hi].startswith(prefix):
+            hi += 1
+
+        return lo, hi
+
+
+    def prefix(self, prefix):
+        '''
+        @return the entries which code starts with the prefix.
+        '''
+        lo, hi = self._prefix_range(prefix)
+
+        return self._entry_list[lo:hi]
+
+
+    def search(self, pattern, flags=0):
+        '''
+        @param pattern the regular expression, matched anywhere in the code unless anchored.
+        @param flags [optional] re flags, ex: re.IGNORECASE
+        @return the entries which code matches the regular expression.
+        '''
+        regex  = re.compile(pattern, flags)
+        prefix = literal_prefix(pattern) if not flags & re.IGNORECASE else ''
+
+        lo, hi = self._prefix_range(prefix) if prefix else (0, len(self._entry_list))
+
+        return [ e for e in self._entry_list[lo:hi] if regex.search(e[2]) ]
+
+
+    def find_codes(self, code_list):
+        '''
+        @return the entries of the codes, in the order of the codes.
+        '''
+        result = []
+
+        for code in code_list:
+            lo, hi = bisect.bisect_left(self._code_list, code), bisect.bisect_right(self._code_list, code)
+            result.extend( self._entry_list[lo:hi] )
+
+        return result
+
+
+    def find_ids(self, id_list, entity_type=None):
+        '''
+        @param id_list the entity ids
+        @param entity_type [optional] the entity type of the ids, default the entities of any type with the ids.
+        @return the entries of the ids, in the order of the ids.
+        '''
+        result = []
+
+        for entity_id in id_list:
+            if entity_type!=None:
+                entry = self._entity.get( (entity_type, entity_id) )
+                if entry:
+                    result.append(entry)
+            else:
+                result.extend( self._id_hash.get(entity_id, []) )
+
+        return result
@@ -1,6 +1,11 @@
 import os, logging
 
-url, user, key = [ t.strip() for t in open(r'C:\tmp\shotgun_conn\shotgun_conn.txt').read().split('\n')[0].split(',') ]
+SHOTGUN_CONN_FILE = r'C:\tmp\shotgun_conn\shotgun_conn.txt'
+
+if os.path.isfile(SHOTGUN_CONN_FILE):
+    url, user, key = [ t.strip() for t in open(SHOTGUN_CONN_FILE).read().split('\n')[0].split(',') ]
+else:
+    url, user, key = None, None, None
 
 prod_db_conn_param = {
                       ('bbb','prod'):{
@@ -24,6 +29,66 @@ prod_db_conn_param = {
                                         },                        
                       }
 
+# Connect all the shows to the offline mock shotgun, generated show data served in process, 
+# see miso.pdb_plugins.mock_shotgun.  ex: MISO_MOCK_SHOTGUN=1 to run the unit tests without a shotgun site.
+if os.environ.get('MISO_MOCK_SHOTGUN'):
+    for show_param in prod_db_conn_param.values():
+        show_param['type'] = 'mock_shotgun'
+
+# Bound the project entity cache per entity type, by default the cache is unbounded.
+# max_entries: least recently used entities are evicted beyond the limit.
+# max_age: seconds before a cached entity is fetched again from database.
+# ex: { 'Version': {'max_entries': 50000, 'max_age': 300} }
+entity_cache_policy = {}
+
+# Folder of the local entity snapshot per show, ex: '/var/tmp/miso_snapshot'.
+# New project session loads the entities from the snapshot, and only fetch the entities updated since. 
+# None to disable. 
+entity_snapshot_root = None
+
+# Seconds the list queries answered from the snapshot entities are trusted, the entities updated by the other 
+# sessions, ex: the new shots, are fetched after that before the next list query.
+mirror_refresh_interval = 30
+
+# Manufacture compact entities, without instance __dict__ and only keeping the raw data fields 
+# in the allowlist of the entity type.  Entity types not in the allowlist keep all the raw data fields.
+# The snapshot entity types ( Sequence, Shot, Asset ) need all their raw data to be saved in the snapshot.
+# ex: { 'Version': ['id', 'code', 'sg_status_list'] }
+compact_entities            = False
+compact_entity_raw_fields   = {}
+
+# Record each production database query with its calling miso method, see miso.query_profiler.
+# Can be switched at runtime with project.query_profiler().enable()
+query_profiling = False
+
+# Identical production database queries in flight at the same time are sent once, the callers share the result.
+single_flight = True
+
+# Seconds the query results are kept to answer the identical queries, 0 to disable.
+# Results may be stale by as much, ex: 2 to collapse the bursts of duplicate reads of a review server.
+query_memo_ttl = 0
+
+# Share the query results between the shotgun sessions of the show, see miso.pdb_plugins.result_cache.
+# One of None, 'memory', 'file:///var/tmp/miso_result_cache' or 'redis://127.0.0.1:6379'.
+# Results may be stale by as much as result_cache_ttl seconds, the writes of the session drop them.
+result_cache        = None
+result_cache_ttl    = 60
+
+# Seconds the task type catalogue is used before it is queried again, also when loaded from the local snapshot.
+task_type_ttl = 3600
+
+# Maximum number of project calls in flight for the non blocking project, see miso.get_async_project.
+async_max_workers = 16
+
+# The writes queued by the project are sent together, see miso.write_queue.
+# write_batch_size: maximum number of writes per batch request.
+# write_flush_interval: seconds a write waits for others to join its batch.
+# write_max_retries, write_retry_backoff: a failed batch is sent again after backoff, 2 x backoff, ... seconds.
+write_batch_size        = 100
+write_flush_interval    = 0.2
+write_max_retries       = 3
+write_retry_backoff     = 0.5
+
 LOGGER = None
 
 def get_logger():
@@ -0,0 +1,389 @@
+'''
+\namespace miso.entity_cache
+
+ The entity cache holds the entity objects manufactured by the project, keyed by entity type and entity id.
+
+ Entities are also indexed by entity code, since most of the lookups are by code. Entity code is not
+ required to be unique, hence the code index maps a code to all the matching entity ids.
+
+ Each entity type can be given a policy to bound the cache:
+  1. max_entries: the least recently used entities are evicted once the limit is reached.
+  2. max_age: entities older than max_age seconds are expired, and will be fetched again from database.
+
+ Example:
+
+        cache = EntityCache( {ENT_VERSION: {'max_entries':50000, 'max_age':300}} )
+        cache.put( ENT_SHOT, shot.entity_id(), shot )
+
+        cache.get( ENT_SHOT, 5 )
+        cache.find_by_code( ENT_SHOT, 'bunny_010_0010' )
+
+        # hit, miss and eviction counters per entity type.
+        cache.metric()
+
+ The cache is shared by the threads of the project session.  Lookups of the unbounded entity types are
+ concurrent, while the writes, and the lookups of the bounded types which reorder or expire entries,
+ are exclusive.
+'''
+
+import collections, time, threading
+
+
+class ReadWriteLock:
+    '''
+    Many readers or one writer at a time.  Waiting writers go before the new readers, so a steady flow
+    of lookups can not starve the writes.  The locks are not reentrant.
+
+        with rw_lock.read_lock():
+            ...
+    '''
+    def __init__(self):
+        self._cond              = threading.Condition( threading.Lock() )
+        self._reader_count      = 0
+        self._writer            = False
+        self._waiting_writers   = 0
+
+        self._read_lock         = _LockContext( self.acquire_read, self.release_read )
+        self._write_lock        = _LockContext( self.acquire_write, self.release_write )
+
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._reader_count += 1
+
+
+    def release_read(self):
+        with self._cond:
+            self._reader_count -= 1
+            if self._reader_count==0:
+                self._cond.notify_all()
+
+
+    def acquire_write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._reader_count:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+
+    def read_lock(self):
+        return self._read_lock
+
+
+    def write_lock(self):
+        return self._write_lock
+
+
+class _LockContext(object):
+    '''
+    With block holding a lock, lighter than contextlib on the lookup path.
+    '''
+    __slots__ = ('_acquire', '_release')
+
+    def __init__(self, acquire, release):
+        self._acquire   = acquire
+        self._release   = release
+
+    def __enter__(self):
+        self._acquire()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._release()
+
+
+def _read_locked(func):
+    '''
+    Run the cache method holding the read lock.
+    '''
+    def wrapper(self, *arg_list, **arg_hash):
+        with self._rw_lock.read_lock():
+            return func(self, *arg_list, **arg_hash)
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__  = func.__doc__
+
+    return wrapper
+
+
+def _write_locked(func):
+    '''
+    Run the cache method holding the write lock.
+    '''
+    def wrapper(self, *arg_list, **arg_hash):
+        with self._rw_lock.write_lock():
+            return func(self, *arg_list, **arg_hash)
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__  = func.__doc__
+
+    return wrapper
+
+
+class EntityCache:
+
+    def __init__(self, policy=None):
+        '''
+        @param policy [optional] dict of entity_type to policy dict, ex: {ENT_VERSION: {'max_entries':1000, 'max_age':60}}
+        '''
+        self._policy     = {}
+
+        # entity_type -> OrderedDict( entity_id -> (entity object, cached time) ), ordered from least recently used.
+        self._entity     = {}
+
+        # entity_type -> entity_code -> [ entity_id ]
+        self._code_index = {}
+
+        self._metric     = {}
+
+        self._rw_lock       = ReadWriteLock()
+
+        # the counters are updated by the concurrent readers
+        self._metric_lock   = threading.Lock()
+
+        for entity_type, type_policy in (policy or {}).items():
+            self.set_policy(entity_type, **type_policy)
+
+
+    @_write_locked
+    def set_policy(self, entity_type, max_entries=None, max_age=None):
+        '''
+        Bound the cache of the entity type, without bounds the cache of the type is unbounded again.
+        @param entity_type
+        @param max_entries [optional] maximum number of entities cached, least recently used is evicted first.
+        @param max_age [optional] maximum seconds an entity stays cached.
+        '''
+        if max_entries==None and max_age==None:
+            self._policy.pop(entity_type, None)
+            return
+
+        self._policy[entity_type] = {'max_entries': max_entries, 'max_age': max_age}
+
+        if max_entries!=None:
+            self._evict_lru(entity_type, max_entries)
+
+
+    def policy(self, entity_type):
+        '''
+        @return the policy of the entity type, None if the cache for the type is unbounded.
+        '''
+        return self._policy.get(entity_type)
+
+
+    def _count(self, entity_type, counter, value=1):
+        with self._metric_lock:
+            if entity_type not in self._metric:
+                self._metric[entity_type] = {'hit':0, 'miss':0, 'eviction':0, 'expired':0}
+
+            self._metric[entity_type][counter] += value
+
+
+    def _is_expired(self, entity_type, cached_time):
+        type_policy = self._policy.get(entity_type)
+
+        return ( type_policy!=None and type_policy['max_age']!=None and
+                 time.time() - cached_time > type_policy['max_age'] )
+
+
+    def _type_lock(self, entity_type):
+        '''
+        @return the lock for a lookup of the entity type, exclusive if the lookup may reorder or expire entries.
+        '''
+        type_policy = self._policy.get(entity_type)
+
+        if type_policy!=None and ( type_policy['max_entries']!=None or type_policy['max_age']!=None ):
+            return self._rw_lock.write_lock()
+
+        return self._rw_lock.read_lock()
+
+
+    def get(self, entity_type, entity_id):
+        '''
+        @return the cached entity, or None if it is not cached or has expired.
+        '''
+        with self._type_lock(entity_type):
+            return self._get(entity_type, entity_id)
+
+
+    def _get(self, entity_type, entity_id, count_miss=True):
+        '''
+        @param count_miss [optional] False when the caller counts the lookup miss itself.
+        '''
+        type_cache = self._entity.get(entity_type)
+
+        if type_cache==None or entity_id not in type_cache:
+            if count_miss:
+                self._count(entity_type, 'miss')
+            return None
+
+        obj, cached_time = type_cache[entity_id]
+        type_policy      = self._policy.get(entity_type)
+
+        if type_policy!=None:
+            if self._is_expired(entity_type, cached_time):
+                self._unindex(entity_type, entity_id, obj)
+                self._count(entity_type, 'expired')
+                if count_miss:
+                    self._count(entity_type, 'miss')
+                return None
+
+            # re-insert as the most recently used
+            if type_policy['max_entries']!=None:
+                del type_cache[entity_id]
+                type_cache[entity_id] = (obj, cached_time)
+
+        self._count(entity_type, 'hit')
+
+        return obj
+
+
+    def find_by_code(self, entity_type, entity_code):
+        '''
+        @return list of the cached entities matching the code.
+        '''
+        with self._type_lock(entity_type):
+            result = []
+
+            for entity_id in list( self._code_index.get(entity_type, {}).get(entity_code, []) ):
+                obj = self._get(entity_type, entity_id, count_miss=False)
+                if obj:
+                    result.append(obj)
+
+            # one miss for the code lookup, not one per expired entity.
+            if not result:
+                self._count(entity_type, 'miss')
+
+            return result
+
+
+    @_write_locked
+    def put(self, entity_type, entity_id, obj):
+        '''
+        Cache the entity object, evict the least recently used entities if over the type limit.
+        '''
+        self._put(entity_type, entity_id, obj)
+
+
+    @_write_locked
+    def put_if_absent(self, entity_type, entity_id, obj):
+        '''
+        Cache the entity object, unless another thread has cached the entity in the mean time.
+        @return the cached entity object, either the one given or the one already cached.
+        '''
+        type_cache = self._entity.get(entity_type)
+
+        if type_cache and entity_id in type_cache and not self._is_expired(entity_type, type_cache[entity_id][1]):
+            return type_cache[entity_id][0]
+
+        self._put(entity_type, entity_id, obj)
+
+        return obj
+
+
+    def _put(self, entity_type, entity_id, obj):
+        if entity_type not in self._entity:
+            self._entity[entity_type] = collections.OrderedDict()
+
+        type_cache = self._entity[entity_type]
+
+        if entity_id in type_cache:
+            self._unindex(entity_type, entity_id, type_cache[entity_id][0])
+
+        type_cache[entity_id] = (obj, time.time())
+        self._code_index.setdefault(entity_type, {}).setdefault(obj.entity_code(), []).append(entity_id)
+
+        type_policy = self._policy.get(entity_type)
+        if type_policy and type_policy['max_entries']!=None:
+            self._evict_lru(entity_type, type_policy['max_entries'])
+
+
+    @_write_locked
+    def remove(self, entity_type, entity_id):
+        '''
+        Remove the entity from cache.
+        '''
+        type_cache = self._entity.get(entity_type)
+
+        if type_cache and entity_id in type_cache:
+            self._unindex(entity_type, entity_id, type_cache[entity_id][0])
+
+
+    def _unindex(self, entity_type, entity_id, obj):
+        self._entity[entity_type].pop(entity_id, None)
+
+        code_hash = self._code_index.get(entity_type, {})
+        id_list   = code_hash.get(obj.entity_code(), [])
+
+        if entity_id in id_list:
+            id_list.remove(entity_id)
+
+        if not id_list:
+            code_hash.pop(obj.entity_code(), None)
+
+
+    def _evict_lru(self, entity_type, max_entries):
+        type_cache = self._entity.get(entity_type)
+
+        while type_cache and len(type_cache) > max_entries:
+            entity_id = next( iter(type_cache) )
+            self._unindex(entity_type, entity_id, type_cache[entity_id][0])
+            self._count(entity_type, 'eviction')
+
+
+    @_read_locked
+    def list(self, entity_type):
+        '''
+        @return all the cached entities of the entity type, the access is not counted as hit.
+        '''
+        return [ obj for obj, cached_time in self._entity.get(entity_type, {}).values() ]
+
+
+    @_read_locked
+    def size(self, entity_type=None):
+        '''
+        @return number of cached entities, of the entity type or in total.
+        '''
+        return self._size(entity_type)
+
+
+    def _size(self, entity_type=None):
+        if entity_type!=None:
+            return len(self._entity.get(entity_type, {}))
+
+        return sum([ len(type_cache) for type_cache in self._entity.values() ])
+
+
+    @_write_locked
+    def clear(self):
+        '''
+        Purge all the cached entities, the metric is kept.
+        '''
+        self._entity     = {}
+        self._code_index = {}
+
+
+    @_read_locked
+    def metric(self):
+        '''
+        @return hit, miss, eviction and expired counts, and the cached size per entity type.
+        @rtype: dict
+        '''
+        result = {}
+
+        with self._metric_lock:
+            metric = dict( [ (entity_type, dict(m)) for entity_type, m in self._metric.items() ] )
+
+        for entity_type in set( metric.keys() + self._entity.keys() ):
+            result[entity_type] = metric.get(entity_type, {'hit':0, 'miss':0, 'eviction':0, 'expired':0})
+            result[entity_type]['size'] = self._size(entity_type)
+
+        return result
@@ -13,20 +13,40 @@
    
 '''
 
-import collections, traceback, time, getpass
-from datetime import datetime
+import collections, traceback, time, getpass, threading
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
 
 from miso import *
-from miso.config import get_logger
+from miso.config import get_logger, entity_cache_policy, compact_entities, compact_entity_raw_fields, task_type_ttl, \
+                        mirror_refresh_interval
+from miso.entity_cache import EntityCache
+from miso.latest_version import LatestVersionEngine
+from miso.batch_loader import BatchLoader
+from miso.sequence_cut import SequenceCut
+from miso.code_index import CodeIndex
+from miso.write_queue import WriteQueue
 
 LOG = get_logger()
 
-class Entity:
+# the entity types searched by code, see Project.code_index
+CODE_INDEX_ENTITY_TYPES = [ ENT_SHOT, ENT_ASSET ]
+
+# the entity types with task types, see Project.list_task_types.
+TASK_TYPE_ENTITY_TYPES = [ ENT_SHOT, ENT_ASSET ]
+
+
+class Entity(object):
     '''
     The base class for wrapping production db data.
     This will be inherited by Shot, Sequence, Asset entities.
     This is an Abstract Class and should not be instantiated directly.
+    
+    Entity classes declare their attributes in __slots__, so the compact entity classes have no per instance 
+    __dict__. See COMPACT_ENTITY_CLASS.
     '''
+    __slots__ = ('_entity_type', '_entity_id', '_entity_code', '_entity_data', '_entity_label', '_project', '_partial')
+    
     def __init__(self, entity_type, entity_id, entity_code, entity_data):
         '''
         @param entity_type
@@ -42,6 +62,9 @@ class Entity:
         self._entity_label  = None      
         self._project       = None  
         
+        # made from a partial row, the attributes not fetched are NOT_FETCHED until the entity is hydrated.
+        self._partial       = False
+        
 
     def entity_type(self):
         return self._entity_type
@@ -56,8 +79,22 @@ class Entity:
         return self._entity_label
     
     def raw_entity_data(self):        
+        self._hydrate()
         return self._entity_data
     
+    def is_partial(self):
+        '''
+        @return True if the entity was made from a partial row, and some of its attributes are yet to be fetched.
+        '''
+        return self._partial
+    
+    def _hydrate(self):
+        '''
+        Fetch the fields left out of the query of the partial entity.
+        '''
+        if self._partial and self._project!=None:
+            self._project._hydrate_entity(self)
+    
     def set_label(self, value):
         self._entity_label = value        
         
@@ -70,6 +107,26 @@ class Entity:
         '''
         return self._project            
     
+    def refresh(self, other):
+        '''
+        Update the entity in place with the data of another object of the same entity, the project is kept.
+        @param other the entity object freshly made from database.
+        '''
+        assert self.entity_type()==other.entity_type() and self.entity_id()==other.entity_id(), \
+                "Can not refresh %s with a different entity %s." % (self, other)
+        
+        project = self._project
+        
+        for cls in type(other).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(other, name):
+                    setattr(self, name, getattr(other, name))
+        
+        if hasattr(other, '__dict__') and hasattr(self, '__dict__'):
+            self.__dict__.update(other.__dict__)
+            
+        self._project = project
+    
     def __eq__(self, other):
         if not isinstance(other, Entity):
             return False
@@ -100,11 +157,32 @@ class Project(Entity):
     decorate it with data from database.
                
     Caching at this level ensures object is created once per entity.
+    
+    Given a snapshot, the project starts with the cache warmed from the local snapshot and only fetch the entities 
+    updated since.
     '''
+    
+    # entity types kept in the local snapshot, once loaded the cache holds all the entities of these types.
+    SNAPSHOT_ENTITY_TYPES = [ ENT_SEQ, ENT_SHOT, ENT_ASSET ]
+    
+    # maximum number of partial entities hydrated with one query.
+    HYDRATE_BATCH_SIZE = 500
+    
+    # the entity types fetched by meta in one query per type, see get_entities_from_meta.
+    FETCH_ENTITY_TYPES = [ ENT_SEQ, ENT_SHOT, ENT_ASSET ]
+    
+    # maximum number of queries of different entity types sent at the same time.
+    FETCH_MAX_WORKERS = 4
+    
+    # the related entities of the versions which can be fetched up front, see list_versions include.
+    VERSION_INCLUDES = [ 'task', 'parent', 'artist', 'status' ]
 
-    def __init__(self, prod_db):
+    def __init__(self, prod_db, snapshot=None, compact=None):
         '''
         @param prod_db production database api.        
+        @param snapshot [optional] local snapshot of the entities.
+        @type snapshot: miso.entity_snapshot.EntitySnapshot
+        @param compact [optional] manufacture the compact entities, default config.compact_entities
         '''        
         
         # get the show info from the production db.        
@@ -120,7 +198,70 @@ class Project(Entity):
         # the session user, responsible for write operations
         self.__session_user_code = None 
         
-        self._entity_cache = {}
+        # compact entities have no instance __dict__ and only keep the allowlisted raw data.
+        self._compact = compact_entities if compact==None else compact
+        
+        # entity objects cached by type and id, bounded by the per entity type policy in config.
+        self._entity_cache = EntityCache( entity_cache_policy )
+        
+        # the latest update fetched from the database, per entity type.
+        self._entity_watermark = {}
+        
+        # entity types of which all the project entities are cached, list queries are answered from cache.
+        self._mirrored_types = set()
+        
+        # the last fetch of the entities updated, per mirrored entity type, see _refresh_mirrored.
+        self._mirror_refresh_time = {}
+        self._mirror_lock         = threading.Lock()
+        
+        # the ( entity_id, updated_at ) fetched in the last second of the watermark, per entity type. 
+        # They are listed again by the next fetch, see _fetch_updated_entities.
+        self._watermark_seen = {}
+        
+        # memoised task ids of the parent entity, (entity_type, entity_id) -> [ task_id ]
+        self._entity_task_map = {}
+        
+        # the partial entities waiting to be hydrated, entity_type -> OrderedDict( entity_id -> True )
+        self._partial_entity = {}
+        self._hydrate_lock   = threading.Lock()
+        
+        # the entities being hydrated, ( entity_type, entity_id ) -> threading.Event set once their batch is back.
+        self._hydrating      = {}
+        
+        # the latest version per entity and task, kept until the entity is updated.
+        self._latest_engine = LatestVersionEngine(self)
+        
+        # the shots of each sequence in cut order, sequence id -> SequenceCut, built on demand.
+        self._sequence_cut = {}
+        
+        # the sorted shot and asset codes, ( built time, CodeIndex ), built on demand.
+        self._code_index   = None
+        
+        # the task types per entity type, entity_type -> ( built time, OrderedDict( code -> TaskType ) )
+        self._task_type_catalogue = {}
+        self._task_type_lock      = threading.Lock()
+        
+        # the lookups by id or code queued to be fetched together, see get_tasks, get_users and get_statuses.
+        self._loader = { ENT_TASK:   BatchLoader( lambda key_list: self._load_entities(ENT_TASK, key_list) ),
+                         ENT_USER:   BatchLoader( lambda key_list: self._load_entities(ENT_USER, key_list) ),
+                         ENT_STATUS: BatchLoader( lambda key_list: self._load_entities(ENT_STATUS, key_list) ) }
+        
+        # the worker threads fetching the entities of different types at the same time, started on demand.
+        self._fetch_pool   = None
+        self._fetch_lock   = threading.Lock()
+        
+        # the writes sent together in batch requests, see queue_create_version.
+        self._write_queue  = WriteQueue( self._prod_db.batch_write, written_func=self._prod_db.find_written )
+        
+        # the number of the last version queued per task id, the next versions queued before it is written 
+        # are numbered after it.
+        self._queued_version_num = {}
+        self._write_lock         = threading.Lock()
+        
+        self._snapshot = snapshot
+        
+        if self._snapshot:
+            self.load_snapshot()
         
 
     def db_conn(self):
@@ -139,6 +280,178 @@ class Project(Entity):
         return self._prod_db.db_access_metric()
     
     
+    def query_profiler(self):
+        '''
+        The profiler of the database queries made for the project, to find which miso api makes the queries.
+        @rtype: miso.query_profiler.QueryProfiler
+        '''
+        return self._prod_db.query_profiler()
+    
+    
+    def latest_version_engine(self):
+        '''
+        The engine answering the latest version queries, see Project.list_versions latest_only.
+        @rtype: miso.latest_version.LatestVersionEngine
+        '''
+        return self._latest_engine
+    
+    
+    def write_queue(self):
+        '''
+        The queue of the writes to the database, see queue_create_version.
+        @rtype: miso.write_queue.WriteQueue
+        '''
+        return self._write_queue
+    
+    
+    def cache_metric(self):
+        '''
+        return the entity cache hit, miss, eviction counts and size per entity type since begging of session.
+        @return cache metrics
+        @rtype: dict
+        '''
+        return self._entity_cache.metric()
+    
+    
+    def set_cache_policy(self, entity_type, max_entries=None, max_age=None):
+        '''
+        Bound the entity cache for the entity type, without bounds the cache of the type is unbounded again.
+        @param entity_type ex: ENT_VERSION
+        @param max_entries [optional] maximum number of cached entities, the least recently used are evicted.
+        @param max_age [optional] seconds before the cached entity is considered stale and fetched again.
+        '''
+        self._entity_cache.set_policy(entity_type, max_entries=max_entries, max_age=max_age)
+        
+        # a bounded cache can no longer answer for all the entities of the type.
+        if max_entries!=None or max_age!=None:
+            self._mirrored_types.discard(entity_type)
+    
+    
+    def load_snapshot(self):
+        '''
+        Warm the entity cache from the local snapshot, then fetch from database only the entities updated 
+        since the snapshot was saved, and save those back to the snapshot.
+        '''
+        for entity_type in Project.SNAPSHOT_ENTITY_TYPES:
+            for entity_id, entity_data in self._snapshot.load(entity_type):
+                self._objectfy_entity( entity_type     = entity_type,
+                                       entity_id       = entity_id,
+                                       entity_data     = entity_data )
+            
+            self._entity_watermark[entity_type] = self._snapshot.watermark(entity_type)
+            
+            updated_list = self._fetch_updated_entities(entity_type)
+            
+            if updated_list:
+                self._snapshot.save( entity_type, updated_list, self._entity_watermark[entity_type] )
+            
+            if self._entity_cache.policy(entity_type)==None:
+                self._mirrored_types.add(entity_type)
+                self._mirror_refresh_time[entity_type] = time.time()
+                
+                
+    def save_snapshot(self):
+        '''
+        Save the cached entities of the snapshot entity types to the local snapshot.
+        '''
+        assert self._snapshot, "Failed to save snapshot, the project has no snapshot."
+        
+        for entity_type in self._mirrored_types:
+            self._snapshot.save( entity_type, 
+                                 [ (obj.entity_id(), obj.raw_entity_data()) for obj in self._entity_cache.list(entity_type) ],
+                                 self._entity_watermark.get(entity_type) )
+    
+    
+    def sync(self, entity_types=None):
+        '''
+        Fetch only the entities updated since the last sync of each entity type, and patch the cached entity 
+        objects in place. The first sync of an entity type fetch all the entities of the type in the project.
+        @param entity_types [optional] list of entity types to sync, default [ ENT_SHOT, ENT_VERSION ].
+        @return the updated entities.
+        @rtype: [ Entity ]
+        '''
+        if entity_types==None:
+            entity_types = [ ENT_SHOT, ENT_VERSION ]
+            
+        elif isinstance(entity_types, basestring):
+            entity_types = [ entity_types ]
+        
+        result = []
+        
+        for entity_type in entity_types:
+            updated_list = self._fetch_updated_entities(entity_type)
+            
+            if entity_type in self._mirrored_types:
+                self._mirror_refresh_time[entity_type] = time.time()
+                
+                if self._snapshot and updated_list:
+                    self._snapshot.save( entity_type, updated_list, self._entity_watermark[entity_type] )
+            
+            for entity_id, entity_data in updated_list:
+                obj = self._entity_cache.get(entity_type, entity_id)
+                if obj:
+                    result.append(obj)
+                    
+                # the task list of the parent has changed, let it be queried again.
+                if obj and entity_type==ENT_TASK and obj._parent_entity_meta:
+                    self._entity_task_map.pop( (obj._parent_entity_meta['entity_type'], 
+                                                obj._parent_entity_meta['id']), None )
+                
+                # the shot may have moved in the cut, or to another sequence.
+                if entity_type==ENT_SHOT:
+                    self._sequence_cut = {}
+                
+                # the code may have changed, or the entity is new.
+                if entity_type in CODE_INDEX_ENTITY_TYPES:
+                    self._code_index = None
+                
+                # a version was published, the latest versions of the parent are summarized again.
+                if obj and entity_type==ENT_VERSION and obj._parent_meta:
+                    self._latest_engine.invalidate( [ obj._parent_meta ] )
+        
+        return result
+    
+    
+    def _fetch_updated_entities(self, entity_type):
+        '''
+        Fetch the entities updated since the last fetch, and patch them in the cache. 
+        @return list of the updated entities, each is a tuple ( entity_id, entity_data )
+        '''
+        watermark, fetched_list = self._prod_db.list_updated_entities( entity_type, 
+                                                                       self._entity_watermark.get(entity_type) )
+        
+        # the entities of the last second of the watermark are listed again, skip the updates already fetched.
+        seen         = self._watermark_seen.get(entity_type, set())
+        updated_list = [ (entity_id, entity_data) for entity_id, entity_data in fetched_list 
+                                if (entity_id, entity_data.get('updated_at')) not in seen ]
+        
+        for entity_id, entity_data in updated_list:
+            self._patch_entity(entity_type, entity_id, entity_data)
+        
+        self._entity_watermark[entity_type] = watermark
+        self._watermark_seen[entity_type]   = set([ (entity_id, entity_data.get('updated_at')) 
+                                                        for entity_id, entity_data in fetched_list
+                                                        if watermark - entity_data['updated_at'] < timedelta(seconds=1) ])
+        
+        return updated_list
+    
+    
+    def _refresh_mirrored(self, entity_type):
+        '''
+        Fetch the entities of the mirrored entity type updated by the other sessions, once every 
+        config.mirror_refresh_interval seconds, before a list query is answered from cache.
+        @return True if all the entities of the type are cached.
+        '''
+        if entity_type not in self._mirrored_types:
+            return False
+        
+        with self._mirror_lock:
+            if time.time() - self._mirror_refresh_time.get(entity_type, 0) >= mirror_refresh_interval:
+                self.sync( [ entity_type ] )
+        
+        return entity_type in self._mirrored_types
+    
+    
     def _objectfy_entity(self, entity_type, entity_id, entity_data=None):        
         '''
         Does two things:
@@ -152,58 +465,190 @@ class Project(Entity):
         @param entity_class The entity object class, used by prod db to construct object.
         @return the entity object.
         '''
-        ent_map = {   
-                ENT_SEQ:        Sequence,                        
-                ENT_SHOT:       Shot,
-             
-                ENT_ASSET:      Asset,
+        obj = self._entity_cache.get(entity_type, entity_id)
+        
+        if obj==None:
+            obj = self._create_entity(entity_type, entity_id, entity_data)
+                                                                      
+            if obj:                                    
+                # decorate the object with the top project object.
+                obj.set_project(self)
                 
-                ENT_TASK:       Task,
-                ENT_USER:       User,
+                # another thread may have manufactured the same entity meanwhile, keep one object per entity.
+                obj = self._entity_cache.put_if_absent(entity_type, entity_id, obj)
                 
-                ENT_VERSION:    Version,
-                ENT_TASK_TYPE:  TaskType,
+                # queue the partial entity for the next hydrate batch, unless a batch in flight has it.
+                if obj.is_partial():
+                    with self._hydrate_lock:
+                        if (entity_type, entity_id) not in self._hydrating:
+                            self._partial_entity.setdefault(entity_type, collections.OrderedDict())[entity_id] = True
+        
+        # the cached entity is partial, complete it with the full data.
+        elif obj.is_partial() and entity_data:
+            new_obj = self._create_entity(entity_type, entity_id, entity_data)
+            
+            if new_obj and not new_obj.is_partial():
+                obj.refresh(new_obj)
+        
+        return obj
+    
+    
+    def _hydrate_entity(self, obj):
+        '''
+        Fetch the full data of the partial entity and refresh it in place.  The other partial entities of the 
+        same type waiting to be hydrated are fetched in the same query, up to HYDRATE_BATCH_SIZE.  Reading an 
+        entity of a batch in flight waits for that batch rather than querying again.
+        @param obj the partial entity
+        '''
+        entity_type = obj.entity_type()
+        key         = ( entity_type, obj.entity_id() )
+        
+        while obj.is_partial():
+            # take the batch under the lock, the query is sent without holding it.
+            with self._hydrate_lock:
+                if not obj.is_partial():
+                    return
                 
-                }        
+                done = self._hydrating.get(key)
+                
+                if done==None:
+                    pending = self._partial_entity.setdefault(entity_type, collections.OrderedDict())
+                    pending.pop(obj.entity_id(), None)
+                    
+                    id_list = [ obj.entity_id() ]
+                    while pending and len(id_list) < Project.HYDRATE_BATCH_SIZE:
+                        id_list.append( pending.popitem(last=False)[0] )
+                    
+                    done = threading.Event()
+                    for entity_id in id_list:
+                        self._hydrating[ (entity_type, entity_id) ] = done
+                    
+                else:
+                    id_list = None
+            
+            # the entity is in the batch of another thread.
+            if id_list==None:
+                done.wait()
+                continue
+            
+            try:
+                self._hydrate_batch(entity_type, id_list, obj)
+            finally:
+                with self._hydrate_lock:
+                    for entity_id in id_list:
+                        self._hydrating.pop( (entity_type, entity_id), None )
+                done.set()
+            
+            if obj.is_partial():
+                LOG.warning("Failed to fetch the full data of the partial entity %s." % obj)
+                obj._partial = False
+    
+    
+    def _hydrate_batch(self, entity_type, id_list, obj):
+        '''
+        Fetch the full data of the partial entities and refresh them in place.
+        @param obj the partial entity being read, refreshed even if no longer cached.
+        '''
+        for entity_id, entity_data in self._prod_db.list_entities(entity_type, id_list):
+            new_obj = self._create_entity(entity_type, entity_id, entity_data)
+            if not new_obj:
+                continue
+            
+            cached_obj = self._entity_cache.get(entity_type, entity_id)
+            
+            for target in set([ cached_obj, obj if entity_id==obj.entity_id() else None ]):
+                if target!=None and target.is_partial():
+                    target.refresh(new_obj)
+    
+    
+    def _create_entity(self, entity_type, entity_id, entity_data):
+        '''
+        Call on the prod_db plugin to convert the query data into an object, the object is not cached.
+        @return the entity object, None if the data can not be converted.
+        '''
+        ent_map = COMPACT_ENTITY_CLASS if self._compact else ENTITY_CLASS
         
-        if entity_type not in self._entity_cache:
-            self._entity_cache[entity_type] = {}
-
         obj = None
         
-        if entity_id not in self._entity_cache[entity_type]:
-            # Ask prod db to instantiate the object and decorate it with prod_db information
-            try:
-                if not entity_data:
-                    LOG.warning("Failed to create entity with NULL data for entity type '%s' : entity_id '%s'" %   
-                                                                                (entity_type, entity_id))                    
-                else:
-                    obj = self._prod_db.objectfy_entity(  entity_class = ent_map[entity_type], 
-                                                          entity_type  = entity_type,
-                                                          entity_id    = entity_id,
-                                                          entity_data  = entity_data)
-            except ObjectfyEntityError, e:
-                LOG.warning("Failed to create entity from data entity type '%s' : entity_id '%s' with data %s." %  
-                                                                                (entity_type, entity_id, entity_data))
-                
+        # Ask prod db to instantiate the object and decorate it with prod_db information
+        try:
+            if not entity_data:
+                LOG.warning("Failed to create entity with NULL data for entity type '%s' : entity_id '%s'" %   
+                                                                            (entity_type, entity_id))                    
+            else:
+                obj = self._prod_db.objectfy_entity(  entity_class = ent_map[entity_type], 
+                                                      entity_type  = entity_type,
+                                                      entity_id    = entity_id,
+                                                      entity_data  = entity_data)
+        except ObjectfyEntityError, e:
+            LOG.warning("Failed to create entity from data entity type '%s' : entity_id '%s' with data %s." %  
+                                                                            (entity_type, entity_id, entity_data))
+            
+            
+            LOG.warning( traceback.format_exc() )
+            
+        if obj and self._compact:
+            obj._entity_data = self._compact_entity_data(entity_type, obj._entity_data)
+        
+        return obj
+    
+    
+    def _compact_entity_data(self, entity_type, entity_data):
+        '''
+        Keep only the raw data fields in the allowlist of the entity type, config.compact_entity_raw_fields, 
+        and intern the field names and string values, which repeat across entities.
+        @return the compact raw data
+        '''
+        if not entity_data:
+            return entity_data
+        
+        field_list = compact_entity_raw_fields.get(entity_type)
+        
+        def _intern(value):
+            return intern(value) if type(value)==str else value
+        
+        result = {}
+        
+        for field, value in entity_data.iteritems():
+            if field_list!=None and field not in field_list:
+                continue
+            
+            if isinstance(value, dict):
+                value = dict( [ (_intern(k), _intern(v)) for k, v in value.iteritems() ] )
                 
-                LOG.warning( traceback.format_exc() )
-                                                                      
-            if obj:                                    
-                self._entity_cache[entity_type][entity_id] = obj            
-                # decorate the object with the top project object.
-                obj.set_project(self)
-        else:
-            obj = self._entity_cache[entity_type][entity_id]        
+            result[_intern(field)] = _intern(value)
         
+        return result
+    
+    
+    def _patch_entity(self, entity_type, entity_id, entity_data):
+        '''
+        Update the cached entity object in place with the new data, so the existing references to the object 
+        see the update. The entity is cached if it wasn't.
+        @return the entity object.
+        '''
+        obj = self._entity_cache.get(entity_type, entity_id)
+        
+        if obj==None:
+            return self._objectfy_entity(entity_type, entity_id, entity_data)
+        
+        new_obj = self._create_entity(entity_type, entity_id, entity_data)
+        
+        if new_obj:
+            # unindex under the current code before the refresh, then re-cache under the code in case it has changed.
+            self._entity_cache.remove(entity_type, entity_id)
+            obj.refresh(new_obj)
+            self._entity_cache.put(entity_type, entity_id, obj)
+            
         return obj
     
     
     def _find_cached_entity(self, entity_type, entity_code=None, entity_id=None):
         '''
-        Find the cached entity by entity code (slower) or by entity id (faster).
+        Find the cached entity by entity code or by entity id.
         
-        Entities are cached by entity_id and not entity code, since entity code is not required to be unique
+        Entities are cached by entity_id and not entity code, since entity code is not required to be unique.
+        Code lookups go through the secondary code index, which maps the code to all the matching ids.
          
         this will search and return all the objects that matches the entity_code/entity_id.
         
@@ -214,12 +659,13 @@ class Project(Entity):
         '''        
         result = []
         
-        if entity_type in self._entity_cache:
-            if entity_id!=None and entity_id in self._entity_cache[entity_type]:
-                result = [ self._entity_cache[entity_type][entity_id] ]                
-                
-            elif entity_code!=None:            
-                result = [ ent for ent in self._entity_cache[entity_type].values() if ent.entity_code()==entity_code ]
+        if entity_id!=None:
+            obj = self._entity_cache.get(entity_type, entity_id)
+            if obj:
+                result = [ obj ]
+            
+        elif entity_code!=None:            
+            result = self._entity_cache.find_by_code(entity_type, entity_code)
         
         return result
     
@@ -228,7 +674,20 @@ class Project(Entity):
         '''
         Purge the cached entity objects.
         '''
-        self._entity_cache = {}        
+        self._entity_cache.clear()
+        self._entity_watermark = {}
+        self._mirrored_types   = set()
+        self._watermark_seen   = {}
+        self._entity_task_map  = {}
+        self._sequence_cut     = {}
+        self._code_index       = None
+        self._latest_engine.invalidate()
+        
+        with self._task_type_lock:
+            self._task_type_catalogue = {}
+        
+        with self._hydrate_lock:
+            self._partial_entity = {}
     
 
     def list_sequences(self):
@@ -237,13 +696,17 @@ class Project(Entity):
         '''
         seq_list = []
         
-        for seq_id, seq_data in self._prod_db.list_sequences():
-            obj = self._objectfy_entity( entity_type     = ENT_SEQ, 
-                                         entity_id       = seq_id, 
-                                         entity_data     = seq_data                                        
-                                       )  
-            if obj:          
-                seq_list.append(obj)
+        if self._refresh_mirrored(ENT_SEQ):
+            seq_list = self._entity_cache.list(ENT_SEQ)
+        
+        else:
+            for seq_id, seq_data in self._prod_db.list_sequences():
+                obj = self._objectfy_entity( entity_type     = ENT_SEQ, 
+                                             entity_id       = seq_id, 
+                                             entity_data     = seq_data                                        
+                                           )  
+                if obj:          
+                    seq_list.append(obj)
             
         seq_list.sort( lambda x,y: cmp(x.entity_code(), y.entity_code())  )
             
@@ -332,9 +795,12 @@ class Project(Entity):
         return self._prod_db.get_shot_audio(shot_entity)
        
     
-    def list_shots (self, sequence='all'):
+    def list_shots (self, sequence='all', prefetch=None, fields=None):
         '''
         @param sequence [optional - default 'all'] return shots by sequence_code, else by default will return all the shots.
+        @param prefetch [optional] list of related data to batch fetch for all the shots, ex: ['tasks']
+        @param fields [optional] only query these database fields, the fields needed to identify the shots are 
+                      always queried. The other fields are fetched the first time they are read.
         @rtype: [ Shot ]
         '''
         assert sequence!=None, "Failed to list shot, no sequence provided."
@@ -349,21 +815,81 @@ class Project(Entity):
         else:
             seq_obj = sequence  
         
-        for shot_id, shot_data in self._prod_db.list_shots( seq_obj ):
-            obj = self._objectfy_entity( entity_type     = ENT_SHOT, 
-                                         entity_id       = shot_id, 
-                                         entity_data     = shot_data,
-                                          
-                                       )            
-            if obj:
-                shot_list.append(obj)
+        if self._refresh_mirrored(ENT_SHOT):
+            shot_list = [ shot for shot in self._entity_cache.list(ENT_SHOT) 
+                                if seq_obj=='all' or shot._parent_seq_id==seq_obj.entity_id() ]
+        
+        else:
+            for shot_id, shot_data in self._prod_db.list_shots( seq_obj, fields=fields ):
+                obj = self._objectfy_entity( entity_type     = ENT_SHOT, 
+                                             entity_id       = shot_id, 
+                                             entity_data     = shot_data,
+                                              
+                                           )            
+                if obj:
+                    shot_list.append(obj)
             
             
-        shot_list.sort( lambda x,y: cmp(x.entity_code(), y.entity_code())  )
+        shot_list.sort( key=lambda shot: shot.entity_code() )
+        
+        if prefetch and 'tasks' in prefetch:
+            self.prefetch_tasks(shot_list)
             
         return shot_list
          
     
+    def sequence_cut(self, sequence):
+        '''
+        The shots of the sequence in cut order, with the neighbour and the edit frame lookups.
+        The cut is built once from the shots of the sequence, and built again after the shots are synced.
+        @param sequence the sequence object, code or id
+        @rtype: miso.sequence_cut.SequenceCut
+        '''
+        if isinstance(sequence, Entity):
+            seq_id = sequence.entity_id()
+        elif isinstance(sequence, basestring):
+            seq_id = self.sequence(sequence).entity_id()
+        else:
+            seq_id = sequence
+        
+        cut = self._sequence_cut.get(seq_id)
+        
+        if cut==None:
+            cut = SequenceCut( seq_id, self.list_shots( self.sequence(seq_id=seq_id) ) )
+            self._sequence_cut[seq_id] = cut
+        
+        return cut
+    
+    
+    def list_sequence_cuts(self):
+        '''
+        The cuts of all the sequences, the missing ones are built from one query of all the shots.
+        @return dict of sequence id to the sequence cut
+        @rtype: { int: miso.sequence_cut.SequenceCut }
+        '''
+        seq_id_list = [ seq.entity_id() for seq in self.list_sequences() ]
+        
+        if [ seq_id for seq_id in seq_id_list if seq_id not in self._sequence_cut ]:
+            shot_hash = dict( [ (seq_id, []) for seq_id in seq_id_list ] )
+            
+            for shot in self.list_shots('all'):
+                shot_hash.setdefault( shot._parent_seq_id, [] ).append(shot)
+            
+            for seq_id, shot_list in shot_hash.items():
+                if seq_id not in self._sequence_cut:
+                    self._sequence_cut[seq_id] = SequenceCut(seq_id, shot_list)
+        
+        return dict( [ (seq_id, self._sequence_cut[seq_id]) for seq_id in seq_id_list ] )
+    
+    
+    def cut_duration(self):
+        '''
+        @return dict of sequence code to the number of frames of its shots.
+        '''
+        return dict( [ ( self.sequence(seq_id=seq_id).entity_code(), cut.duration() ) 
+                            for seq_id, cut in self.list_sequence_cuts().items() ] )
+    
+    
     def get_entity_from_meta(self, entity_meta):
         '''
         Return the entity, given the meta.  ie: {'entity_type':ENT_SHOT, 'id':5}
@@ -387,6 +913,93 @@ class Project(Entity):
         else:
             LOG.warning("Can not resolve entity from meta: %s" % entity_meta)          
     
+    
+    def get_entities_from_meta(self, entity_meta_list):
+        '''
+        Return the entities, given the metas.  The entities not cached are fetched with one query per entity 
+        type, the entity types at the same time.
+        @param entity_meta_list list of entity meta dictionary ex:[ {'entity_type':ENT_SHOT, 'id':5 },...]
+        @return the entities in order, None for the entities not found.
+        @rtype: [ Entity ]
+        '''
+        found = {}
+        
+        self._call_all( self._entity_fetch_list(entity_meta_list, found) )
+        
+        result = []
+        
+        for entity_meta in entity_meta_list:
+            if entity_meta==None:
+                result.append(None)
+            elif (entity_meta['entity_type'], entity_meta['id']) in found:
+                result.append( found[ (entity_meta['entity_type'], entity_meta['id']) ] )
+            elif entity_meta['entity_type'] in Project.FETCH_ENTITY_TYPES:
+                result.append(None)
+            else:
+                result.append( self.get_entity_from_meta(entity_meta) )
+        
+        return result
+    
+    
+    def _entity_fetch_list(self, entity_meta_list, found):
+        '''
+        @param entity_meta_list list of entity meta dictionary
+        @param found dict of ( entity_type, entity_id ) to entity, filled with the cached entities, and with the 
+                     fetched entities as the functions are called.
+        @return list of functions, each fetching the entities of one entity type which are not cached.
+        '''
+        missing = {}
+        
+        for entity_meta in entity_meta_list:
+            if entity_meta==None or entity_meta['entity_type'] not in Project.FETCH_ENTITY_TYPES:
+                continue
+            
+            key = ( entity_meta['entity_type'], entity_meta['id'] )
+            
+            if key in found or key[1]==None:
+                continue
+            
+            obj = self._entity_cache.get(*key)
+            
+            # all the entities of the type are cached, it is created since the last refresh or doesn't exist.
+            if obj==None and self._refresh_mirrored(key[0]):
+                obj = self._entity_cache.get(*key)
+            
+            if obj!=None:
+                found[key] = obj
+            
+            elif key[0] not in self._mirrored_types:
+                missing.setdefault( key[0], set() ).add( key[1] )
+        
+        def fetch(entity_type, id_list):
+            for i in range(0, len(id_list), Project.HYDRATE_BATCH_SIZE):
+                for entity_id, entity_data in self._prod_db.list_entities( entity_type, 
+                                                                           id_list[i:i+Project.HYDRATE_BATCH_SIZE] ):
+                    obj = self._objectfy_entity( entity_type     = entity_type, 
+                                                 entity_id       = entity_id, 
+                                                 entity_data     = entity_data )
+                    if obj:
+                        found[ (entity_type, entity_id) ] = obj
+        
+        return [ (lambda entity_type=entity_type, id_list=sorted(id_set): fetch(entity_type, id_list))
+                    for entity_type, id_set in sorted(missing.items()) ]
+    
+    
+    def _call_all(self, func_list):
+        '''
+        Call the functions, on the worker threads when there is more than one.
+        @return the results in order.
+        '''
+        if len(func_list) < 2:
+            return [ func() for func in func_list ]
+        
+        with self._fetch_lock:
+            if self._fetch_pool==None:
+                self._fetch_pool = ThreadPool( Project.FETCH_MAX_WORKERS )
+        
+        return self._fetch_pool.map( lambda func: func(), func_list )
+    
+    
     def list_assets(self, asset_type):
         '''
         @param asset_type [ str, list ] one or more of ENT_CHAR, ENT_PROP, ENT_SET, ENT_VEHICLE  
@@ -403,13 +1016,17 @@ class Project(Entity):
         for asset_type in asset_entity_type_list:
             _asset_list = []
             
-            for asset_id, asset_data in self._prod_db.list_assets( asset_type ):
-                obj = self._objectfy_entity( entity_type     = ENT_ASSET, 
-                                             entity_id       = asset_id, 
-                                             entity_data     = asset_data,                                         
-                                           )
-                if obj:   
-                    _asset_list.append(obj)            
+            if self._refresh_mirrored(ENT_ASSET):
+                _asset_list = [ asset for asset in self._entity_cache.list(ENT_ASSET) if asset.asset_type()==asset_type ]
+            
+            else:
+                for asset_id, asset_data in self._prod_db.list_assets( asset_type ):
+                    obj = self._objectfy_entity( entity_type     = ENT_ASSET, 
+                                                 entity_id       = asset_id, 
+                                                 entity_data     = asset_data,                                         
+                                               )
+                    if obj:   
+                        _asset_list.append(obj)            
             
             _asset_list.sort( lambda x,y: cmp(x.entity_code(), y.entity_code())  )
                 
@@ -465,21 +1082,127 @@ class Project(Entity):
         return self.get_user( self.__session_user_code )
     
     
+    def _lookup_key(self, value):
+        '''
+        @param value the entity id, the entity code or the entity meta dictionary.
+        @return the id or the code to look the entity up by.
+        '''
+        if isinstance(value, dict):
+            return value['id']
+        
+        if isinstance(value, Entity):
+            return value.entity_id()
+        
+        return value
+    
+    
+    def _cached_lookup(self, entity_type, key):
+        '''
+        @return the cached entity of the id or code, None if not cached.
+        '''
+        if isinstance(key, basestring):
+            obj_search = self._entity_cache.find_by_code(entity_type, key)
+            return obj_search[0] if obj_search else None
+        
+        return self._entity_cache.get(entity_type, key)
+    
+    
+    def _load_entities(self, entity_type, key_list):
+        '''
+        Fetch the entities by id or code with one query, the batch function of the loaders.
+        @return dict of the id and the code to the entity object.
+        '''
+        id_list   = [ k for k in key_list if not isinstance(k, basestring) ]
+        code_list = [ k for k in key_list if isinstance(k, basestring) ]
+        
+        if entity_type==ENT_TASK:
+            result = self._prod_db.list_entities(ENT_TASK, id_list)
+        elif entity_type==ENT_USER:
+            result = self._prod_db.list_users(id_list, code_list)
+        else:
+            result = self._prod_db.list_statuses(id_list, code_list)
+        
+        obj_hash = {}
+        
+        for entity_id, entity_data in result:
+            obj = self._objectfy_entity( entity_type     = entity_type, 
+                                         entity_id       = entity_id, 
+                                         entity_data     = entity_data )
+            if obj:
+                obj_hash[obj.entity_id()]   = obj
+                obj_hash[obj.entity_code()] = obj
+        
+        return obj_hash
+    
+    
+    def _queue_lookup(self, entity_type, value_list):
+        '''
+        Queue the lookup of the entities not cached, to be fetched with the next lookup of the entity type.
+        @param entity_type one of ENT_TASK, ENT_USER, ENT_STATUS
+        @param value_list the entity ids, codes or meta dictionaries.
+        '''
+        loader = self._loader[entity_type]
+        
+        for value in value_list:
+            key = self._lookup_key(value)
+            
+            if key!=None and self._cached_lookup(entity_type, key)==None:
+                loader.load(key)
+    
+    
+    def _get_entities(self, entity_type, value_list):
+        '''
+        @return the entities of the ids, codes or meta dictionaries, in order, None for the ones not found.
+                The entities not cached are fetched in one query, along with the queued lookups.
+        '''
+        key_list = [ self._lookup_key(value) for value in value_list ]
+        result   = [ self._cached_lookup(entity_type, key) if key!=None else None for key in key_list ]
+        
+        missing  = [ (i, self._loader[entity_type].load(key)) for i, key in enumerate(key_list) 
+                                                                    if key!=None and result[i]==None ]
+        for i, pending in missing:
+            result[i] = pending.get()
+        
+        return result
+    
+    
+    def get_tasks(self, task_id_list):
+        '''
+        @param task_id_list list of task ids
+        @return the task objects in order, None for the ids not found.  The tasks not cached are fetched with 
+                one query.
+        @rtype: [ Task ]
+        '''
+        return self._get_entities(ENT_TASK, task_id_list)
+    
+    
+    def get_users(self, user_list):
+        '''
+        @param user_list list of the user ids, login names or user meta dictionaries.
+        @return the user objects in order, None for the users not found.  The users not cached are fetched 
+                with one query.
+        @rtype: [ User ]
+        '''
+        return self._get_entities(ENT_USER, user_list)
+    
+    
+    def get_statuses(self, status_list):
+        '''
+        @param status_list list of the status ids or status codes.
+        @return the status objects in order, None for the statuses not found.  The statuses not cached are 
+                fetched with one query.
+        @rtype: [ Status ]
+        '''
+        return self._get_entities(ENT_STATUS, status_list)
+    
+    
     def get_user(self, user):
         '''
-        @type status: string 
-        @param user either the user code or the user id
-        @return the status object, given the id
+        @param user either the user code, the user id, or the user meta dictionary
+        @return the user object
+        @rtype: User
         '''
-         
-        user_data = self._prod_db.get_user(user)
- 
-        user_obj  = self._objectfy_entity(       entity_type     = ENT_USER, 
-                                                 entity_id       = user_data['id'], 
-                                                 entity_data     = user_data                                                     
-                                            )   
-     
-        return user_obj
+        return self.get_users( [ user ] )[0]
         
     
     def get_task(self, task_id):
@@ -487,34 +1210,92 @@ class Project(Entity):
         @param task_id
         @return the task object, given the id
         '''
-        # attempt to find in cache entity object
-        task_obj_search = self._find_cached_entity( ENT_TASK, entity_id = task_id )              
-        
-        if task_obj_search:
-            task_obj = task_obj_search[0]
-         
-        # not cached, manufacture one.    
-        else:  
-            _task_id, task_data = self._prod_db.get_task(task_id)
-                   
-            task_obj  =  self._objectfy_entity(          entity_type     = ENT_TASK, 
-                                                         entity_id       = task_id, 
-                                                         entity_data     = task_data,                                                         
-                                                        )            
-
-        return task_obj
+        return self.get_tasks( [ task_id ] )[0]
+    
+    
+    def get_status(self, status):
+        '''
+        @param status either the status code or the status id
+        @return the status object
+        @rtype: Status
+        '''
+        return self.get_statuses( [ status ] )[0]
     
     
     def get_task_type(self, task_type_id):
         '''
-        return a list of task types
+        @param task_type_id the task type code, or the task.
+        @return the task type, None if not found.
+        @rtype: TaskType
         '''
-        task_type_obj  =  self._objectfy_entity(         entity_type     = ENT_TASK_TYPE, 
-                                                         entity_id       = task_type_id, 
-                                                         entity_data     = self._prod_db.get_task_type(task_type_id),                                                         
-                                                        )         
+        entity_type_list = TASK_TYPE_ENTITY_TYPES
+        
+        if isinstance(task_type_id, Task):
+            parent_meta = task_type_id._parent_entity_meta
+            
+            if parent_meta and parent_meta['entity_type'] in TASK_TYPE_ENTITY_TYPES:
+                entity_type_list = [ parent_meta['entity_type'] ]
+            
+            task_type_id = task_type_id.entity_code()
         
-        return task_type_obj
+        for entity_type in entity_type_list:
+            obj = self._task_types(entity_type).get(task_type_id)
+            
+            if obj:
+                return obj
+        
+        return None
+    
+    
+    def _task_types(self, entity_type):
+        '''
+        The task types of the entity type, from the local snapshot if saved less than config.task_type_ttl ago, 
+        from database otherwise.  Queried again once older than task_type_ttl.
+        @return OrderedDict( task type code -> TaskType ), by code.
+        '''
+        with self._task_type_lock:
+            built_time, catalogue = self._task_type_catalogue.get( entity_type, (None, None) )
+            
+            if catalogue!=None and time.time() - built_time <= task_type_ttl:
+                return catalogue
+            
+            snapshot_key = '%s.%s' % (ENT_TASK_TYPE, entity_type)
+            row_list     = None
+            
+            if catalogue==None and self._snapshot:
+                built_time = self._snapshot.watermark(snapshot_key)
+                
+                if built_time!=None and time.time() - built_time <= task_type_ttl:
+                    row_list = self._snapshot.load(snapshot_key)
+            
+            if row_list==None:
+                row_list    = self._prod_db.list_task_types( entity_type, max_age=task_type_ttl )
+                built_time  = time.time()
+                
+                if self._snapshot:
+                    self._snapshot.clear(snapshot_key)
+                    self._snapshot.save(snapshot_key, row_list, built_time)
+            
+            new_catalogue = collections.OrderedDict()
+            
+            for tt_id, tt_data in sorted( row_list ):
+                obj = self._create_entity(ENT_TASK_TYPE, tt_id, tt_data)
+                
+                if obj==None:
+                    continue
+                
+                # keep the task type objects already handed out up to date.
+                if catalogue and obj.entity_code() in catalogue:
+                    catalogue[obj.entity_code()].refresh(obj)
+                    obj = catalogue[obj.entity_code()]
+                else:
+                    obj.set_project(self)
+                
+                new_catalogue[obj.entity_code()] = obj
+            
+            self._task_type_catalogue[entity_type] = ( built_time, new_catalogue )
+            
+            return new_catalogue
     
     
     def get_source_path(self, version):
@@ -526,19 +1307,13 @@ class Project(Entity):
     
     def list_task_types(self, entity_type=None):
         '''
-        @return the list of task types
+        @param entity_type ENT_SHOT or ENT_ASSET
+        @return the list of task types, by code.  The task types are queried once, see _task_types.
+        @rtype: [ TaskType ]
         '''
-        assert entity_type in (ENT_SHOT, ENT_ASSET)
-        result = []
-                
-        for tt_id, tt_data in self._prod_db.list_task_types(entity_type):
-            obj = self._objectfy_entity(    entity_type     = ENT_TASK_TYPE, 
-                                            entity_id       = tt_id, 
-                                            entity_data     = tt_data                                            
-                                           )
-            result.append(obj)
+        assert entity_type in TASK_TYPE_ENTITY_TYPES
         
-        return result
+        return self._task_types(entity_type).values()
     
     
     def list_submission_types(self):
@@ -567,11 +1342,21 @@ class Project(Entity):
     def list_tasks( self, entity_type=None, entity_id=None, task_id=None ):
         '''
         Retrieve the tasks for an entity, or tasks that match the task_id(s)
+        The tasks of an entity are memoised, see prefetch_tasks.
         @param entity_type
         @param entity_id
         @param task_id can be a list
         @return  a list of task, or a hash of task group by department.        
         '''
+        parent_key = (entity_type, entity_id)
+        
+        if entity_type and entity_id!=None:
+            if parent_key not in self._entity_task_map:
+                self.prefetch_tasks( [ {'entity_type':entity_type, 'id':entity_id} ] )
+                
+            task_list = [ self.get_task(t_id) for t_id in self._entity_task_map[parent_key] ]
+            
+            return [ t for t in task_list if t ]
                     
         task_list = []      
         
@@ -586,6 +1371,40 @@ class Project(Entity):
         return task_list    
     
     
+    def prefetch_tasks(self, entities):
+        '''
+        Batch fetch the tasks of many parent entities, with one query per HYDRATE_BATCH_SIZE parents, and memoise 
+        the tasks per parent. Later shot.list_tasks() and shot.task() are answered without querying the database.
+        @param entities list of entities, or list of entity meta dictionary ex:[ {'entity_type':ENT_SHOT, 'id':5 },...]
+        '''
+        entity_meta_list = []
+        
+        for e in entities:
+            if not isinstance(e, dict):
+                e = {'entity_type':e.entity_type(), 'id':e.entity_id()}
+            
+            if (e['entity_type'], e['id']) not in self._entity_task_map:
+                entity_meta_list.append(e)
+        
+        if not entity_meta_list:
+            return
+        
+        task_map = dict( [ ((e['entity_type'], e['id']), []) for e in entity_meta_list ] )
+        
+        for i in range(0, len(entity_meta_list), Project.HYDRATE_BATCH_SIZE):
+            for task_id, task_data in self._prod_db.list_tasks( 
+                                            entity_meta_list = entity_meta_list[i:i+Project.HYDRATE_BATCH_SIZE] ):
+                obj = self._objectfy_entity(    entity_type     = ENT_TASK, 
+                                                entity_id       = task_id, 
+                                                entity_data     = task_data                                        
+                                               )
+                if obj and obj._parent_entity_meta:
+                    parent_key = (obj._parent_entity_meta['entity_type'], obj._parent_entity_meta['id'])
+                    task_map.setdefault(parent_key, []).append(task_id)
+        
+        self._entity_task_map.update(task_map)
+    
+    
     def list_clips(self,        entity_meta_list   = None,                       
                                 task_type_code     = None,
                                  
@@ -597,7 +1416,7 @@ class Project(Entity):
                                 for_review_only    = False,
                                 
                                 query_entity_limit = 111,
-                                query_version_limit = 1000 ):
+                                query_version_limit = None ):
         
         version_type = ['playblast','nuke_render','turntable','occlusion']
         self.list_versions(entity_meta_list, task_type_code, artist, start_time, end_time, version_type, latest_only, for_review_only, query_entity_limit, query_version_limit)
@@ -619,7 +1438,11 @@ class Project(Entity):
                                 for_review_only    = False,
                                 
                                 query_entity_limit = 111,
-                                query_version_limit = 1000 ):
+                                query_version_limit = None,
+                                
+                                lazy               = False,
+                                fields             = None,
+                                include            = None ):
         '''
         List all the versions attached to the entity.
         @param entity_list list of entities for which to query versions
@@ -630,12 +1453,22 @@ class Project(Entity):
         @param latest_only [optional] only return the latest version
         @param for_review_only [optional] only return the version marked for review.
         @param query_entity_limit [optional, default=111] The limit on the entity query
+        @param query_version_limit [optional] maximum number of versions, default all the matching versions.
+        @param lazy [optional] resolve the task and parent of the versions only when the result is first read.
+        @param fields [optional] only query these database fields, ex: ['sg_status_list'].  The fields needed to 
+                      identify the versions, their task and parent are always queried. The other fields are fetched
+                      the first time they are read, for all the partial versions at once.
+        @param include [optional] the related entities fetched up front, any of Project.VERSION_INCLUDES, 
+                       ex: ['task', 'parent', 'artist'].  See prefetch_versions.
     
         @return all the version that matches the criteria
         @rtype: VersionResult   
         '''
         ver_list = []
         
+        assert not set(include or []).difference(Project.VERSION_INCLUDES), \
+                "Can not include %s, only %s." % (include, Project.VERSION_INCLUDES)
+        
         list_ver_func = self._prod_db.list_versions_latest if latest_only else self._prod_db.list_versions
         
         if type(entity_list) in (list, tuple):
@@ -654,7 +1487,17 @@ class Project(Entity):
             
         elif type(start_time) in (str, unicode):
             end_time = int( round( float(end_time) )  )
+        
+        # the latest versions of the given entities are kept by the engine, see latest_version_engine.
+        if latest_only and entity_meta_list:
+            ver_list = self._latest_engine.latest_versions( entity_meta_list, 
+                                                            task_type_code = task_type_code, 
+                                                            fields         = fields )[:query_version_limit]
             
+            if include:
+                self.prefetch_versions(ver_list, include)
+            
+            return VersionResult(self, ver_list, lazy=lazy)
 
         for version_id, version_data in list_ver_func( entity_meta_list   = entity_meta_list, 
                                                        task_type_code     = task_type_code,
@@ -666,16 +1509,49 @@ class Project(Entity):
                                                        version_type       = version_type,                                                                                                              
 
                                                        ent_limit          = query_entity_limit,
-                                                       ver_limit          = query_version_limit ):
+                                                       ver_limit          = query_version_limit,
+                                                       fields             = fields ):
+            
+            obj = self._objectfy_entity(    entity_type     = ENT_VERSION, 
+                                            entity_id       = version_id, 
+                                            entity_data     = version_data                                            
+                                           )
+            if obj:
+                ver_list.append(obj)
+        
+        if include:
+            self.prefetch_versions(ver_list, include)
+        
+        return VersionResult(self, ver_list, lazy=lazy)
+    
+    
+    def prefetch_versions(self, ver_list, include=None):
+        '''
+        Cache the related entities of the versions, so reading them later makes no query.  Each relation is 
+        fetched with one query, or one per entity type for the parents, the relations at the same time.
+        @param ver_list the versions
+        @param include [optional] any of Project.VERSION_INCLUDES, default all.
+        '''
+        if include==None:
+            include = Project.VERSION_INCLUDES
+        
+        fetch_list = []
+        
+        if 'parent' in include:
+            fetch_list.extend( self._entity_fetch_list( [ ver._parent_meta for ver in ver_list ], {} ) )
+        
+        for name, entity_type, value_list in [ 
+                    ('task',    ENT_TASK,   [ ver._task_meta for ver in ver_list ]),
+                    ('artist',  ENT_USER,   [ ver._artist for ver in ver_list if ver._artist is not NOT_FETCHED ]),
+                    ('status',  ENT_STATUS, [ ver._status for ver in ver_list if ver._status is not NOT_FETCHED ]) ]:
             
-            obj = self._objectfy_entity(    entity_type     = ENT_VERSION, 
-                                            entity_id       = version_id, 
-                                            entity_data     = version_data                                            
-                                           )
-            if obj:
-                ver_list.append(obj)
+            value_list = [ value for value in value_list if value ]
+            
+            if name in include and value_list:
+                fetch_list.append( lambda entity_type=entity_type, value_list=value_list: 
+                                            self._get_entities(entity_type, value_list) )
         
-        return VersionResult(self, ver_list)  
+        self._call_all(fetch_list)
     
     
     def list_clips_from_versions(self, version_list ):
@@ -701,16 +1577,19 @@ class Project(Entity):
         return ClipResult(clip_list)
     
 
-    def create_version(self, task, source_path, comment, artist=None, date=None):        
+    def queue_create_version(self, task, source_path, comment, artist=None, date=None):
         '''
+        Queue the new version of the task, it is created with the next batch of writes.  The version is 
+        numbered after the latest version of the task in database, and the versions of the same task queued 
+        meanwhile are numbered one after the other.
         @param task
         @type task: Task
         @param source_path
         @param comment
-        @param artist
-        @param date
-        @return Version
-        @rtype: Version
+        @param artist [optional] the user code, default the login user.
+        @param date [optional] seconds since epoch, default now.
+        @return the pending new version, also cached once created.
+        @rtype: miso.write_queue._PendingWrite
         '''
         if date==None:
             date    = time.time() 
@@ -718,31 +1597,66 @@ class Project(Entity):
         if artist==None:
             artist  = getpass.getuser()
         
+        user = self.get_user(artist)
         
-        pre_ver = task.latest_version()
-            
-        success = self._prod_db.create_version(task, source_path, comment, artist, date )        
+        assert user, "Failed to create version, unknown artist '%s'." % artist
         
-        assert success, "Failed to create version." 
+        task_id = task.entity_id()
         
-        new_ver = task.latest_version()        
+        # not from the kept latest versions, another session may have published since.
+        pre_num = self._prod_db.latest_version_number(task_id)
         
+        with self._write_lock:
+            ver_num = max( pre_num, self._queued_version_num.get(task_id, 0) ) + 1
+            self._queued_version_num[task_id] = ver_num
         
-        if pre_ver==None:
-            expected_next_num = 1
-        else:
-            expected_next_num = pre_ver.number() + 1
+        request = self._prod_db.version_request( task, ver_num, source_path, comment, user.entity_id(), date )
+        
+        def on_success(ver_data):
+            new_ver = self._patch_entity(ENT_VERSION, ver_data['id'], ver_data)
             
-        assert new_ver.number()==expected_next_num, \
-                "Error: expected new version to be %s, got %s." %(
-                                                                  expected_next_num,                                                                                                      
-                                                                  new_ver.number()
-                                                                  )
+            # the new version is the latest of its task.
+            self._latest_engine.invalidate( [ task._parent_entity_meta ] )
+            
+            return new_ver
+        
+        def on_failure(error):
+            # free the number, unless another version of the task was queued meanwhile.
+            with self._write_lock:
+                if self._queued_version_num.get(task_id)==ver_num:
+                    self._queued_version_num[task_id] = ver_num - 1
+        
+        return self._write_queue.submit( request, on_success, on_failure )
+    
+    
+    def create_version(self, task, source_path, comment, artist=None, date=None):        
+        '''
+        @param task
+        @type task: Task
+        @param source_path
+        @param comment
+        @param artist
+        @param date
+        @return Version
+        @rtype: Version
+        '''
+        pending = self.queue_create_version(task, source_path, comment, artist=artist, date=date)
+        
+        self._write_queue.flush()
+        
+        new_ver = pending.get()
+        
+        # another session may have created a version of the same number meanwhile.
+        ver_id_list = self._prod_db.version_ids( task.entity_id(), new_ver.number() )
+        
+        if ver_id_list!=[ new_ver.entity_id() ]:
+            raise WriteError, "Error: version %s of task %s created more than once, ids %s." % (
+                                                                new_ver.number(), task.entity_id(), ver_id_list )
         
         return new_ver
     
     
-    def create_frame_submission(self,
+    def queue_create_frame_submission(self,
                                                                 
                                 version_entity,
                                  
@@ -758,6 +1672,7 @@ class Project(Entity):
                                 file_type   = None,                                 
                                 ):
         '''
+        Queue the new frame submission of the version, it is created with the next batch of writes.
         @param version_entity
         @param source_path
         @param preview_path
@@ -766,6 +1681,8 @@ class Project(Entity):
         @param tags
         @param submit_type one of ['playblast','occlusion_playblast','render']
         @param file_type one of ['movie','sequence','image']      
+        @return the pending id of the new frame submission.
+        @rtype: miso.write_queue._PendingWrite
         '''
         
         if submit_type==None:
@@ -777,7 +1694,7 @@ class Project(Entity):
                                                                 file_type
                                                                 )
             
-        success, fsubmit_id = self._prod_db.create_frame_submission(
+        request = self._prod_db.frame_submission_request(
                                                 version_entity, 
                                                 source_path, 
                                                 preview_path,
@@ -791,7 +1708,52 @@ class Project(Entity):
                                                 file_type       = file_type                                         
                                               )
         
-        assert success, "Failed to create version." 
+        return self._write_queue.submit( request, lambda fsubmit_data: fsubmit_data['id'] )
+    
+    
+    def create_frame_submission(self,
+                                                                
+                                version_entity,
+                                 
+                                source_path, 
+                                preview_path,
+                                
+                                start_frame = None, 
+                                end_frame   = None,
+                                
+                                tags        = [],
+                                
+                                submit_type = None, 
+                                file_type   = None,                                 
+                                ):
+        '''
+        @param version_entity
+        @param source_path
+        @param preview_path
+        @param start_frame
+        @param end_frame
+        @param tags
+        @param submit_type one of ['playblast','occlusion_playblast','render']
+        @param file_type one of ['movie','sequence','image']      
+        '''
+        if submit_type==None:
+            submit_type = "playblast"
+        
+        pending = self.queue_create_frame_submission( version_entity, 
+                                                      source_path, 
+                                                      preview_path,
+                                                      
+                                                      start_frame     = start_frame, 
+                                                      end_frame       = end_frame,
+                                                      
+                                                      tags            = tags,
+                                                      
+                                                      submit_type     = submit_type, 
+                                                      file_type       = file_type )
+        
+        self._write_queue.flush()
+        
+        fsubmit_id = pending.get()
         
         # get the new clip
         result = self.list_clips_from_versions( [version_entity] )
@@ -808,6 +1770,35 @@ class Project(Entity):
             return match_clip
         
     
+    def queue_set_task_status(self, task, status, tech=False):
+        '''
+        Queue the task status change, it is written with the next batch of writes.  The cached task has the new 
+        status straight away, and is set back if the write fails.
+        @param task task object
+        @param status either the status id, the status code or the status object.
+        @param tech is technical status or not, default: normal status.
+        @return the pending task
+        @rtype: miso.write_queue._PendingWrite
+        '''
+        status = self.get_status(status)
+        
+        assert status, "Failed to set the task status, unknown status."
+        
+        attr     = '_task_tech_status_id' if tech else '_task_status_id'
+        previous = getattr(task, attr, None)
+        
+        setattr(task, attr, status.entity_id())
+        
+        def on_failure(error):
+            # unless the status was set again meanwhile.
+            if getattr(task, attr, None)==status.entity_id():
+                setattr(task, attr, previous)
+        
+        return self._write_queue.submit( self._prod_db.task_status_request( task.entity_id(), status.entity_code(), tech ),
+                                         lambda task_data: task, 
+                                         on_failure )
+    
+    
     def set_task_status(self, task, status, tech=False):
         '''
         Set the task status to status
@@ -816,53 +1807,113 @@ class Project(Entity):
         @param tech is technical status or not, default: normal status.
         '''
         try:
-            self._prod_db.set_task_status( task_id    = task.entity_id(),                                       
-                                           status_id  = status.entity_id(),
-                                           
-                                           user_id    = self.get_session_user().entity_id(),
-                                                                                  
-                                           tech       = tech
-                                          )
+            pending = self.queue_set_task_status( task, status, tech=tech )
+            
+            self._write_queue.flush()
+            
+            pending.get()
         except:
             LOG.critical("Error setting status.")
         
 
-    def batch_list_entities(self, entity_code_list=None, entity_id_list=None, search_query=None ):
+    def code_index(self):
+        '''
+        The sorted index of the shot and asset codes, built from one light query per entity type, or from
+        the cache if all the shots and assets are cached.  Built again after the shots or assets are synced, 
+        and every config.mirror_refresh_interval seconds for the shots and assets created by the other sessions.
+        @rtype: miso.code_index.CodeIndex
+        '''
+        built_time, index = self._code_index or ( None, None )
+        
+        if index==None or time.time() - built_time >= mirror_refresh_interval:
+            built_time = time.time()
+            entry_list = []
+            
+            for entity_type in CODE_INDEX_ENTITY_TYPES:
+                if self._refresh_mirrored(entity_type):
+                    entry_list.extend( [ (entity_type, obj.entity_id(), obj.entity_code()) 
+                                            for obj in self._entity_cache.list(entity_type) ] )
+                else:
+                    entry_list.extend( [ (entity_type, entity_id, entity_code) for entity_id, entity_code in 
+                                            self._prod_db.list_entity_codes(entity_type) ] )
+            
+            index = CodeIndex(entry_list)
+            self._code_index = ( built_time, index )
+            
+        return index
+    
+    
+    def batch_list_entities(self, entity_code_list=None, entity_id_list=None, search_query=None, entity_type=None ):
         '''
-        batch get the entities
+        batch get the shots and assets.  The codes are looked up in the local code index, and only the matching
+        entities not cached are fetched, with one query per entity type.
         @param entity_code can be list
         @param entity_id can be list
         @param search_query query regular expression ex: 'sc0120', 'bike', '^bike[0-9]'        
+        @param entity_type [optional] only the entities of the type, ENT_SHOT or ENT_ASSET.  Required with 
+                           entity_id_list when an id is both a shot and an asset id, the ids are per type.
+        @return the entities in the order of the given codes or ids, else ordered by code.
         '''
-        asset_list = []
-        
         if search_query:
             assert  entity_code_list==None and entity_id_list==None, \
                         "To use search_query, do not supply parameter for entity_code_list nor entity_id_list."
         
-        for entity_type, entity_id, entity_data in self._prod_db.batch_list_entities(entity_code  = entity_code_list, 
-                                                                                    entity_id    = entity_id_list, 
-                                                                                    search_query = search_query):
-            obj = self._objectfy_entity( entity_type     = entity_type, 
-                                         entity_id       = entity_id, 
-                                         entity_data     = entity_data                                         
-                                       )
-            if obj:   
-                asset_list.append(obj)        
+        assert entity_type in [ None ] + CODE_INDEX_ENTITY_TYPES, \
+                    "Can not batch list entities of type '%s', only %s." % (entity_type, CODE_INDEX_ENTITY_TYPES)
         
-        if entity_code_list:
-            asset_list.sort( lambda x,y: cmp(  entity_code_list.index( x.entity_code() ), entity_code_list.index(y.entity_code())  )  )
-            
-        elif entity_id_list:
-            asset_list.sort( lambda x,y: cmp(  entity_id_list.index( x.entity_id() ), entity_id_list.index(y.entity_id())  )  )
+        if isinstance(entity_code_list, basestring):
+            entity_code_list = [ entity_code_list ]
+        
+        if entity_id_list!=None and type(entity_id_list) not in (list, tuple):
+            entity_id_list = [ entity_id_list ]
+        
+        index = self.code_index()
         
+        if search_query:
+            entry_list = index.search(search_query)
+        elif entity_code_list!=None:
+            entry_list = index.find_codes(entity_code_list)
+        elif entity_id_list!=None:
+            entry_list = index.find_ids(entity_id_list, entity_type)
+            
+            if entity_type==None:
+                ambiguous = sorted([ entity_id for entity_id in set(entity_id_list) 
+                                                if len(index.find_ids([ entity_id ])) > 1 ])
+                
+                assert not ambiguous, "The ids %s are of more than one entity type, give the entity_type." % ambiguous
         else:
-            asset_list.sort( lambda x,y: cmp( x.entity_code(), y.entity_code() )  )
+            entry_list = index.prefix('')
+        
+        if entity_type!=None:
+            entry_list = [ e for e in entry_list if e[0]==entity_type ]
+        
+        obj_hash     = {}
+        missing_hash = {}
+        
+        for ent_type, entity_id, entity_code in entry_list:
+            obj = self._entity_cache.get(ent_type, entity_id)
             
-        return asset_list
+            if obj!=None:
+                obj_hash[ (ent_type, entity_id) ] = obj
+            else:
+                missing_hash.setdefault( ent_type, [] ).append(entity_id)
+        
+        # fetch the entities not cached, one query per entity type
+        for ent_type, id_list in missing_hash.items():
+            for entity_id, entity_data in self._prod_db.list_entities(ent_type, id_list):
+                obj = self._objectfy_entity( entity_type     = ent_type, 
+                                             entity_id       = entity_id, 
+                                             entity_data     = entity_data )
+                if obj:
+                    obj_hash[ (ent_type, entity_id) ] = obj
+        
+        # the index entries are already in the order of the codes, ids, or by code.
+        return [ obj_hash[ (e[0], e[1]) ] for e in entry_list if (e[0], e[1]) in obj_hash ]
         
         
 class Sequence(Entity):    
+    __slots__ = ()
+    
     def __init__(self, entity_id, entity_code, entity_data):
         Entity.__init__(self, 
                         entity_id   = entity_id, 
@@ -872,8 +1923,12 @@ class Sequence(Entity):
                         )
     
 
-    def list_shots(self):
-        return self.project().list_shots( self )
+    def list_shots(self, prefetch=None):
+        '''
+        @param prefetch [optional] list of related data to batch fetch for all the shots, ex: ['tasks']
+        @rtype: [ Shot ]
+        '''
+        return self.project().list_shots( self, prefetch=prefetch )
         
         
     def shot(self, shot_code=None, shot_id=None):
@@ -881,9 +1936,45 @@ class Sequence(Entity):
         @rtype: Shot
         '''
         return self.project().shot(shot_code, shot_id, self.entity_id())
+    
+    
+    def cut(self):
+        '''
+        @return the shots in cut order
+        @rtype: miso.sequence_cut.SequenceCut
+        '''
+        return self.project().sequence_cut(self)
+    
+    
+    def shot_at_frame(self, frame):
+        '''
+        @param frame the edit frame
+        @return the shot at the edit frame, None if there is none.
+        @rtype: Shot
+        '''
+        return self.cut().shot_at_frame(frame)
+    
+    
+    def shots_in_range(self, start_frame, end_frame):
+        '''
+        @param start_frame
+        @param end_frame included
+        @return the shots overlapping the edit frames, ordered by edit in.
+        @rtype: [ Shot ]
+        '''
+        return self.cut().shots_in_range(start_frame, end_frame)
+    
+    
+    def cut_duration(self):
+        '''
+        @return the number of frames of the shots of the sequence.
+        '''
+        return self.cut().duration()
 
     
 class Shot(Entity):    
+    __slots__ = ('_edit_in', '_edit_out', '_seq_order', '_parent_seq_id')
+    
     def __init__(self, entity_id, entity_code, entity_data, edit_in=None, edit_out=None, 
                  seq_order=None, parent_seq_id=None):
         Entity.__init__(self, 
@@ -908,8 +1999,20 @@ class Shot(Entity):
         '''
         @return the edit in and out tuple
         '''
+        if self._edit_in is NOT_FETCHED or self._edit_out is NOT_FETCHED:
+            self._hydrate()
+            
         return self._edit_in, self._edit_out
-
+    
+    
+    def cut_order(self):
+        '''
+        @return the position of the shot in the sequence edit, as set in the database.
+        '''
+        if self._seq_order is NOT_FETCHED:
+            self._hydrate()
+            
+        return self._seq_order
     
     
     def list_tasks(self):
@@ -935,19 +2038,18 @@ class Shot(Entity):
     
     def prev_shot(self):
         '''
-        @return the previous shot
+        @return the previous shot in the sequence cut
         @rtype: Shot
         '''
-        
-        return self.project().shot( shot_id = self._prev_shot_id ) if self._prev_shot_id else None
+        return self.project().sequence_cut( self._parent_seq_id ).prev_shot(self)
     
     
     def next_shot(self):
         '''
-        @return the previous shot
+        @return the next shot in the sequence cut
         @rtype: Shot
         '''
-        return self.project().shot( shot_id = self._next_shot_id ) if self._next_shot_id else None
+        return self.project().sequence_cut( self._parent_seq_id ).next_shot(self)
     
     
     def task(self, task_code):
@@ -992,6 +2094,8 @@ class Asset(Entity):
     '''
     Stores the character, prop, set. 
     '''    
+    __slots__ = ('_asset_type',)
+    
     def __init__(self, entity_id, entity_code, entity_data, asset_type, asset_label=None):
         Entity.__init__(self, 
                         entity_id   = entity_id, 
@@ -1026,6 +2130,9 @@ class Asset(Entity):
 
         
 class Task(Entity):    
+    __slots__ = ('_department', '_parent_entity_meta', '_artist_meta', '_artist', 
+                 '_task_status_id', '_task_tech_status_id', '_task_label')
+    
     def __init__(self, entity_id, entity_code, entity_data, parent_entity_meta, department_meta,
                        artist_meta  ):
         
@@ -1046,6 +2153,9 @@ class Task(Entity):
         '''
         @param as_obj return user as an object.
         '''
+        if self._artist is NOT_FETCHED:
+            self._hydrate()
+            
         if as_string:
             return self._artist
         else:
@@ -1059,10 +2169,7 @@ class Task(Entity):
         '''        
         @param value can be the status id or status code
         '''        
-        status = self.project().get_status(value)
-        self._task_status_id = status.entity_id()
-        
-        self.project().set_task_status( self, status )
+        self.project().set_task_status( self, value )
     
     
     def task_type(self):
@@ -1073,10 +2180,7 @@ class Task(Entity):
         '''        
         @param value can be the status id or status code
         '''        
-        status = self.project().get_status(value)
-        self._task_tech_status_id = status.entity_id()
-        
-        self.project().set_task_status( self, status, tech=True )
+        self.project().set_task_status( self, value, tech=True )
         
         
     def label(self):
@@ -1135,6 +2239,8 @@ class Task(Entity):
     
 
 class TaskType(Entity):
+    __slots__ = ('_label', '_department', '_colour')
+    
     def __init__(self, entity_id, entity_code, entity_data, label, colour, department):
         Entity.__init__(self, 
                     entity_id   = entity_id, 
@@ -1160,8 +2266,96 @@ class TaskType(Entity):
         return self._department
     
 
+class Status(Entity):
+    __slots__ = ('_label', '_colour')
+    
+    def __init__(self, entity_id, entity_code, entity_data, label, colour):
+        Entity.__init__(self, 
+                    entity_id   = entity_id, 
+                    entity_code = entity_code,
+                    entity_data = entity_data,
+                    entity_type = ENT_STATUS                                      
+                    )
+        
+        self._label      = label
+        self._colour     = colour
+    
+    def label(self):
+        return self._label
+    
+    def colour(self):
+        return self._colour
+    
+
 
-class ClipResult(collections.Iterator):
+class IndexedResult(object):
+    '''
+    Hash index on the columns of the result rows, built once per column on first use. 
+    Filters are answered by intersecting the index buckets, rather than scanning the rows.
+    The result class provides the rows via _rows().
+    '''
+    
+    def _rows(self):
+        raise NotImplementedError
+    
+    
+    def _index_key(self, value):
+        # rows can hold entity meta dictionary, ex: artist
+        if isinstance(value, dict):
+            return tuple(sorted(value.items()))
+        
+        return value
+    
+    
+    def _column_index(self, column):
+        '''
+        @return the index of the column, dict of value -> [ row position ]
+        '''
+        if not hasattr(self, '_index_cache'):
+            self._index_cache = {}
+            
+        if column not in self._index_cache:
+            index = {}
+            for pos, row in enumerate(self._rows()):
+                index.setdefault(self._index_key(row[column]), []).append(pos)
+                
+            self._index_cache[column] = index
+        
+        return self._index_cache[column]
+    
+    
+    def _list_column(self, column):
+        '''
+        @return the distinct values of the column.
+        '''
+        rows = self._rows()
+        
+        return [ rows[pos_list[0]][column] for pos_list in self._column_index(column).values() ]
+    
+    
+    def _filter_rows(self, criteria):
+        '''
+        @param criteria list of (column, value) that the rows must match
+        @return the matching rows, in the result order.
+        '''
+        rows = self._rows()
+        
+        if not criteria:
+            return list(rows)
+        
+        bucket_list = [ self._column_index(column).get(self._index_key(value), []) for column, value in criteria ]
+        bucket_list.sort(key=len)
+        
+        pos_set = set(bucket_list[0])
+        for bucket in bucket_list[1:]:
+            if not pos_set:
+                break
+            pos_set.intersection_update(bucket)
+        
+        return [ rows[pos] for pos in sorted(pos_set) ]
+    
+    
+class ClipResult(IndexedResult, collections.Iterator):
     def __init__(self, result):
         
         self._clip_list = []
@@ -1196,20 +2390,23 @@ class ClipResult(collections.Iterator):
             return self._clip_list[self._index]['clip']
                     
     
+    def _rows(self):
+        return self._clip_list
+    
     def list_assets(self):
         return self.list_entities()
     
     def list_entities(self):
-        return list(set( [ c['entity_code'] for c in self._clip_list ] ))
+        return self._list_column('entity_code')
     
     def list_tasks(self):
-        return list(set( [ c['task_code'] for c in self._clip_list ] ))
+        return self._list_column('task_code')
     
     def list_versions(self):
-        return list(set( [ c['ver_number'] for c in self._clip_list ] ))
+        return self._list_column('ver_number')
 
     def list_submit_types(self):
-        return list(set( [ c['submit_type'] for c in self._clip_list ] ))
+        return self._list_column('submit_type')
 
             
     def filter(self, entity_code=None, task_code=None, version_num=None, submit_type=None):
@@ -1221,19 +2418,12 @@ class ClipResult(collections.Iterator):
         @return a list of clips matching the criteria
         @rtype: clipbox.clip_source.ClipSource
         '''
-        filter_list = [ c for c in self._clip_list ] 
+        criteria = [ (column, value) for column, value in [ ('entity_code', entity_code),
+                                                            ('task_code',   task_code),
+                                                            ('ver_number',  version_num),
+                                                            ('submit_type', submit_type) ] if value ]
         
-        if entity_code:
-            filter_list = [ c for c in filter_list if c['entity_code']==entity_code ]
-            
-        if task_code:
-            filter_list = [ c for c in filter_list if c['task_code']==task_code ]
-             
-        if version_num:
-            filter_list = [ c for c in filter_list if c['version_num']==version_num ]
-            
-        if submit_type:
-            filter_list = [ c for c in filter_list if c['submit_type']==submit_type ]
+        filter_list = self._filter_rows(criteria)
             
         if len(filter_list)==0:
             return None
@@ -1249,91 +2439,168 @@ class ClipResult(collections.Iterator):
         return "<Clip query results | %s entries>" % len(self._clip_list)     
 
 
-class VersionResult(collections.Iterator):
-    def __init__(self, project, result):
+class VersionResult(IndexedResult, collections.Iterator):
+    '''
+    The versions of a query, with a summary row per version (entity_code, task_code, ver_number, artist) 
+    used to list and filter the result.
+    
+    In lazy mode, the summary rows are only built when first read, a page at a time. Indexing, slicing, iterating 
+    and len() don't build the rows, so the first page can be shown without resolving every version.
+    '''
+    
+    # number of summary rows built at once in lazy mode
+    PAGE_SIZE = 50
+    
+    def __init__(self, project, result, lazy=False):
         '''
         @param project
         @type project: Project 
-        
+        @param result list of version entities
+        @param lazy [optional] build the summary rows only when first read.
         '''
         
-        self._ver_list  = []
         self._project   = project 
+        self._lazy      = lazy
+        
+        self._versions  = list(result)
+        self._ver_list  = [ None ] * len(self._versions)
+        
+        if not lazy:
+            self._build_rows(0, len(self._versions))
+            
+            # drop the versions that can not be resolved
+            self._ver_list  = [ row for row in self._ver_list if row ]
+            self._versions  = [ row['ver'] for row in self._ver_list ]
+    
+    
+    def _build_rows(self, start, end):
+        '''
+        Build the summary rows of the versions in the range, the tasks of the range are batch cached.
+        '''
+        ver_range = [ ver for i, ver in enumerate(self._versions[start:end]) if self._ver_list[start+i]==None ]
+        
+        # batch cache the tasks, and the parents with one query per entity type, all at the same time.
+        task_id_list = [ ver._task_meta['id'] for ver in ver_range if ver._task_meta ]
+        fetch_list   = self._project._entity_fetch_list( [ ver._parent_meta for ver in ver_range ], {} )
         
-        # batch cache the task
-        task_id_list = [ ver._task_meta['id'] for ver in result if ver._task_meta ]
         if task_id_list:
-            self._project.list_tasks(task_id = task_id_list)
+            fetch_list.append( lambda: self._project.get_tasks(task_id_list) )
+            
+        self._project._call_all(fetch_list)
         
-        for ver in result:
+        # the artist and status of the rows are fetched together, the first time one is read.
+        self._project._queue_lookup( ENT_USER, [ ver._artist for ver in ver_range 
+                                                    if ver._artist and ver._artist is not NOT_FETCHED ] )
+        self._project._queue_lookup( ENT_STATUS, [ ver._status for ver in ver_range 
+                                                    if ver._status and ver._status is not NOT_FETCHED ] )
+        
+        for i in range(start, min(end, len(self._versions))):
+            if self._ver_list[i]!=None:
+                continue
+            
+            ver = self._versions[i]
             try: 
                 task = ver.task()
                 entity = ver.parent()
                 
-                self._ver_list.append( {
+                self._ver_list[i] = {
                                         'entity_code':  entity.entity_code() if entity else None,
                                         'task_code':    task.entity_code() if task else None,
                                         'ver_number':   ver.number(),
                                         'artist':       ver.artist(),
                                         'ver':          ver                                              
                                      }
-                                   )
             except:
                 LOG.critical("Can not resolve version entity from data %s." % ver, exc_info=1)
+                
+                if self._lazy:
+                    self._ver_list[i] = { 'entity_code':None, 'task_code':None, 'ver_number':ver.number(), 
+                                          'artist':None, 'ver':ver }
+    
+    
+    def _rows(self):
+        '''
+        @return all the summary rows, the missing rows are built.
+        '''
+        if None in self._ver_list:
+            for start in range(0, len(self._versions), VersionResult.PAGE_SIZE):
+                self._build_rows(start, start + VersionResult.PAGE_SIZE)
+            
+        return self._ver_list
+    
+    
+    def pages(self, page_size=None):
+        '''
+        Iterate the result page by page, the summary rows of a page are built when the page is reached.
+        @param page_size [optional] default VersionResult.PAGE_SIZE
+        @return generator of the pages
+        @rtype: VersionResult
+        '''
+        page_size = page_size or VersionResult.PAGE_SIZE
+        
+        for start in range(0, len(self._versions), page_size):
+            self._build_rows(start, start + page_size)
+            
+            yield self[start:start + page_size]
+            
 
     def __len__(self):
-        return len(self._ver_list)                
+        return len(self._versions)                
             
     def __iter__(self):
         self._index = -1
         return self
     
     def __getitem__(self, key):
-        assert type(key)==int, "Version Result index must be an integer, given %s" % key
+        if type(key)==slice:
+            sub_result = VersionResult(self._project, [], lazy=self._lazy)
+            sub_result._versions = self._versions[key]
+            sub_result._ver_list = self._ver_list[key]
+            
+            return sub_result
+            
+        assert type(key)==int, "Version Result index must be an integer or a slice, given %s" % key
         
-        return self._ver_list[key]['ver']    
+        return self._versions[key]    
         
     def next(self):
-        if self._index >= (len(self._ver_list)-1):
+        if self._index >= (len(self._versions)-1):
             raise StopIteration
         else:
             self._index += 1            
-            return self._ver_list[self._index]['ver']          
+            return self._versions[self._index]          
 
     def list_artists(self):
-        return list(set( [ c['artist'] for c in self._ver_list ] ))            
+        return self._list_column('artist')
 
     def list_entities(self):
-        return list(set( [ c['entity_code'] for c in self._ver_list ] ))
+        return self._list_column('entity_code')
     
     def list_tasks(self):
-        result = list(set( [ c['task_code'] for c in self._ver_list ] ))
+        result = self._list_column('task_code')
         result.sort()
         
         return result
     
     def list_versions(self):
-        return list(set( [ c['ver_number'] for c in self._ver_list ] ))
+        return self._list_column('ver_number')
 
             
-    def filter(self, entity_code=None, task_code=None, version=None ):
+    def filter(self, entity_code=None, task_code=None, version=None, artist=None ):
         '''
         @param entity_code
         @parrm task_code
         @param version_num
+        @param artist
         @return a list of clips matching the criteria
         @rtype: Version
         '''
-        filter_list = [ c for c in self._ver_list ] 
+        criteria = [ (column, value) for column, value in [ ('entity_code', entity_code),
+                                                            ('task_code',   task_code),
+                                                            ('ver_number',  version),
+                                                            ('artist',      artist) ] if value ]
         
-        if entity_code:
-            filter_list = [ c for c in filter_list if c['entity_code']==entity_code ]
-            
-        if task_code:
-            filter_list = [ c for c in filter_list if c['task_code']==task_code ]
-             
-        if version:
-            filter_list = [ c for c in filter_list if c['ver_number']==version ]
+        filter_list = self._filter_rows(criteria)
             
         if len(filter_list)==0:
             return None
@@ -1342,10 +2609,13 @@ class VersionResult(collections.Iterator):
         
         
     def __repr__(self):
-        return "<Version query results | %s entries>" % len(self._ver_list)            
+        return "<Version query results | %s entries>" % len(self._versions)            
            
  
 class FrameSubmission(Entity):
+    __slots__ = ('_submit_type', '_preview_path', '_source_path', '_parent_version_id', '_publish_date', 
+                 '_file_type', '_tags', '_clip_source')
+    
     def __init__(self, entity_id, entity_code, entity_data, 
                  preview_path, source_path,
                  parent_version_id, publish_date, 
@@ -1420,6 +2690,8 @@ class FrameSubmission(Entity):
     
 
 class User(Entity): 
+    __slots__ = ('_first_name', '_last_name')
+    
     def __init__(self, entity_id, entity_code, entity_data, first_name, last_name):
         Entity.__init__(self, 
                         entity_id   = entity_id, 
@@ -1440,6 +2712,9 @@ class User(Entity):
                 
         
 class Version(Entity):    
+    __slots__ = ('_version_num', '_artist', '_publish_date', '_status', '_description', '_for_review', 
+                 '_task_meta', '_dept_meta', '_parent_meta')
+    
     def __init__(self,  entity_id, entity_code, entity_data,
                         version_num, artist, publish_date, description, status, for_review, 
                         task, department, parent_meta        
@@ -1488,6 +2763,9 @@ class Version(Entity):
         '''
         @param as_obj return user as an object.
         '''
+        if self._artist is NOT_FETCHED:
+            self._hydrate()
+            
         if as_string:
             return self._artist
         else:
@@ -1495,18 +2773,27 @@ class Version(Entity):
             
             
     def publish_date(self, as_string=False):
+        if self._publish_date is NOT_FETCHED:
+            self._hydrate()
+            
         if as_string:
             return time.strftime('%b/%d/%y %H:%M:%S %a', self._publish_date) 
         else:
             return self._publish_date
     
     def description(self):
+        if self._description is NOT_FETCHED:
+            self._hydrate()
+            
         return self._description
     
     def comment(self):
-        return self._description    
+        return self.description()
     
     def status(self):
+        if self._status is NOT_FETCHED:
+            self._hydrate()
+            
         return self.project().get_status(self._status)
         
     def parent(self):
@@ -1580,4 +2867,24 @@ class Version(Entity):
                                     submit_type = submit_type, 
                                     file_type   = file_type,                                    
                                     )
-        
\ No newline at end of file
+        
+        
+# The entity classes manufactured by the project, per entity type.
+# The compact classes only hold their __slots__ attributes, the default classes also have an instance __dict__.
+COMPACT_ENTITY_CLASS = {   
+                ENT_SEQ:        Sequence,                        
+                ENT_SHOT:       Shot,
+             
+                ENT_ASSET:      Asset,
+                
+                ENT_TASK:       Task,
+                ENT_USER:       User,
+                
+                ENT_VERSION:    Version,
+                ENT_TASK_TYPE:  TaskType,
+                ENT_STATUS:     Status,
+                
+                }        
+
+ENTITY_CLASS = dict( [ (entity_type, type(cls.__name__, (cls,), {'__module__': cls.__module__}))
+                        for entity_type, cls in COMPACT_ENTITY_CLASS.items() ] )
@@ -0,0 +1,136 @@
+'''
+\namespace miso.entity_snapshot
+
+ The entity snapshot is a local sqlite store of the raw entity data returned by the prod_db plugin,
+ one file per show.  Along with the entity data, the snapshot keeps a watermark per entity type, the
+ latest 'updated_at' seen for the type.
+
+ A new project session loads the entities from the snapshot, and only ask the production database for
+ the entities updated since the watermark.
+
+ Example:
+
+        snapshot = EntitySnapshot( '/var/tmp/miso/bbb_prod.sqlite' )
+
+        snapshot.save( ENT_SHOT, [ (shot_id, shot_data), ... ], watermark = latest_updated_at )
+
+        for shot_id, shot_data in snapshot.load( ENT_SHOT ):
+            ...
+
+        snapshot.watermark( ENT_SHOT )
+
+ The entity data and the watermarks are stored as JSON, the dates tagged, see result_cache.dumps.  A snapshot
+ is data only, a snapshot file written by anyone else can not run code in the session loading it.
+'''
+
+import os, sqlite3
+
+from miso.config import get_logger
+from miso.pdb_plugins.result_cache import dumps, loads
+
+LOG = get_logger()
+
+# the version of the snapshot file layout, the snapshots of an older layout are emptied and fetched again.
+SCHEMA_VERSION = 1
+
+
+class EntitySnapshot:
+
+    def __init__(self, path):
+        '''
+        @param path the sqlite file of the snapshot, created if it doesn't exist.
+        '''
+        self._path = path
+
+        snapshot_dir = os.path.dirname(path)
+        if snapshot_dir and not os.path.isdir(snapshot_dir):
+            os.makedirs(snapshot_dir)
+
+        conn = self._connect()
+        try:
+            if conn.execute( 'PRAGMA user_version' ).fetchone()[0] != SCHEMA_VERSION:
+                LOG.info("Emptying snapshot %s of an older layout." % path)
+                conn.execute( 'DROP TABLE IF EXISTS entity' )
+                conn.execute( 'DROP TABLE IF EXISTS watermark' )
+                conn.execute( 'PRAGMA user_version=%d' % SCHEMA_VERSION )
+
+            conn.execute( 'CREATE TABLE IF NOT EXISTS entity ( entity_type TEXT, entity_id INTEGER, entity_data TEXT, '
+                          'PRIMARY KEY (entity_type, entity_id) )' )
+            conn.execute( 'CREATE TABLE IF NOT EXISTS watermark ( entity_type TEXT PRIMARY KEY, updated_at TEXT )' )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+    def _connect(self):
+        return sqlite3.connect(self._path)
+
+
+    def path(self):
+        return self._path
+
+
+    def load(self, entity_type):
+        '''
+        @return list of the snapshot entities. Each is a tuple ( entity_id, entity_data )
+        '''
+        conn = self._connect()
+        try:
+            rows = conn.execute( 'SELECT entity_id, entity_data FROM entity WHERE entity_type=?',
+                                 (entity_type,) ).fetchall()
+        finally:
+            conn.close()
+
+        return [ (entity_id, loads(entity_data)) for entity_id, entity_data in rows ]
+
+
+    def watermark(self, entity_type):
+        '''
+        @return the latest updated_at of the entity type in the snapshot, None if the type was never saved.
+        '''
+        conn = self._connect()
+        try:
+            row = conn.execute( 'SELECT updated_at FROM watermark WHERE entity_type=?', (entity_type,) ).fetchone()
+        finally:
+            conn.close()
+
+        return loads(row[0]) if row else None
+
+
+    def save(self, entity_type, entity_list, watermark):
+        '''
+        Insert or update the entities of the entity type, and move the watermark.
+        @param entity_type
+        @param entity_list list of tuple ( entity_id, entity_data )
+        @param watermark the latest updated_at of the entity type
+        '''
+        conn = self._connect()
+        try:
+            conn.executemany( 'INSERT OR REPLACE INTO entity VALUES (?, ?, ?)',
+                              [ (entity_type, entity_id, dumps(entity_data))
+                                for entity_id, entity_data in entity_list ] )
+
+            conn.execute( 'INSERT OR REPLACE INTO watermark VALUES (?, ?)',
+                          (entity_type, dumps(watermark)) )
+            conn.commit()
+        finally:
+            conn.close()
+
+        LOG.debug("Saved %s '%s' entities to snapshot %s." % (len(entity_list), entity_type, self._path))
+
+
+    def clear(self, entity_type=None):
+        '''
+        Remove the entities and the watermark, of the entity type or all of them.
+        '''
+        conn = self._connect()
+        try:
+            if entity_type==None:
+                conn.execute( 'DELETE FROM entity' )
+                conn.execute( 'DELETE FROM watermark' )
+            else:
+                conn.execute( 'DELETE FROM entity WHERE entity_type=?', (entity_type,) )
+                conn.execute( 'DELETE FROM watermark WHERE entity_type=?', (entity_type,) )
+            conn.commit()
+        finally:
+            conn.close()
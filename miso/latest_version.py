@@ -0,0 +1,252 @@
+'''
+\namespace miso.latest_version
+
+ The latest version per entity and task, for entity lists as large as all the shots of the show.
+
+ The entities are split in chunks, and the chunks are summarized by the database in parallel, grouped on
+ the entity id and the task code so only the maximum version id of each group comes back.  The versions
+ are then fetched by id, in chunks as well, skipping the versions already cached.
+
+ The maximum version ids are kept per entity, along with the entity updated_at of the time.  Publishing a
+ version does not move the entity updated_at, so the next call checks the kept entities with one light query
+ per chunk, the maximum version id of the chunk.  Only the chunks with a version published since, and the
+ entities which updated_at has moved, ex: after Project.sync, are summarized again.
+
+        engine = bbb.latest_version_engine()
+
+        # the latest cut, the latest Anm and Light version of every shot of the show.  The entities or the
+        # entity meta dictionaries can be given.
+        ver_list = engine.latest_versions( bbb.list_shots(), task_type_code=['Anm', 'Light'] )
+
+        # summarized and fetched entities, the entities answered from the kept ids, and the chunks checked.
+        engine.metric()
+'''
+import threading
+from multiprocessing.pool import ThreadPool
+
+import miso
+from miso import ENT_VERSION
+
+LOG = miso.config.get_logger()
+
+
+class LatestVersionEngine:
+
+    # number of entities summarized per query, and number of versions fetched per query.
+    CHUNK_SIZE = 200
+
+    # maximum number of chunks queried at the same time.
+    MAX_WORKERS = 4
+
+    def __init__(self, project, chunk_size=None, max_workers=None):
+        '''
+        @param project the project the versions are manufactured by.
+        @param chunk_size [optional] default LatestVersionEngine.CHUNK_SIZE
+        @param max_workers [optional] default LatestVersionEngine.MAX_WORKERS
+        '''
+        self._project       = project
+        self._chunk_size    = chunk_size or LatestVersionEngine.CHUNK_SIZE
+        self._max_workers   = max_workers or LatestVersionEngine.MAX_WORKERS
+        self._pool          = None
+
+        # ( entity_type, entity_id ) -> ( entity updated_at, { task_code: version_id } )
+        self._latest        = {}
+        self._metric        = {'hit':0, 'miss':0, 'check':0}
+        self._lock          = threading.Lock()
+
+
+    def _map(self, func, arg_list):
+        '''
+        Run the function on each argument, on the worker threads when there is more than one.
+        '''
+        if len(arg_list) < 2:
+            return map(func, arg_list)
+
+        with self._lock:
+            if self._pool==None:
+                self._pool = ThreadPool( self._max_workers )
+
+        return self._pool.map(func, arg_list)
+
+
+    def _chunks(self, value_list):
+        return [ value_list[i:i+self._chunk_size] for i in range(0, len(value_list), self._chunk_size) ]
+
+
+    def _updated_at(self, entity_type, entity_id):
+        '''
+        @return the updated_at of the cached entity, None if unknown.
+        '''
+        obj = self._project._entity_cache.get(entity_type, entity_id)
+
+        if obj==None:
+            return None
+
+        return ( obj.raw_entity_data() or {} ).get('updated_at')
+
+
+    def _entity_key(self, entity):
+        '''
+        @param entity the entity object, or the entity meta dictionary.
+        @return tuple ( entity_type, entity_id )
+        '''
+        if isinstance(entity, dict):
+            return entity['entity_type'], entity['id']
+
+        return entity.entity_type(), entity.entity_id()
+
+
+    def _summarize_chunk(self, arg):
+        entity_type, entity_id_list = arg
+
+        latest_hash = dict( [ (entity_id, {}) for entity_id in entity_id_list ] )
+
+        for entity_id, task_code, ver_id in self._project._prod_db.latest_version_ids( entity_type, entity_id_list ):
+            latest_hash[entity_id][task_code] = ver_id
+
+        return entity_type, latest_hash
+
+
+    def _check_chunk(self, arg):
+        '''
+        @return the entity ids of the chunk if a version was published for them since their ids were kept, 
+                else an empty list.
+        '''
+        entity_type, entity_id_list = arg
+
+        kept_id_list = []
+        for entity_id in entity_id_list:
+            kept_id_list.extend( self._latest[ (entity_type, entity_id) ][1].values() )
+
+        if self._project._prod_db.latest_version_mark(entity_type, entity_id_list)==max(kept_id_list or [ None ]):
+            return []
+
+        return entity_id_list
+
+
+    def latest_version_ids(self, entity_meta_list, task_type_code=None):
+        '''
+        @param entity_meta_list list of entities or entity meta dictionaries, ex: [ {'entity_type':ENT_SHOT, 'id':5 } ]
+        @param task_type_code [optional] only the latest versions of the task types, can be list.
+        @return the latest version ids, sorted.
+        @rtype: [ int ]
+        '''
+        if isinstance(task_type_code, basestring):
+            task_type_code = [ task_type_code ]
+
+        updated_hash = {}
+        dirty_hash   = {}
+        kept_hash    = {}
+        latest_hash  = {}
+
+        for entity_meta in entity_meta_list:
+            key        = self._entity_key(entity_meta)
+            updated_at = self._updated_at( *key )
+            kept       = self._latest.get(key)
+
+            updated_hash[key] = updated_at
+
+            if kept==None or updated_at==None or kept[0]!=updated_at:
+                dirty_hash.setdefault( key[0], set() ).add( key[1] )
+            else:
+                kept_hash.setdefault( key[0], set() ).add( key[1] )
+                latest_hash[key] = kept[1]
+
+        # the kept ids are stale once a version is published for the entity.
+        check_list = [ (entity_type, chunk) for entity_type, entity_id_set in sorted(kept_hash.items())
+                                                for chunk in self._chunks( sorted(entity_id_set) ) ]
+
+        for entity_type, chunk in zip( [ c[0] for c in check_list ], self._map(self._check_chunk, check_list) ):
+            dirty_hash.setdefault( entity_type, set() ).update(chunk)
+
+        chunk_list = [ (entity_type, chunk) for entity_type, entity_id_set in sorted(dirty_hash.items())
+                                                for chunk in self._chunks( sorted(entity_id_set) ) ]
+
+        dirty_count = sum([ len(chunk) for entity_type, chunk in chunk_list ])
+
+        with self._lock:
+            self._metric['miss']  += dirty_count
+            self._metric['hit']   += len(updated_hash) - dirty_count
+            self._metric['check'] += len(check_list)
+
+        for entity_type, chunk_hash in self._map( self._summarize_chunk, chunk_list ):
+            for entity_id, task_hash in chunk_hash.items():
+                key = (entity_type, entity_id)
+                latest_hash[key] = task_hash
+                self._latest[key] = ( updated_hash[key], task_hash )
+
+        ver_id_list = []
+
+        for task_hash in latest_hash.values():
+            ver_id_list.extend( [ ver_id for task_code, ver_id in task_hash.items()
+                                        if task_type_code==None or task_code in task_type_code ] )
+
+        return sorted(ver_id_list)
+
+
+    def latest_versions(self, entity_meta_list, task_type_code=None, fields=None):
+        '''
+        @param entity_meta_list list of entities or entity meta dictionaries, ex: [ {'entity_type':ENT_SHOT, 'id':5 } ]
+        @param task_type_code [optional] only the latest versions of the task types, can be list.
+        @param fields [optional] the version fields to query, see Project.list_versions.
+        @return the latest versions, ordered by id.
+        @rtype: [ Version ]
+        '''
+        ver_id_list = self.latest_version_ids(entity_meta_list, task_type_code)
+
+        ver_hash    = {}
+        missing     = []
+
+        for ver_id in ver_id_list:
+            ver = self._project._entity_cache.get(ENT_VERSION, ver_id)
+
+            if ver!=None:
+                ver_hash[ver_id] = ver
+            else:
+                missing.append(ver_id)
+
+        list_entities = self._project._prod_db.list_entities
+
+        for row_list in self._map( lambda chunk: list_entities(ENT_VERSION, chunk, fields=fields), self._chunks(missing) ):
+            for ver_id, ver_data in row_list:
+                ver = self._project._objectfy_entity( entity_type = ENT_VERSION,
+                                                      entity_id   = ver_id,
+                                                      entity_data = ver_data )
+                if ver:
+                    ver_hash[ver_id] = ver
+
+        return [ ver_hash[ver_id] for ver_id in ver_id_list if ver_id in ver_hash ]
+
+
+    def invalidate(self, entity_meta_list=None):
+        '''
+        Forget the kept latest version ids, ex: a version was published for the entity.
+        @param entity_meta_list [optional] the entities or entity meta dictionaries to forget, default all.
+        '''
+        with self._lock:
+            if entity_meta_list==None:
+                self._latest = {}
+            else:
+                for entity_meta in entity_meta_list:
+                    self._latest.pop( self._entity_key(entity_meta), None )
+
+
+    def metric(self):
+        '''
+        @return number of entities summarized by the database ( miss ), answered from the kept ids ( hit ), and
+                the chunks of kept ids checked for a version published since ( check ).
+        @rtype: dict
+        '''
+        with self._lock:
+            return dict(self._metric)
+
+
+    def close(self):
+        '''
+        Stop the worker threads.
+        '''
+        with self._lock:
+            if self._pool!=None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
@@ -0,0 +1,94 @@
+'''
+\namespace miso.pdb_plugins.connection_pool
+
+ Pool of database connections shared by the threads of a plugin session.
+
+ The shotgun api connection is not thread safe, so a thread takes a connection out of the pool for the
+ duration of a call and gives it back after.  Connections are created on demand up to the pool size,
+ once all are in use the next thread waits for one to be given back.
+
+        pool = ConnectionPool( lambda: Shotgun(url, script, key), max_size=8 )
+
+        with pool.connection() as sg:
+            sg.find( 'Shot', filters, fields )
+'''
+import threading, contextlib, Queue
+
+
+class ConnectionPool:
+
+    def __init__(self, connect_func, max_size, connection=None):
+        '''
+        @param connect_func function creating a new connection.
+        @param max_size maximum number of connections.
+        @param connection [optional] an already open connection, put in the pool.
+        '''
+        self._connect_func  = connect_func
+        self._max_size      = max_size
+        self._idle          = Queue.LifoQueue()
+        self._created       = 0
+        self._lock          = threading.Lock()
+
+        if connection!=None:
+            self._created = 1
+            self._idle.put(connection)
+
+
+    def acquire(self, timeout=None):
+        '''
+        @param timeout [optional] seconds to wait for a connection once the pool is exhausted.
+        @return a connection, to be given back with release.
+        '''
+        try:
+            return self._idle.get_nowait()
+        except Queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created < self._max_size
+            if create:
+                self._created += 1
+
+        if create:
+            try:
+                return self._connect_func()
+            except:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        # python 2 Queue.get without timeout can not be interrupted, wait in steps.
+        if timeout==None:
+            while True:
+                try:
+                    return self._idle.get(timeout=60)
+                except Queue.Empty:
+                    pass
+
+        return self._idle.get(timeout=timeout)
+
+
+    def release(self, connection):
+        '''
+        Give the connection back to the pool.
+        '''
+        self._idle.put(connection)
+
+
+    @contextlib.contextmanager
+    def connection(self):
+        '''
+        Take a connection out of the pool within the with block.
+        '''
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+
+    def size(self):
+        '''
+        @return tuple ( number of connections created, number of idle connections )
+        '''
+        return self._created, self._idle.qsize()
@@ -0,0 +1,186 @@
+'''
+\namespace miso.pdb_plugins.mock_result_server
+
+ In process stand-in for a Redis server, serving the commands used by the SocketResultCache: GET, SET with
+ EX or PX, INCR, DEL, PING and FLUSHDB.  Used to run the unit tests without a redis-server.
+
+        server = MockResultServer()         # listens on a free local port
+        server.start()
+
+        cache = result_cache.connect( 'redis://127.0.0.1:%s' % server.port(), namespace='bbb' )
+        ...
+        server.stop()
+'''
+import time, socket, threading, SocketServer
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+
+    def _read_command(self):
+        '''
+        @return the command arguments, None once the client is gone.
+        '''
+        line = self.rfile.readline()
+
+        if not line:
+            return None
+
+        # inline command, ex: PING
+        if line[0]!='*':
+            return line.split()
+
+        arg_list = []
+        for i in range( int(line[1:-2]) ):
+            size = int( self.rfile.readline()[1:-2] )
+            arg_list.append( self.rfile.read(size + 2)[:-2] )
+
+        return arg_list
+
+
+    def handle(self):
+        while True:
+            arg_list = self._read_command()
+
+            if not arg_list:
+                return
+
+            try:
+                reply = self.server.store.execute(arg_list)
+            except Exception, e:
+                reply = e
+
+            self.wfile.write( _encode(reply) )
+            self.wfile.flush()
+
+
+def _encode(reply):
+    if isinstance(reply, Exception):
+        return '-ERR %s\r\n' % reply
+
+    if reply==None:
+        return '$-1\r\n'
+
+    if reply is True:
+        return '+OK\r\n'
+
+    if isinstance(reply, (int, long)):
+        return ':%d\r\n' % reply
+
+    if reply=='PONG':
+        return '+PONG\r\n'
+
+    return '$%d\r\n%s\r\n' % (len(reply), reply)
+
+
+class _Store:
+
+    def __init__(self):
+        self._value = {}            # key -> ( value, expire time or None )
+        self._lock  = threading.Lock()
+
+
+    def _get(self, key):
+        value, expire_time = self._value.get( key, (None, None) )
+
+        if expire_time!=None and expire_time <= time.time():
+            del self._value[key]
+            return None
+
+        return value
+
+
+    def execute(self, arg_list):
+        command = arg_list[0].upper()
+
+        with self._lock:
+            if command=='PING':
+                return 'PONG'
+
+            if command=='GET':
+                return self._get(arg_list[1])
+
+            if command=='SET':
+                expire_time = None
+                option      = [ a.upper() for a in arg_list[3::2] ]
+
+                if 'PX' in option:
+                    expire_time = time.time() + int( arg_list[ 4 + option.index('PX') * 2 ] ) / 1000.0
+                elif 'EX' in option:
+                    expire_time = time.time() + int( arg_list[ 4 + option.index('EX') * 2 ] )
+
+                self._value[arg_list[1]] = ( arg_list[2], expire_time )
+                return True
+
+            if command=='INCR':
+                value = int( self._get(arg_list[1]) or 0 ) + 1
+                self._value[arg_list[1]] = ( str(value), None )
+                return value
+
+            if command=='DEL':
+                return len( [ self._value.pop(key) for key in arg_list[1:] if self._get(key)!=None ] )
+
+            if command=='FLUSHDB':
+                self._value = {}
+                return True
+
+        raise ValueError("unknown command '%s'" % command)
+
+
+class _Server(SocketServer.ThreadingTCPServer):
+    daemon_threads      = True
+    allow_reuse_address = True
+
+    def __init__(self, address, handler_class):
+        SocketServer.ThreadingTCPServer.__init__(self, address, handler_class)
+
+        # the client connections, closed when the server stops.
+        self.client_socket  = set()
+
+
+    def process_request(self, request, client_address):
+        self.client_socket.add(request)
+
+        SocketServer.ThreadingTCPServer.process_request(self, request, client_address)
+
+
+    def close_clients(self):
+        for sock in list(self.client_socket):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+        self.client_socket.clear()
+
+
+class MockResultServer:
+
+    def __init__(self, host='127.0.0.1', port=0):
+        '''
+        @param host [optional]
+        @param port [optional] default a free port.
+        '''
+        self._server        = _Server( (host, port), _Handler )
+        self._server.store  = _Store()
+        self._thread        = None
+
+
+    def port(self):
+        return self._server.server_address[1]
+
+
+    def start(self):
+        self._thread = threading.Thread( target=self._server.serve_forever, name='miso_mock_result_server' )
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def stop(self):
+        if self._thread==None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._server.close_clients()
+        self._thread.join()
+        self._thread = None
@@ -0,0 +1,597 @@
+'''
+\namespace miso.pdb_plugins.mock_shotgun
+
+ In process stand-in for the shotgun api, serving a generated show.  Used to run the unit tests and the
+ benchmarks without a shotgun site.
+
+ The show is generated with N sequences x M shots x K versions per shot task, named after Big Buck Bunny:
+  sequences bunny_010, bunny_020, ..., shots bunny_010_0010, bunny_010_0020, ..., shot tasks Anm, Light, snd,
+  and the assets Alice, Buck, Fern ( Character ) and Apple ( Prop ) with the tasks Rig and Mod.
+
+ Each call can be slowed down to simulate the round trip to the shotgun site, a fixed latency per call and
+ a latency per returned row.
+
+        show_data = MockShowData( seq_count=40, shot_count=50, version_count=5 )
+
+        sg = Shotgun( 'mock://', 'script', 'key', show_data=show_data, latency=0.05 )
+        sg.find( 'Shot', [('sg_sequence','is',{'type':'Sequence','id':1})], ['code','cut_in'] )
+
+        # number of calls served per api function
+        show_data.call_count()
+
+ The mock covers the part of the api used by the shotgun plugin: find, find_one and summarize, the filter
+ operators is, is_not, in, not_in, greater_than, less_than, contains, starts_with, ends_with, and the linked
+ fields such as 'sg_task.Task.content'.  The writes create, update and batch change the shared show data.
+
+        # the next 2 calls of batch raise, ex: to test the retries.
+        show_data.fail_next( 'batch', 2 )
+
+        # or, the next batch is written and its reply lost.
+        show_data.fail_next( 'batch', 1, lose_reply=True )
+
+ Use the show connection parameter 'type': 'mock_shotgun' to connect a project to the mock, or set the
+ environment variable MISO_MOCK_SHOTGUN=1 to switch all the shows, see miso.config.
+'''
+import datetime, time, threading
+
+try:
+    from shotgun_api3 import Fault
+except ImportError:
+    class Fault(Exception):
+        # the request rejected by the site, as shotgun_api3.Fault
+        pass
+
+# the shot tasks and asset tasks of the generated show
+SHOT_TASK_CODES     = [ 'Anm', 'Light', 'snd' ]
+ASSET_TASK_CODES    = [ 'Rig', 'Mod' ]
+
+# the generated assets ( code, asset type )
+ASSET_LIST          = [ ('Alice','Character'), ('Buck','Character'), ('Fern','Character'), ('Apple','Prop') ]
+
+# the statuses ( code, name, background colour )
+STATUS_LIST         = [ ('wtg', 'Waiting to Start', '240,240,240'), ('ip', 'In Progress', '255,200,0'),
+                        ('rev', 'Pending Review', '0,160,255'), ('apr', 'Approved', '0,200,80') ]
+
+# entity types without generated rows which can be created
+WRITABLE_TYPES      = [ 'PublishedFile' ]
+
+# fields indexed for the 'is' and 'in' filters
+INDEXED_FIELDS      = [ 'id', 'code', 'entity', 'sg_sequence', 'sg_task', 'project' ]
+
+# generated show data, shared by all the connections with the same parameters
+_SHOW_DATA          = {}
+_SHOW_DATA_LOCK     = threading.Lock()
+
+
+class MockShowData:
+
+    def __init__(self,  seq_count       = 15,
+                        shot_count      = 20,
+                        version_count   = 3,
+                        show_name       = 'Big Buck Bunny',
+                        show_code       = 'bbb'):
+        '''
+        @param seq_count number of sequences
+        @param shot_count number of shots per sequence
+        @param version_count number of versions per task
+        @param show_name
+        @param show_code
+        '''
+        self._table      = {}       # shotgun entity type -> [ row ]
+        self._index      = {}       # (shotgun entity type, field) -> value -> [ row ]
+        self._call_count = {}
+        self._fail_count = {}       # api function -> number of calls left to fail
+        self._lock       = threading.Lock()
+
+        self._generate(seq_count, shot_count, version_count, show_name, show_code)
+
+
+    def _add(self, sg_type, row):
+        row['type'] = sg_type
+        self._table.setdefault(sg_type, []).append(row)
+
+        return {'type':sg_type, 'id':row['id'], 'name':row.get('code', row.get('name'))}
+
+
+    def _generate(self, seq_count, shot_count, version_count, show_name, show_code):
+        start_time  = datetime.datetime(2014, 1, 1)
+        next_id     = {}
+
+        def new_id(sg_type):
+            next_id[sg_type] = next_id.get(sg_type, 0) + 1
+            return next_id[sg_type]
+
+        def add_tasks(parent_link, task_code_list, template_link):
+            for task_code in task_code_list:
+                task_link = self._add('Task', { 'id':                       new_id('Task'),
+                                                'content':                  task_code,
+                                                'cached_display_name':      task_code,
+                                                'entity':                   parent_link,
+                                                'project':                  proj_link,
+                                                'sg_task_order':            0,
+                                                'step':                     None,
+                                                'sg_status_list':           'wtg',
+                                                'task_assignees':           [ user_link ],
+                                                'due_date':                 None,
+                                                'template_task':            None,
+                                                'task_template':            template_link,
+                                                'updated_at':               start_time } )
+
+                for ver_num in range(1, version_count + 1):
+                    ver_id = new_id('Version')
+
+                    # later versions, later publish
+                    publish_time = start_time + datetime.timedelta(minutes=ver_id)
+
+                    self._add('Version', {  'id':                   ver_id,
+                                            'code':                 '%s_%s_v%03d' % (parent_link['name'], task_code, ver_num),
+                                            'sg_version_number':    ver_num,
+                                            'sg_version_type':      'playblast',
+                                            'description':          '',
+                                            'created_at':           publish_time,
+                                            'created_by':           user_link,
+                                            'sg_status_list':       'rev',
+                                            'sg_path':              None,
+                                            'sg_task':              task_link,
+                                            'entity':               parent_link,
+                                            'project':              proj_link,
+                                            'updated_at':           publish_time } )
+
+        proj_link   = self._add('Project',      { 'id':new_id('Project'), 'name':show_name, 'sg_code':show_code } )
+
+        user_link   = self._add('HumanUser',    { 'id':new_id('HumanUser'), 'name':'Pat Parker', 'login':'pparker',
+                                                  'firstname':'Pat', 'lastname':'Parker' } )
+
+        for status_code, status_name, bg_color in STATUS_LIST:
+            self._add('Status', { 'id':new_id('Status'), 'code':status_code, 'name':status_name, 'bg_color':bg_color } )
+
+        shot_template   = self._add('TaskTemplate', { 'id':new_id('TaskTemplate'), 'code':'Shot', 'entity_type':'Shot' } )
+        asset_template  = self._add('TaskTemplate', { 'id':new_id('TaskTemplate'), 'code':'Asset', 'entity_type':'Asset' } )
+
+        for seq_num in range(1, seq_count + 1):
+            seq_code = 'bunny_%03d' % (seq_num * 10)
+            seq_link = self._add('Sequence', {  'id':                   new_id('Sequence'),
+                                                'code':                 seq_code,
+                                                'cached_display_name':  seq_code,
+                                                'sg_status_list':       'ip',
+                                                'sg_assigned_to':       None,
+                                                'shots':                [],
+                                                'project':              proj_link,
+                                                'updated_at':           start_time } )
+
+            for shot_num in range(1, shot_count + 1):
+                shot_code = '%s_%04d' % (seq_code, shot_num * 10)
+                cut_in    = 1001 + (shot_num - 1) * 100
+
+                shot_link = self._add('Shot', { 'id':                   new_id('Shot'),
+                                                'code':                 shot_code,
+                                                'name':                 shot_code,
+                                                'sg_sequence':          seq_link,
+                                                'project':              proj_link,
+                                                'cut_in':               cut_in,
+                                                'cut_out':              cut_in + 99,
+                                                'sg_cut_order':         shot_num,
+                                                'updated_at':           start_time } )
+
+                self._table['Sequence'][-1]['shots'].append(shot_link)
+
+                add_tasks(shot_link, SHOT_TASK_CODES, shot_template)
+
+        for asset_code, asset_type in ASSET_LIST:
+            asset_link = self._add('Asset', {   'id':                   new_id('Asset'),
+                                                'code':                 asset_code,
+                                                'cached_display_name':  asset_code,
+                                                'sg_status_list':       'ip',
+                                                'description':          '',
+                                                'sg_asset_type':        asset_type,
+                                                'project':              proj_link,
+                                                'updated_at':           start_time } )
+
+            add_tasks(asset_link, ASSET_TASK_CODES, asset_template)
+
+
+    def rows(self, sg_type):
+        '''
+        @return all the rows of the shotgun entity type
+        '''
+        return self._table.get(sg_type, [])
+
+
+    def row(self, sg_type, row_id):
+        '''
+        @return the row of the shotgun entity type and id, None if not found.
+        '''
+        found = self.index(sg_type, 'id').get(row_id)
+
+        return found[0] if found else None
+
+
+    def index(self, sg_type, field):
+        '''
+        @return the rows of the shotgun entity type bucketed by the filter value of the field, built on first use.
+        '''
+        key = (sg_type, field)
+
+        if key not in self._index:
+            field_index = {}
+            for r in self.rows(sg_type):
+                field_index.setdefault( _filter_value(r.get(field)), [] ).append(r)
+
+            self._index[key] = field_index
+
+        return self._index[key]
+
+
+    def new_id(self, sg_type):
+        '''
+        @return the id of a new row of the shotgun entity type.
+        '''
+        return max( [ r['id'] for r in self.rows(sg_type) ] or [ 0 ] ) + 1
+
+
+    def add_row(self, sg_type, row):
+        '''
+        Add the row, and drop the field indexes of the entity type.
+        '''
+        self._add(sg_type, row)
+
+        for key in [ key for key in self._index if key[0]==sg_type ]:
+            del self._index[key]
+
+
+    def update_row(self, sg_type, row_id, data):
+        row = self.row(sg_type, row_id)
+
+        for key in [ key for key in self._index if key[0]==sg_type and key[1] in data ]:
+            del self._index[key]
+
+        row.update(data)
+
+        return row
+
+
+    def fail_next(self, func_name, count=1, error=None, lose_reply=False):
+        '''
+        Make the next calls of the api function raise, ex: to simulate a connection lost.
+        @param func_name ex: batch
+        @param count [optional] number of calls to fail.
+        @param error [optional] the exception raised, default IOError.
+        @param lose_reply [optional] the calls are served then raise, ex: a batch written but which reply is lost.
+        '''
+        with self._lock:
+            self._fail_count[func_name] = ( count, error or IOError("Mock connection reset."), lose_reply )
+
+
+    def count_call(self, func_name, served=False):
+        '''
+        Count the call, and raise if the call is made to fail, see fail_next.
+        @param served [optional] True once the call is served, for the calls losing their reply.
+        '''
+        with self._lock:
+            if not served:
+                self._call_count[func_name] = self._call_count.get(func_name, 0) + 1
+
+            count, error, lose_reply = self._fail_count.get(func_name, (0, None, False))
+            if count and lose_reply==served:
+                self._fail_count[func_name] = ( count - 1, error, lose_reply )
+                raise error
+
+
+    def call_count(self):
+        '''
+        @return number of calls served per api function, ex: {'find': 10, 'summarize': 1}
+        '''
+        return dict(self._call_count)
+
+
+    def reset_call_count(self):
+        self._call_count = {}
+
+
+def _index_value(value):
+    '''
+    @return hashable value of the field, entity links are compared by type and id.
+    '''
+    if isinstance(value, dict):
+        return ( value.get('type'), value.get('id') )
+
+    if isinstance(value, list):
+        return None
+
+    return value
+
+
+def _filter_value(value):
+    '''
+    @return the value compared by the filters, text comparison is case insensitive like shotgun.
+    '''
+    if isinstance(value, basestring):
+        return value.lower()
+
+    return _index_value(value)
+
+
+def _copy_value(value):
+    '''
+    @return copy of the field value, so the caller can modify the result freely.
+    '''
+    if isinstance(value, dict):
+        return dict(value)
+
+    if isinstance(value, list):
+        return [ _copy_value(v) for v in value ]
+
+    return value
+
+
+_FILTER_OPERATOR = {
+        'is':           lambda value, arg: _filter_value(value) == _filter_value(arg),
+        'is_not':       lambda value, arg: _filter_value(value) != _filter_value(arg),
+        # the list arguments are turned into sets of filter values once per query, see Shotgun._query
+        'in':           lambda value, arg: _filter_value(value) in arg,
+        'not_in':       lambda value, arg: _filter_value(value) not in arg,
+        'greater_than': lambda value, arg: value!=None and value > arg,
+        'less_than':    lambda value, arg: value!=None and value < arg,
+        'contains':     lambda value, arg: value!=None and arg in value,
+        'starts_with':  lambda value, arg: value!=None and value.startswith(arg),
+        'ends_with':    lambda value, arg: value!=None and value.endswith(arg),
+    }
+
+
+class Shotgun:
+
+    def __init__(self, base_url, script_name=None, api_key=None, show_data=None, latency=0.0, row_latency=0.0, **arg_hash):
+        '''
+        @param base_url not used
+        @param show_data [optional] the show served, a default show is generated if not given.
+        @type show_data: MockShowData
+        @param latency [optional] seconds added to each call.
+        @param row_latency [optional] seconds added per returned row.
+        '''
+        self._data          = show_data if show_data!=None else MockShowData()
+        self._latency       = latency
+        self._row_latency   = row_latency
+
+
+    def _field_value(self, row, field):
+        '''
+        @return the field value of the row, following the linked fields, ex: 'sg_task.Task.content'
+        '''
+        if '.' not in field:
+            return row.get(field)
+
+        link_field, link_type, link_rest = field.split('.', 2)
+
+        link = row.get(link_field)
+        if not link or link.get('type')!=link_type:
+            return None
+
+        link_row = self._data.row(link_type, link['id'])
+
+        return self._field_value(link_row, link_rest) if link_row else None
+
+
+    def _match(self, row, filters, filter_operator):
+        match_list = ( _FILTER_OPERATOR[f[1]]( self._field_value(row, f[0]), f[2] ) for f in filters )
+
+        return any(match_list) if filter_operator=='any' else all(match_list)
+
+
+    def _query(self, entity_type, filters, filter_operator=None):
+        '''
+        @return the rows matching the filters, narrowed with the field indexes first when possible.
+        '''
+        rows = None
+
+        if filter_operator!='any':
+            for f in filters:
+                if f[0] in INDEXED_FIELDS and f[1] in ('is', 'in'):
+                    field_index = self._data.index(entity_type, f[0])
+                    arg_list    = [ f[2] ] if f[1]=='is' else f[2]
+                    candidates  = [ r for v in set([ _filter_value(a) for a in arg_list ])
+                                            for r in field_index.get(v, []) ]
+
+                    # the most selective filter
+                    if rows==None or len(candidates) < len(rows):
+                        rows = candidates
+
+        if rows==None:
+            rows = self._data.rows(entity_type)
+
+        filters = [ (f[0], f[1], set([ _filter_value(a) for a in f[2] ])) if f[1] in ('in', 'not_in') else f
+                        for f in filters ]
+
+        return [ r for r in rows if self._match(r, filters, filter_operator) ]
+
+
+    def _wait(self, row_count):
+        wait_time = self._latency + self._row_latency * row_count
+
+        if wait_time:
+            time.sleep(wait_time)
+
+
+    def find(self, entity_type, filters, fields=None, order=None, filter_operator=None, limit=0,
+                                                                retired_only=False, page=0, **arg_hash):
+        self._data.count_call('find')
+
+        rows = self._query(entity_type, filters, filter_operator)
+
+        if not order:
+            order = [ {'field_name':'id', 'direction':'asc'} ]
+
+        for o in reversed(order):
+            rows.sort( key = lambda r: self._field_value(r, o['field_name']), reverse = o.get('direction')=='desc' )
+
+        if limit:
+            start = (page - 1) * limit if page else 0
+            rows  = rows[start:start + limit]
+
+        result = []
+        for r in rows:
+            record = {'type':entity_type, 'id':r['id']}
+            for f in (fields or []):
+                record[f] = _copy_value( self._field_value(r, f) )
+
+            result.append(record)
+
+        self._wait( len(result) )
+
+        return result
+
+
+    def find_one(self, entity_type, filters, fields=None, order=None, filter_operator=None, retired_only=False, **arg_hash):
+        result = self.find(entity_type, filters, fields, order, filter_operator, limit=1, retired_only=retired_only)
+
+        return result[0] if result else None
+
+
+    def summarize(self, entity_type, filters, summary_fields, filter_operator=None, grouping=None, **arg_hash):
+        self._data.count_call('summarize')
+
+        rows = self._query(entity_type, filters, filter_operator)
+
+        summary_func = { 'count':   len,
+                         'maximum': lambda value_list: max(value_list) if value_list else None,
+                         'minimum': lambda value_list: min(value_list) if value_list else None,
+                         'sum':     sum }
+
+        def summarize_rows(row_list):
+            return dict( [ ( s['field'], summary_func[s['type']]( [ self._field_value(r, s['field']) for r in row_list ] ) )
+                            for s in summary_fields ] )
+
+        def group_rows(row_list, grouping):
+            bucket = {}
+            for r in row_list:
+                bucket.setdefault( _index_value(self._field_value(r, grouping[0]['field'])), [] ).append(r)
+
+            group_list = []
+            for value in sorted(bucket, reverse = grouping[0].get('direction')=='desc'):
+                group = { 'group_name':     str(value),
+                          'group_value':    value,
+                          'summaries':      summarize_rows(bucket[value]) }
+
+                if len(grouping) > 1:
+                    group['groups'] = group_rows(bucket[value], grouping[1:])
+
+                group_list.append(group)
+
+            return group_list
+
+        result = { 'summaries': summarize_rows(rows) }
+
+        if grouping:
+            result['groups'] = group_rows(rows, grouping)
+
+        self._wait( len(result.get('groups', [])) )
+
+        return result
+
+
+    def _check_write(self, request):
+        '''
+        Reject the request as the site would, before any row of the batch is written.
+        '''
+        sg_type = request['entity_type']
+
+        if request['request_type']=='create':
+            if not self._data.rows(sg_type) and sg_type not in WRITABLE_TYPES:
+                raise Fault, "API create() unknown entity type '%s'." % sg_type
+
+        elif request['request_type']=='update':
+            if self._data.row(sg_type, request['entity_id'])==None:
+                raise Fault, "API update() %s id %s does not exist." % (sg_type, request['entity_id'])
+
+        else:
+            raise Fault, "API batch() unsupported request type '%s'." % request['request_type']
+
+
+    def _write(self, request):
+        sg_type = request['entity_type']
+        now     = datetime.datetime.now()
+
+        if request['request_type']=='create':
+            row = dict( [ (f, _copy_value(v)) for f, v in request['data'].items() ] )
+            row['id']           = self._data.new_id(sg_type)
+            row['updated_at']   = now
+            row.setdefault('created_at', now)
+
+            self._data.add_row(sg_type, row)
+            fields = request.get('return_fields') or request['data'].keys()
+        else:
+            row = self._data.update_row( sg_type, request['entity_id'], 
+                                         dict( request['data'].items() + [ ('updated_at', now) ] ) )
+            fields = request['data'].keys()
+
+        record = {'type':sg_type, 'id':row['id']}
+        for f in fields:
+            record[f] = _copy_value( self._field_value(row, f) )
+
+        return record
+
+
+    def create(self, entity_type, data, return_fields=None):
+        return self.batch( [ {'request_type':'create', 'entity_type':entity_type, 'data':data,
+                              'return_fields':return_fields} ] )[0]
+
+
+    def update(self, entity_type, entity_id, data):
+        return self.batch( [ {'request_type':'update', 'entity_type':entity_type, 'entity_id':entity_id,
+                              'data':data} ] )[0]
+
+
+    def batch(self, requests):
+        '''
+        All or none of the requests are written.
+        '''
+        self._data.count_call('batch')
+
+        with self._data._lock:
+            for request in requests:
+                self._check_write(request)
+
+            result = [ self._write(request) for request in requests ]
+
+        self._data.count_call('batch', served=True)
+
+        self._wait( len(result) )
+
+        return result
+
+
+class _Connector:
+    '''
+    Create the mock connections sharing the show data, in place of the shotgun api class.
+    '''
+    def __init__(self, show_data, latency, row_latency):
+        self.show_data      = show_data
+        self._latency       = latency
+        self._row_latency   = row_latency
+
+    def __call__(self, base_url, script_name=None, api_key=None, **arg_hash):
+        return Shotgun( base_url, script_name, api_key, show_data   = self.show_data,
+                                                        latency     = self._latency,
+                                                        row_latency = self._row_latency )
+
+
+def connector(show_config):
+    '''
+    @param show_config the show connection parameters. The mock specific ones are all optional:
+                       seq_count, shot_count, version_count, latency, row_latency
+    @return the factory of mock connections, to be given to the ShotgunSession as the shotgun class.
+    '''
+    data_key = ( show_config.get('name'),
+                 show_config.get('code'),
+                 show_config.get('seq_count', 15),
+                 show_config.get('shot_count', 20),
+                 show_config.get('version_count', 3) )
+
+    with _SHOW_DATA_LOCK:
+        if data_key not in _SHOW_DATA:
+            _SHOW_DATA[data_key] = MockShowData( seq_count       = data_key[2],
+                                                 shot_count      = data_key[3],
+                                                 version_count   = data_key[4],
+                                                 show_name       = data_key[0],
+                                                 show_code       = data_key[1] )
+
+    return _Connector( _SHOW_DATA[data_key], show_config.get('latency', 0.0), show_config.get('row_latency', 0.0) )
@@ -0,0 +1,178 @@
+'''
+\namespace miso.pdb_plugins.query_coalescer
+
+ Collapse identical concurrent queries into one database round trip.
+
+ The queries are keyed on the entity type, the normalised filters, the fields, the order and the limit.
+ While a query is in flight, the other threads asking the same query wait for its result rather than
+ sending their own ( single flight ).  Optionally, the results are kept for a short time so a burst of
+ duplicate reads is answered from memory ( memo ).
+
+        coalescer = QueryCoalescer( memo_ttl=2 )
+
+        key  = query_key( 'Version', filters, fields, order, limit )
+        rows = coalescer.call( key, lambda: sg.find('Version', filters, fields) )
+
+ Each caller gets its own copy of the shared result, callers are free to modify the rows.
+'''
+import sys, copy, threading, time
+
+# maximum number of query results kept
+MAX_MEMO_ENTRIES = 1000
+
+
+def _normalise(value):
+    '''
+    @return hashable form of the query argument, dicts and lists turned into tuples.
+    '''
+    if isinstance(value, dict):
+        return tuple( sorted( [ (k, _normalise(v)) for k, v in value.items() ] ) )
+
+    if isinstance(value, (list, tuple)):
+        return tuple( [ _normalise(v) for v in value ] )
+
+    return value
+
+
+def query_key(entity_type, filters, fields=None, order=None, limit=None, **arg_hash):
+    '''
+    @return the key of the query, the same for the identical queries.
+            The filters and fields are order independent.
+    '''
+    return ( entity_type,
+             tuple( sorted( [ _normalise(f) for f in filters or [] ] ) ),
+             tuple( sorted( fields or [] ) ),
+             _normalise(order),
+             limit,
+             _normalise(arg_hash) )
+
+
+class _Flight:
+    '''
+    The query in flight, the waiting callers are woken once the result is back.
+    '''
+    def __init__(self):
+        self.done       = threading.Event()
+        self.result     = None
+        self.error      = None
+        self.waiters    = 0
+
+
+class QueryCoalescer:
+
+    def __init__(self, memo_ttl=0):
+        '''
+        @param memo_ttl [optional] seconds the results are kept for the identical queries, 0 to keep none.
+        '''
+        self._memo_ttl  = memo_ttl
+        self._flight    = {}            # key -> _Flight
+        self._memo      = {}            # key -> ( result, expire time )
+        self._metric    = {'miss':0, 'coalesced':0, 'memo_hit':0}
+        self._lock      = threading.Lock()
+
+
+    def set_memo_ttl(self, memo_ttl):
+        '''
+        @param memo_ttl seconds the results are kept, 0 to stop keeping them.
+        '''
+        with self._lock:
+            self._memo_ttl = memo_ttl
+            if not memo_ttl:
+                self._memo = {}
+
+
+    def memo_ttl(self):
+        return self._memo_ttl
+
+
+    def clear(self):
+        '''
+        Forget the kept results, ex: after a write to the database.
+        '''
+        with self._lock:
+            self._memo = {}
+
+
+    def metric(self):
+        '''
+        @return number of queries sent ( miss ), answered by a query in flight ( coalesced ), answered from
+                the kept results ( memo_hit ).
+        @rtype: dict
+        '''
+        with self._lock:
+            return dict(self._metric)
+
+
+    def call(self, key, func):
+        '''
+        @param key the query key, see query_key.
+        @param func the function doing the query.
+        @return the result of the query, own copy of the caller when the result is shared.
+        '''
+        with self._lock:
+            if self._memo_ttl and key in self._memo:
+                result, expire_time = self._memo[key]
+
+                if time.time() < expire_time:
+                    self._metric['memo_hit'] += 1
+                    return copy.deepcopy(result)
+
+                del self._memo[key]
+
+            flight = self._flight.get(key)
+
+            if flight!=None:
+                flight.waiters += 1
+                self._metric['coalesced'] += 1
+                leader = False
+            else:
+                flight = self._flight[key] = _Flight()
+                self._metric['miss'] += 1
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+
+            if flight.error!=None:
+                raise flight.error[0], flight.error[1], flight.error[2]
+
+            return copy.deepcopy(flight.result)
+
+        try:
+            result = func()
+
+        except:
+            flight.error = sys.exc_info()
+
+            with self._lock:
+                del self._flight[key]
+
+            flight.done.set()
+            raise
+
+        with self._lock:
+            del self._flight[key]
+            memo_ttl = self._memo_ttl
+
+        # no more waiter can join, the leader keeps the original and the others get copies of the result.
+        if flight.waiters or memo_ttl:
+            flight.result = copy.deepcopy(result)
+
+        if memo_ttl:
+            with self._lock:
+                self._keep(key, flight.result, memo_ttl)
+
+        flight.done.set()
+
+        return result
+
+
+    def _keep(self, key, result, memo_ttl):
+        now = time.time()
+
+        if len(self._memo) >= MAX_MEMO_ENTRIES:
+            for k in [ k for k, (r, expire_time) in self._memo.items() if expire_time <= now ]:
+                del self._memo[k]
+
+        if len(self._memo) < MAX_MEMO_ENTRIES:
+            self._memo[key] = ( result, now + memo_ttl )
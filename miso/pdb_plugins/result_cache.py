@@ -0,0 +1,496 @@
+'''
+\namespace miso.pdb_plugins.result_cache
+
+ Keep the query results of the shotgun session, so the sessions of the tools on a workstation ( RV, Maya, the
+ review browser ) share them rather than each downloading the same show data.
+
+ The results are keyed on the normalised query, see query_coalescer.query_key, and kept for ttl seconds.
+ Three backends:
+  1. MemoryResultCache: in process, for the threads of one session.
+  2. FileResultCache: one file per query in a local folder, shared by the processes of the workstation.
+  3. SocketResultCache: a Redis compatible server, ex: a local redis-server, shared by the processes talking to it.
+
+        cache = connect( 'file:///var/tmp/miso_result_cache', namespace='bbb', ttl=60 )
+
+        rows = cache.get( key )
+        if rows==None:
+            rows = sg.find( ... )
+            cache.set( key, rows )
+
+ The rows are stored as JSON, the dates tagged, each caller gets its own copy.  The results are data only,
+ a result written by anyone else who can reach the folder or the server can not run code in the sessions.
+ The cache folder is private to the user, a folder of the namespace owned by another user is refused.
+
+ A backend failing, ex: the server is down, is counted as a miss and logged, the query goes to shotgun.
+ See the show parameter 'result_cache' and config.result_cache to switch the shotgun sessions to a backend.
+'''
+import os, stat, time, socket, hashlib, threading, tempfile, datetime, json
+
+import miso
+
+LOG = miso.config.get_logger()
+
+# maximum number of results kept by the in process backend.
+MAX_MEMORY_ENTRIES = 5000
+
+
+class _FixedOffset(datetime.tzinfo):
+    '''
+    The utc offset of a date read back from the cache, ex: the local time zone of the shotgun api dates.
+    '''
+    def __init__(self, seconds):
+        self._offset = datetime.timedelta(seconds=seconds)
+
+    def utcoffset(self, dt):
+        return self._offset
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        return None
+
+
+def _encode_default(value):
+    '''
+    Tag the dates of the rows, the other values are JSON types.
+    '''
+    if isinstance(value, datetime.datetime):
+        offset = value.utcoffset()
+
+        return { '__datetime__':    [ value.year, value.month, value.day, 
+                                      value.hour, value.minute, value.second, value.microsecond ],
+                 'utc_offset':      offset.days * 86400 + offset.seconds if offset!=None else None }
+
+    if isinstance(value, datetime.date):
+        return { '__date__': [ value.year, value.month, value.day ] }
+
+    raise TypeError, "Can not keep %r in the result cache." % value
+
+
+def _restore(value):
+    '''
+    @return the value read back as the shotgun api returns it, the dates untagged and the text as utf-8 str.
+    '''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+
+    if isinstance(value, list):
+        return [ _restore(v) for v in value ]
+
+    if isinstance(value, dict):
+        if '__datetime__' in value:
+            result = datetime.datetime( *value['__datetime__'] )
+            if value.get('utc_offset')!=None:
+                result = result.replace( tzinfo=_FixedOffset(value['utc_offset']) )
+            return result
+
+        if '__date__' in value:
+            return datetime.date( *value['__date__'] )
+
+        return dict( [ ( _restore(k), _restore(v) ) for k, v in value.items() ] )
+
+    return value
+
+
+def dumps(rows):
+    '''
+    @return the rows as JSON text.
+    '''
+    return json.dumps( rows, default=_encode_default, separators=(',', ':') )
+
+
+def loads(data):
+    '''
+    @return the rows of the JSON text, see dumps.
+    '''
+    return _restore( json.loads(data) )
+
+
+def _digest(namespace, key):
+    '''
+    @return the text key of the query in the namespace.
+    '''
+    return '%s:%s' % ( namespace, hashlib.sha1( repr(key) ).hexdigest() )
+
+
+class ResultCache(object):
+    '''
+    The backend interface.  The subclasses store and load the results as JSON text, _load and _store, and drop 
+    the results of the namespace, _clear.
+    '''
+    def __init__(self, namespace='', ttl=60):
+        '''
+        @param namespace the results of the other namespaces are not seen, ex: the show.
+        @param ttl [optional] seconds a result is kept.
+        '''
+        self._namespace = namespace
+        self._ttl       = ttl
+        self._metric    = {'hit':0, 'miss':0, 'error':0}
+        self._lock      = threading.Lock()
+
+
+    def _count(self, counter):
+        with self._lock:
+            self._metric[counter] += 1
+
+
+    def get(self, key):
+        '''
+        @param key the query key
+        @return the rows of the query, None if not kept.
+        '''
+        try:
+            data = self._load( _digest(self._namespace, key) )
+        except Exception, e:
+            LOG.warning("Failed to read the result cache %s: %s" % (self, e))
+            self._count('error')
+            data = None
+
+        if data==None:
+            self._count('miss')
+            return None
+
+        try:
+            rows = loads(data)
+        except ValueError, e:
+            LOG.warning("Failed to read the result of the result cache %s: %s" % (self, e))
+            self._count('error')
+            return None
+
+        self._count('hit')
+
+        return rows
+
+
+    def set(self, key, rows):
+        '''
+        Keep the rows of the query for ttl seconds.
+        '''
+        try:
+            self._store( _digest(self._namespace, key), dumps(rows) )
+        except Exception, e:
+            LOG.warning("Failed to write the result cache %s: %s" % (self, e))
+            self._count('error')
+
+
+    def clear(self):
+        '''
+        Drop the kept results of the namespace, ex: after a write to the database.
+        '''
+        try:
+            self._clear()
+        except Exception, e:
+            LOG.warning("Failed to clear the result cache %s: %s" % (self, e))
+            self._count('error')
+
+
+    def metric(self):
+        '''
+        @return number of results found ( hit ), not found ( miss ), and backend failures ( error ).
+        @rtype: dict
+        '''
+        with self._lock:
+            return dict(self._metric)
+
+
+    def _load(self, digest):
+        raise NotImplementedError
+
+
+    def _store(self, digest, data):
+        raise NotImplementedError
+
+
+    def _clear(self):
+        raise NotImplementedError
+
+
+class MemoryResultCache(ResultCache):
+
+    def __init__(self, namespace='', ttl=60, max_entries=MAX_MEMORY_ENTRIES):
+        '''
+        @param max_entries [optional] the expired results are dropped once reached, new results are not kept while
+                           the cache is full.
+        '''
+        ResultCache.__init__(self, namespace, ttl)
+
+        self._max_entries   = max_entries
+        self._entry         = {}            # digest -> ( JSON rows, expire time )
+
+
+    def __repr__(self):
+        return '<MemoryResultCache %s>' % self._namespace
+
+
+    def _load(self, digest):
+        with self._lock:
+            data, expire_time = self._entry.get( digest, (None, 0) )
+
+            if data!=None and expire_time <= time.time():
+                del self._entry[digest]
+                return None
+
+            return data
+
+
+    def _store(self, digest, data):
+        with self._lock:
+            now = time.time()
+
+            if len(self._entry) >= self._max_entries:
+                for k in [ k for k, (d, expire_time) in self._entry.items() if expire_time <= now ]:
+                    del self._entry[k]
+
+            if len(self._entry) < self._max_entries:
+                self._entry[digest] = ( data, now + self._ttl )
+
+
+    def _clear(self):
+        with self._lock:
+            self._entry = {}
+
+
+class FileResultCache(ResultCache):
+    '''
+    One file per result in the folder of the namespace, written to a temporary file and renamed so the other
+    processes never read a partial result.  The expire time is the modification time of the file plus ttl.
+
+    The folder of the namespace is made readable by the user only.  A folder owned by another user, or open to
+    the others, is refused, as is a cache folder shared with the other users without the sticky bit, ex: a
+    folder of /var/tmp made by another user.
+    '''
+    def __init__(self, root, namespace='', ttl=60):
+        '''
+        @param root the cache folder, created if it doesn't exist.
+        @raise IOError the folder is not private to the user.
+        '''
+        ResultCache.__init__(self, namespace, ttl)
+
+        self._folder = os.path.join( root, hashlib.sha1(namespace).hexdigest() )
+
+        for folder, mode in [ (root, 0o755), (self._folder, 0o700) ]:
+            if not os.path.isdir(folder):
+                try:
+                    os.makedirs(folder, mode)
+                except OSError:
+                    # made by another process meanwhile
+                    if not os.path.isdir(folder):
+                        raise
+
+        self._check_owner(root, self._folder)
+
+
+    def _check_owner(self, root, folder):
+        # no file owners on windows
+        if not hasattr(os, 'getuid'):
+            return
+
+        root_stat   = os.stat(root)
+        folder_stat = os.lstat(folder)
+
+        if root_stat.st_uid!=os.getuid() and root_stat.st_mode & stat.S_IWOTH and not root_stat.st_mode & stat.S_ISVTX:
+            raise IOError, "Result cache folder %s is writable by the other users." % root
+
+        if not stat.S_ISDIR(folder_stat.st_mode) or folder_stat.st_uid!=os.getuid():
+            raise IOError, "Result cache folder %s is not owned by the user." % folder
+
+        if folder_stat.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+            raise IOError, "Result cache folder %s is open to the other users." % folder
+
+
+    def __repr__(self):
+        return '<FileResultCache %s>' % self._folder
+
+
+    def _path(self, digest):
+        return os.path.join( self._folder, digest.rsplit(':', 1)[-1] )
+
+
+    def _load(self, digest):
+        path = self._path(digest)
+
+        try:
+            if os.path.getmtime(path) + self._ttl <= time.time():
+                return None
+
+            with open(path, 'rb') as f:
+                return f.read()
+
+        except (IOError, OSError):
+            # not kept, or removed by another process meanwhile
+            return None
+
+
+    def _store(self, digest, data):
+        fd, tmp_path = tempfile.mkstemp( dir=self._folder, suffix='.tmp' )
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+
+            os.rename( tmp_path, self._path(digest) )
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+    def _clear(self):
+        for name in os.listdir(self._folder):
+            try:
+                os.remove( os.path.join(self._folder, name) )
+            except OSError:
+                pass
+
+
+class SocketResultCache(ResultCache):
+    '''
+    Client of a Redis compatible server, speaking the commands GET, SET with PX, INCR and PING.
+
+    The results of the namespace are dropped by moving the namespace generation, a counter kept on the server
+    and part of every key, the old results expire on their own.  A server which can not be reached is tried
+    again after retry_interval seconds, the queries go to shotgun meanwhile.
+    '''
+    def __init__(self, host='127.0.0.1', port=6379, namespace='', ttl=60, timeout=0.5, retry_interval=30):
+        '''
+        @param host [optional] the server host
+        @param port [optional] the server port
+        @param timeout [optional] seconds to wait for the server.
+        @param retry_interval [optional] seconds before a server which can not be reached is tried again.
+        '''
+        ResultCache.__init__(self, namespace, ttl)
+
+        self._address           = (host, port)
+        self._timeout           = timeout
+        self._retry_interval    = retry_interval
+        self._down_until        = 0
+
+        # one connection per thread
+        self._local             = threading.local()
+
+
+    def __repr__(self):
+        return '<SocketResultCache %s:%s %s>' % ( self._address + (self._namespace,) )
+
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+
+        if conn==None:
+            if time.time() < self._down_until:
+                raise IOError("Result cache server %s:%s is down." % self._address)
+
+            try:
+                sock = socket.create_connection(self._address, self._timeout)
+            except socket.error:
+                self._down_until = time.time() + self._retry_interval
+                raise
+
+            conn = self._local.conn = ( sock, sock.makefile('rb') )
+
+        return conn
+
+
+    def _command(self, *arg_list):
+        '''
+        Send the command, the arguments as RESP bulk strings.
+        @return the reply, None for the null reply.
+        '''
+        try:
+            sock, reader = self._connection()
+
+            request = [ '*%d\r\n' % len(arg_list) ]
+            for arg in arg_list:
+                arg = str(arg)
+                request.append( '$%d\r\n%s\r\n' % (len(arg), arg) )
+
+            sock.sendall( ''.join(request) )
+
+            return self._read_reply(reader)
+
+        except (socket.error, IOError, EOFError):
+            # the next command reconnects
+            self._local.conn = None
+            raise
+
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+
+        if not line:
+            raise EOFError("Result cache server closed the connection.")
+
+        kind, value = line[0], line[1:-2]
+
+        if kind=='+':
+            return value
+
+        if kind=='-':
+            raise IOError("Result cache server error: %s" % value)
+
+        if kind==':':
+            return int(value)
+
+        if kind=='$':
+            size = int(value)
+            if size < 0:
+                return None
+
+            data = reader.read(size + 2)
+            return data[:-2]
+
+        if kind=='*':
+            return [ self._read_reply(reader) for i in range(int(value)) ]
+
+        raise IOError("Unexpected reply from result cache server: %r" % line)
+
+
+    def _generation(self):
+        return self._command( 'GET', '%s:generation' % self._namespace ) or '0'
+
+
+    def _load(self, digest):
+        return self._command( 'GET', '%s:%s' % (digest, self._generation()) )
+
+
+    def _store(self, digest, data):
+        self._command( 'SET', '%s:%s' % (digest, self._generation()), data, 'PX', int(self._ttl * 1000) )
+
+
+    def _clear(self):
+        self._command( 'INCR', '%s:generation' % self._namespace )
+
+
+    def ping(self):
+        '''
+        @return True if the server answers.
+        '''
+        try:
+            return self._command('PING')=='PONG'
+        except Exception:
+            return False
+
+
+def connect(url, namespace='', ttl=60):
+    '''
+    @param url the backend, one of:
+                'memory'
+                'file:///var/tmp/miso_result_cache'
+                'redis://127.0.0.1:6379'
+    @param namespace [optional] ex: the shotgun site and show.
+    @param ttl [optional] seconds the results are kept.
+    @rtype: ResultCache
+    '''
+    if url=='memory':
+        return MemoryResultCache(namespace, ttl)
+
+    if url.startswith('file://'):
+        return FileResultCache(url[len('file://'):], namespace, ttl)
+
+    if url.startswith('redis://'):
+        host, _sep, port = url[len('redis://'):].rstrip('/').partition(':')
+
+        return SocketResultCache(host or '127.0.0.1', int(port or 6379), namespace, ttl)
+
+    raise ValueError, "Unknown result cache '%s'." % url
@@ -19,13 +19,24 @@
                              ones. 
                               
 '''
-import os, shutil, re, time, urllib, urllib2
+import os, shutil, re, time, urllib, urllib2, logging, threading, collections
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
 from pprint import pformat, pprint
  
-from shotgun_api3 import Shotgun
+try:
+    from shotgun_api3 import Shotgun, Fault
+except ImportError:
+    # without the shotgun api, only the mock shotgun can be connected, see miso.pdb_plugins.mock_shotgun
+    Shotgun = None
+    from miso.pdb_plugins.mock_shotgun import Fault
 
 import miso
 from miso import *
+from miso.query_profiler import QueryProfiler
+from miso.pdb_plugins.query_coalescer import QueryCoalescer, query_key
+from miso.pdb_plugins.connection_pool import ConnectionPool
+from miso.pdb_plugins import result_cache
 
 LOG = miso.config.get_logger()
 
@@ -33,22 +44,36 @@ LOG = miso.config.get_logger()
 DB_FIELDS = { 
                 ENT_PROJ:       ['id','sg_code','name'],                
                 ENT_SHOT:       ['code', 'id', 'name', 'sg_sequence', 'project','cut_in','cut_out',
-                                 'sg_cut_order'],
+                                 'sg_cut_order', 'updated_at'],
              
-                ENT_SEQ:        ['code','id', 'cached_display_name', 'sg_status_list', 'project','sg_assigned_to', 'shots'], 
+                ENT_SEQ:        ['code','id', 'cached_display_name', 'sg_status_list', 'project','sg_assigned_to', 'shots',
+                                 'updated_at'], 
                 
                 ENT_TASK:       ['content','id','entity','sg_task_order','step','sg_status_list','task_assignees','due_date',
-                                 'template_task','cached_display_name'],
+                                 'template_task','cached_display_name', 'updated_at'],
              
                 ENT_TASK_TYPE:  ['content','id','entity','sg_task_order','step','sg_status_list','project',
                                  'task_template.TaskTemplate.entity_type','cached_display_name', 'task_template'],
                 
                 ENT_ASSET:      ['code', 'id', 'cached_display_name', 'sg_status_list', 
-                                 'description', 'sg_asset_type'],
+                                 'description', 'sg_asset_type', 'updated_at'],
                       
                 ENT_VERSION:    ['code', 'id', 'sg_version_number', 'sg_version_type', 'description', 'created_at', 
-                                 'created_by', 'sg_status_list','sg_path','sg_task','sg_task.Task.step','entity'],
+                                 'created_by', 'sg_status_list','sg_path','sg_task','sg_task.Task.step','entity',
+                                 'updated_at'],
+                
+                ENT_USER:       ['id', 'login', 'name', 'firstname', 'lastname'],
+                
+                ENT_STATUS:     ['id', 'code', 'name', 'bg_color'],
+
+              }
+
 
+# The fields always queried, whatever fields the caller asks for, to identify the entity and its relations.
+# The version artist is part of the VersionResult summary rows.
+REQUIRED_FIELDS = {
+                ENT_SHOT:       ['code', 'id', 'sg_sequence'],
+                ENT_VERSION:    ['code', 'id', 'sg_version_number', 'sg_task', 'entity', 'created_by'],
               }
 
 
@@ -60,25 +85,80 @@ ENT_2_SG_TYPE = { ENT_SHOT: "Shot",
 
 SG_2_ENT_TYPE = dict( zip(ENT_2_SG_TYPE.values(), ENT_2_SG_TYPE.keys()))
 
+# the shotgun entity type of the frame submissions, the playblasts and renders of a version.
+SG_FRAME_SUBMISSION_TYPE = 'PublishedFile'
+
+# number of rows per page of a query, pages are fetched concurrently.
+PAGE_SIZE           = 500
+
+# maximum number of page requests in flight for one query.
+MAX_INFLIGHT_PAGES  = 4
+
+# maximum number of shotgun connections of a session, shared by its threads.
+MAX_CONNECTIONS     = 16
+
+   
+def _version_number(entity_data):
+    '''
+    @return the number of the version row, from the code when the version has no number, -1 if not found.
+    '''
+    if entity_data.get('sg_version_number')!=None:
+        return entity_data['sg_version_number']
+    
+    # some version doesn't version number 
+    ver_num = re.search('v([0-9]{2,4})', entity_data['code'] or '')
+    
+    return int(ver_num.groups()[0]) if ver_num and ver_num.groups()[0].isdigit() else -1
+
+
+def _debug_enabled():
+    '''
+    @return True if the debug messages are logged, to skip formatting them otherwise.
+    '''
+    is_enabled_for = getattr(LOG, 'isEnabledFor', None) or logging.getLogger().isEnabledFor
+    
+    return is_enabled_for(logging.DEBUG)
+
    
 class ShotgunSession:
-    # some measure of how efficient shotgun has been used
-    __db_access_metric = {}  
      
-    def __init__(self, show_config ):
+    def __init__(self, show_config, sg_class=None ):
         '''
         @param show show name
         @param url db web url
+        @param sg_class [optional] the shotgun api class, ex: the mock shotgun connection factory.
         '''                                            
         self._url   = show_config['url']
         self._admin = show_config['user']
         self._key   = show_config['key']
         
+        self._sg_class = sg_class if sg_class!=None else Shotgun
+        
+        # call count and time per shotgun function, and the record of the queries when profiling.
+        self._profiler = QueryProfiler( show_config.get('query_profiling', miso.config.query_profiling) )
+        
+        # identical concurrent queries share one round trip, and optionally the results are kept for a short time.
+        self._coalescer = None
+        if show_config.get('single_flight', miso.config.single_flight):
+            self._coalescer = QueryCoalescer( show_config.get('query_memo_ttl', miso.config.query_memo_ttl) )
+        
         proj_name = show_config.get('name')
         proj_code = show_config.get('code')
         
+        self._page_size          = show_config.get('page_size', PAGE_SIZE)
+        self._max_inflight_pages = show_config.get('max_inflight_pages', MAX_INFLIGHT_PAGES)
+        
+        # the page fetching threads, started by the first query of more than one page.
+        self._page_pool      = None
+        self._page_pool_lock = threading.Lock()
+        
         # for vanilla shotgun, use name rather project code to search for project
-        self._sg = Shotgun(self._url, self._admin, self._key)
+        self._sg = self._sg_class(self._url, self._admin, self._key)
+        
+        # the shotgun api is not thread safe, each thread takes a connection from the pool for the time of a call.
+        self._conn_pool = ConnectionPool( lambda: self._sg_class(self._url, self._admin, self._key),
+                                          max_size   = show_config.get('max_connections', MAX_CONNECTIONS),
+                                          connection = self._sg )
          
         # cache project
         if proj_name:
@@ -90,16 +170,34 @@ class ShotgunSession:
         self._show_code     = proj.get('sg_code', proj.get('name')) 
         self._show_label    = proj['name']  
         
-        self.__cached_tasks_types  = None 
+        # the query results shared with the other sessions of the show, ex: by the tools of the workstation.
+        self._result_cache = None
+        
+        cache_url = show_config.get('result_cache', miso.config.result_cache)
+        if cache_url:
+            try:
+                self._result_cache = result_cache.connect( cache_url, 
+                                                           namespace = '%s|%s' % (self._url, self._show_id),
+                                                           ttl       = show_config.get('result_cache_ttl', 
+                                                                                       miso.config.result_cache_ttl) )
+            except (IOError, OSError), e:
+                LOG.warning("Failed to open the result cache '%s', the queries go to shotgun: %s" % (cache_url, e))
+        
+        # the task types, shotgun entity type -> OrderedDict( task code -> task data ), and the time built.
+        self._task_type_catalogue   = None
+        self._task_type_time        = None
+        self._task_type_lock        = threading.Lock()
         
     def db_conn(self):
         return self._sg
     
     def _sg_func(self, func, *arg_list, **arg_hash):
-        LOG.debug("\n   <<< Calling Shotgun func '%s':" % func.__name__)
- 
-        LOG.debug(pformat(arg_list))
-        LOG.debug(pformat(arg_hash))
+        debug = _debug_enabled()
+        
+        if debug:
+            LOG.debug("\n   <<< Calling Shotgun func '%s':" % func.__name__)
+            LOG.debug(pformat(arg_list))
+            LOG.debug(pformat(arg_hash))
         
         stime = time.time()
         
@@ -107,46 +205,198 @@ class ShotgunSession:
         
         elapsed_time = (time.time()-stime)
         
-        LOG.debug( "> Query Time: %s" % elapsed_time )
-         
-        if result:
-            if type(result) in (tuple, list):
+        if type(result) in (tuple, list):
+            row_count = len(result)
+        elif type(result)==dict and 'groups' in result:
+            row_count = len(result['groups'])
+        else:
+            row_count = 1 if result else 0
+        
+        self._profiler.record( func.__name__, 
+                               arg_list[0] if arg_list else arg_hash.get('entity_type'), 
+                               arg_list[1] if len(arg_list) > 1 else arg_hash.get('filters'), 
+                               row_count, stime, elapsed_time )
+        
+        if debug:
+            LOG.debug( "> Query Time: %s" % elapsed_time )
+             
+            if not result:
+                LOG.debug("\n>>> Query with no result found.")
+            elif type(result) in (tuple, list):
                 LOG.debug( "\n>>> Result (first 1 of %s):" % len(result) )
                 LOG.debug( pformat(result[0]) )
             else:
                 LOG.debug( "\n>>> Result :" )
-                LOG.debug( pformat(result) )                    
-        else:
-            LOG.warning("\n>>> Query with no result found.")
-        
-        if func.__name__ not in ShotgunSession.__db_access_metric:
-            ShotgunSession.__db_access_metric[func.__name__] = {'call_count':1,
-                                                     'time':elapsed_time}
-        else:
-            ShotgunSession.__db_access_metric[func.__name__]['call_count'] += 1
-            ShotgunSession.__db_access_metric[func.__name__]['time'] += elapsed_time
+                LOG.debug( pformat(result) )
             
         return result    
         
     
     def db_access_metric(self):
         '''
-        @return db access metrics
+        @return db access metrics, call count and time per shotgun function.
         @rtype: dict
         '''
-        return ShotgunSession.__db_access_metric
+        return self._profiler.metric()
+    
+    
+    def query_profiler(self):
+        '''
+        @return the profiler of the queries of the session.
+        @rtype: miso.query_profiler.QueryProfiler
+        '''
+        return self._profiler
+    
+    
+    def _sg_call(self, func_name, *arg_list, **arg_hash):
+        '''
+        Call the shotgun api function with a connection of the pool.
+        @param func_name ex: find
+        '''
+        with self._conn_pool.connection() as sg:
+            return self._sg_func( getattr(sg, func_name), *arg_list, **arg_hash )
+    
+    
+    def connection_pool(self):
+        '''
+        @rtype: miso.pdb_plugins.connection_pool.ConnectionPool
+        '''
+        return self._conn_pool
+    
+    
+    def _find_page(self, origin, entity_type, filters, fields, order, page, **arg_hash):
+        '''
+        Fetch one page of the query, called from the page fetching threads.
+        @param origin the miso callers of the query, see QueryProfiler.origin
+        '''
+        with self._profiler.attribute(origin):
+            return self._sg_call( 'find', entity_type, filters, fields, 
+                                  order = order, limit = self._page_size, page = page, **arg_hash )
+    
+    
+    def _iter_find(self, entity_type, filters, fields=None, order=None, limit=None, **arg_hash):
+        '''
+        Fetch every page of the query and stream the rows back in order.
+        The first page is fetched directly, if it is full the next pages are fetched concurrently, 
+        at most MAX_INFLIGHT_PAGES requests at a time, until a page comes back short.
+        @param limit [optional] maximum number of rows, None for all the rows.
+        @return generator of the rows
+        '''
+        # fetch one extra row to tell if the limit truncates the result
+        fetch_limit = limit + 1 if limit else None 
+        
+        if fetch_limit and fetch_limit <= self._page_size:
+            page_list = [ self._sg_call( 'find', entity_type, filters, fields, 
+                                         order = order, limit = fetch_limit, **arg_hash ) ]
+        else:
+            # paging needs a stable order
+            if not order:
+                order = [{'field_name':'id','direction':'asc'}]
+            
+            page_list = self._iter_pages(entity_type, filters, fields, order, fetch_limit, **arg_hash)
+        
+        row_count = 0
+        for rows in page_list:
+            for r in rows:
+                if limit and row_count >= limit:
+                    LOG.warning("Query on '%s' reached the limit of %s rows, the result is truncated." % 
+                                                                                            (entity_type, limit))
+                    return
+                
+                row_count += 1
+                yield r
+                
+                
+    def _iter_pages(self, entity_type, filters, fields, order, limit, **arg_hash):
+        '''
+        @return generator of the pages of the query.
+        '''
+        rows = self._sg_call( 'find', entity_type, filters, fields, 
+                              order = order, limit = self._page_size, page = 1, **arg_hash )
+        yield rows
+        
+        last_page = ( (limit - 1) / self._page_size + 1 ) if limit else None
+        next_page = 2
+        
+        while len(rows) == self._page_size and (last_page==None or next_page <= last_page):
+            with self._page_pool_lock:
+                if self._page_pool==None:
+                    self._page_pool = ThreadPool(self._max_inflight_pages)
+            
+            page_num_list = range(next_page, next_page + self._max_inflight_pages)
+            if last_page!=None:
+                page_num_list = [ p for p in page_num_list if p <= last_page ]
+            
+            origin  = self._profiler.origin()
+            pending = [ self._page_pool.apply_async( self._find_page, 
+                                                     (origin, entity_type, filters, fields, order, p), arg_hash )
+                        for p in page_num_list ]
+            
+            for page_result in pending:
+                rows = page_result.get()
+                yield rows
+                
+                if len(rows) < self._page_size:
+                    return
+            
+            next_page += len(page_num_list)
+    
+    
+    def _find(self, entity_type, filters, fields=None, order=None, limit=None, use_cache=True, **arg_hash):
+        '''
+        @param use_cache [optional] False to skip the result cache, ex: for the queries of the latest updates.
+        @return all the rows of the query. Identical queries in flight at the same time are sent once.
+        '''
+        key        = query_key( entity_type, filters, fields, order, limit, **arg_hash )
+        fetch_func = lambda: list( self._iter_find( entity_type, filters, fields, order, limit, **arg_hash ) )
+        
+        if use_cache and self._result_cache!=None:
+            fetch_func = self._cached_fetch_func( key, fetch_func )
+        
+        if self._coalescer==None:
+            return fetch_func()
+        
+        return self._coalescer.call( key, fetch_func )
+    
+    
+    def _cached_fetch_func(self, key, fetch_func):
+        '''
+        @return the function answering the query from the result cache, or fetching and keeping the rows.
+        '''
+        def cached_fetch():
+            rows = self._result_cache.get(key)
+            
+            if rows==None:
+                rows = fetch_func()
+                self._result_cache.set(key, rows)
+            
+            return rows
+        
+        return cached_fetch
+    
+    
+    def result_cache(self):
+        '''
+        @return the query results shared with the other sessions, None if disabled.
+        @rtype: miso.pdb_plugins.result_cache.ResultCache
+        '''
+        return self._result_cache
     
     
-    def _find(self, *arg_list, **arg_hash):
-        return self._sg_func( self._sg.find, *arg_list, **arg_hash )
+    def query_coalescer(self):
+        '''
+        @return the single flight layer of the queries, None if disabled.
+        @rtype: miso.pdb_plugins.query_coalescer.QueryCoalescer
+        '''
+        return self._coalescer
     
         
     def _find_one(self, *arg_list, **arg_hash):
-        return self._sg_func( self._sg.find_one, *arg_list, **arg_hash )
+        return self._sg_call( 'find_one', *arg_list, **arg_hash )
     
     
     def _summarize(self, *arg_list, **arg_hash):
-        return self._sg_func( self._sg.summarize, *arg_list, **arg_hash )
+        return self._sg_call( 'summarize', *arg_list, **arg_hash )
     
 
     def resolve_sg_entity(self, entity):
@@ -162,6 +412,20 @@ class ShotgunSession:
             return None
             
         
+    def _query_fields(self, entity_type, fields=None):
+        '''
+        @param entity_type
+        @param fields [optional] the database fields asked by the caller, None for all.
+        @return the fields to query, the required fields of the entity type are always included.
+        '''
+        if fields==None:
+            return DB_FIELDS[entity_type]
+        
+        query_fields = list( REQUIRED_FIELDS.get(entity_type, ['id']) )
+        
+        return query_fields + [ f for f in fields if f not in query_fields ]
+    
+    
     def objectfy_entity(self, entity_class, entity_type, entity_id, entity_data):
         '''
         Create the entity class and decorated the class with bistro data.
@@ -181,10 +445,10 @@ class ShotgunSession:
                                  entity_code    = entity_data['code'],                              
                                  entity_data    = entity_data,
                                  
-                                 edit_in        = entity_data['cut_in'],
-                                 edit_out       = entity_data['cut_out'],
+                                 edit_in        = entity_data.get('cut_in', NOT_FETCHED),
+                                 edit_out       = entity_data.get('cut_out', NOT_FETCHED),
                                  
-                                 seq_order      = entity_data['sg_cut_order'],
+                                 seq_order      = entity_data.get('sg_cut_order', NOT_FETCHED),
                                  parent_seq_id  = entity_data['sg_sequence']['id']
                                  )       
             
@@ -208,11 +472,19 @@ class ShotgunSession:
             
         elif entity_type == ENT_USER:            
             ent = entity_class ( entity_id      = entity_id,
-                                 entity_code    = entity_data['username'],                              
+                                 entity_code    = entity_data['login'],                              
                                  entity_data    = entity_data,
                                  last_name      = entity_data['lastname'],
                                  first_name     = entity_data['firstname'],                                 
                                  )
+        
+        elif entity_type == ENT_STATUS:
+            ent = entity_class ( entity_id      = entity_id,
+                                 entity_code    = entity_data['code'],                              
+                                 entity_data    = entity_data,
+                                 label          = entity_data['name'],
+                                 colour         = entity_data['bg_color'],
+                                 )
                         
             
         elif entity_type == ENT_TASK_TYPE:
@@ -227,11 +499,7 @@ class ShotgunSession:
                                  )
             
         elif entity_type == ENT_VERSION:
-            if entity_data.get('sg_version_number')==None: # some version doesn't version number 
-                ver_num = re.search('v([0-9]{2,4})', entity_data['code'])
-                ver_num = int(ver_num.groups()[0]) if ver_num and ver_num.groups()[0].isdigit() else -1
-            else:
-                ver_num = entity_data.get('sg_version_number')
+            ver_num = _version_number(entity_data)
             
             if entity_data['entity']==None:
                 LOG.warning('Version id=%s has no associated entity. Associate to project.' % entity_data['code'])
@@ -250,10 +518,10 @@ class ShotgunSession:
                                  entity_code    = entity_data['code'],                              
                                  entity_data    = entity_data,
                                  version_num    = ver_num, 
-                                 artist         = entity_data['created_by'],         
-                                 publish_date   = entity_data['created_at'],   
-                                 description    = entity_data['description'],
-                                 status         = entity_data['sg_status_list'],
+                                 artist         = entity_data.get('created_by', NOT_FETCHED),
+                                 publish_date   = entity_data.get('created_at', NOT_FETCHED),
+                                 description    = entity_data.get('description', NOT_FETCHED),
+                                 status         = entity_data.get('sg_status_list', NOT_FETCHED),
                                  
                                  for_review     = None,
                                  task           = {'entity_type':ENT_TASK, 
@@ -272,6 +540,10 @@ class ShotgunSession:
             
         else:
             raise ObjectfyEntityError, "Entity Type '%s' currently not supported." % entity_type
+        
+        # made from a projected query, the missing fields are fetched on first read.
+        if entity_type in REQUIRED_FIELDS and not set(DB_FIELDS[entity_type]).issubset(entity_data):
+            ent._partial = True
 
         return ent
     
@@ -316,9 +588,10 @@ class ShotgunSession:
             raise KeyError, "Can not find sequence with code '%s', id '%s'" % (seq_code, seq_id) 
             
     
-    def list_shots(self, seq_obj):        
+    def list_shots(self, seq_obj, fields=None):        
         '''        
         @param sequence_obj
+        @param fields [optional] the shot fields to query, default all.
         @return list of shot objects that are in the sequence         
         '''        
         if seq_obj=='all':
@@ -326,11 +599,41 @@ class ShotgunSession:
         else:
             seq_filter = ('sg_sequence', 'is', {'type': 'Sequence', 'id': seq_obj.entity_id() } )
                     
-        result = self._find('Shot', [ seq_filter ], DB_FIELDS[ENT_SHOT] )
+        result = self._find('Shot', [ seq_filter ], self._query_fields(ENT_SHOT, fields) )
  
         return [ (r['id'], r) for r in result ]
 
 
+    def list_updated_entities(self, entity_type, since=None):
+        '''
+        List the entities of the project updated after a point in time.
+        @param entity_type one of ENT_SEQ, ENT_SHOT, ENT_ASSET, ENT_TASK, ENT_VERSION
+        @param since [optional] the 'updated_at' watermark, list all the entities of the project if None.
+        @return tuple ( watermark, search results ). The watermark is the latest 'updated_at' of the results, or since if 
+                there are no results. Each search result is a tuple ( entity_id, entity_data ) 
+                The entities updated in the same second as since are listed again, 'updated_at' is to the second.
+        '''
+        filters = [ ('project','is', {'type':'Project','id':self._show_id} ) ]
+        
+        if since!=None:
+            # an entity updated later in the second of the watermark is not greater than it.
+            filters.append( ('updated_at', 'greater_than', since - timedelta(seconds=1)) )
+            
+        result = self._find( entity_type, filters, DB_FIELDS[entity_type],
+                             order      = [{'field_name':'updated_at','direction':'asc'}],
+                             use_cache  = False )
+        
+        watermark = result[-1]['updated_at'] if result else since
+        
+        # an entity updated while the pages are read may be listed twice, keep its latest update.
+        row_hash = collections.OrderedDict()
+        for r in result:
+            row_hash.pop( r['id'], None )
+            row_hash[ r['id'] ] = r
+        
+        return watermark, row_hash.items()
+    
+    
     def list_assets(self, asset_type=None):
         '''
         @param asset_type 
@@ -352,17 +655,23 @@ class ShotgunSession:
         raise NotImplementedError
         
         
-    def list_tasks(self, entity_type=None, entity_id=None, task_id=None, query_limit=500 ):
+    def list_tasks(self, entity_type=None, entity_id=None, task_id=None, entity_meta_list=None, query_limit=None ):
         '''     
         Retrieve the tasks for an entity, or tasks that match the task_id(s)   
         @param entity_type not need.
         @param entity_id the entity of the parent asset 
         @param task_id
+        @param entity_meta_list retrieve the tasks of many entities ex:[ {'entity_type':ENT_SHOT, 'id':5 },...]
+        @param query_limit [optional] maximum number of tasks, default all.
         @return return list of task associated with the entity
         '''    
         filter = []
         if entity_type and entity_id!=None:
             filter.append( ('entity','is', {'type':ENT_2_SG_TYPE[entity_type], 'id':  entity_id } ) )
+            
+        elif entity_meta_list:
+            filter.append( ('entity','in', [ {'type':ENT_2_SG_TYPE[e['entity_type']], 'id':e['id']} 
+                                                for e in entity_meta_list ] ) )
         
         else:
             if type(task_id) == int:
@@ -389,13 +698,16 @@ class ShotgunSession:
                             end_time           = None,  
                         
                             ent_limit          = 111,
-                            ver_limit          = 500):
+                            ver_limit          = None,
+                            fields             = None):
         '''
         List the version for the entity with filters latest only (only return one record), tagged for review
         @param entity_meta_list list of entity meta dictionary ex:[ {'entity_type':ENT_SHOT, 'id':5 },...]
         @param latest_only
         @param task_code [optional] return version related to task type, can be a list
         @param query_entity_limit [optional, default=111] The limit on the entity query
+        @param ver_limit [optional] maximum number of versions, default all.
+        @param fields [optional] the version fields to query, default all.
         @param status [optional] return only marked with status.
         @type status string, list
         @param version_type [optional] 
@@ -427,13 +739,73 @@ class ShotgunSession:
         
         result = self._find('Version',
                                filters,
-                               DB_FIELDS[ENT_VERSION],
+                               self._query_fields(ENT_VERSION, fields),
                                limit   = ver_limit,
                                order   = [{'field_name':'id','direction':'desc'}] )
               
         return [ (r['id'], r) for r in result ]  
 
 
+    def latest_version_ids(self, entity_type, entity_id_list=None, task_type_code=None):
+        '''
+        The maximum version id per entity and task, summarized by the database so only one row per group 
+        comes back.  Grouped on the entity id, the entity code is not unique across sequences.
+        @param entity_type ENT_SHOT or ENT_ASSET
+        @param entity_id_list [optional] the entity ids, default all the entities of the type in the project.
+        @param task_type_code [optional] only the versions of the task types, can be list.
+        @return list of tuple ( entity id, task code, version id )
+        '''
+        assert entity_type in (ENT_ASSET, ENT_SHOT), \
+            "Currently only support querying latest for shot and assets. Given '%s'" % entity_type
+        
+        sg_type = ENT_2_SG_TYPE[entity_type]
+        filters = [ ('project','is', {'type':'Project','id':self._show_id} ) ]
+        
+        if entity_id_list!=None:
+            filters.append( ('entity','in', [ {'type':sg_type, 'id':entity_id} for entity_id in entity_id_list ]) )
+        
+        if type(task_type_code) in (str, unicode): 
+            task_type_code = [task_type_code]
+            
+        if task_type_code:
+            filters.append( ('sg_task.Task.content','in', task_type_code))
+        
+        # make assumption that id only ever goes up. Hence, higher id, the later the publish date
+        summary = self._summarize('Version', filters, 
+                                  summary_fields = [{'field':'id', 'type':'maximum'}],  
+                                  grouping       = [{'field':'entity.%s.id' % sg_type, 'type':'exact','direction':'asc'},
+                                                    {'field':'sg_task.Task.content','type':'exact','direction':'asc'}] )
+        result = []
+        
+        for ent_summary in summary.get('groups', []):
+            # the versions of the other entity types
+            if ent_summary['group_value']==None:
+                continue
+            
+            for task_summary in ent_summary.get('groups', []):
+                result.append( ( ent_summary['group_value'], task_summary['group_value'], 
+                                 task_summary['summaries']['id'] ) )
+        
+        return result
+    
+    
+    def latest_version_mark(self, entity_type, entity_id_list):
+        '''
+        The maximum version id of the entities, one number for all of them, to check cheaply that no version 
+        was published for the entities since.  Not cached, see latest_version_ids.
+        @param entity_type ENT_SHOT or ENT_ASSET
+        @param entity_id_list the entity ids
+        @return the maximum version id, None if the entities have no version.
+        '''
+        sg_type = ENT_2_SG_TYPE[entity_type]
+        filters = [ ('project','is', {'type':'Project','id':self._show_id} ),
+                    ('entity','in', [ {'type':sg_type, 'id':entity_id} for entity_id in entity_id_list ]) ]
+        
+        summary = self._summarize('Version', filters, summary_fields = [{'field':'id', 'type':'maximum'}] )
+        
+        return summary['summaries']['id']
+    
+    
     def list_versions_latest(self, entity_meta_list,
                               
                                 task_type_code     = None, 
@@ -446,78 +818,72 @@ class ShotgunSession:
                                 version_type       = None,
                                 
                                 ent_limit          = 500,
-                                ver_limit          = 1000, 
-                                include_retired    = False):
+                                ver_limit          = None, 
+                                include_retired    = False,
+                                fields             = None):
         '''
         List the version for the entity with filters latest only (only return one record), tagged for review
-        @param entity_type not used since entity_id is enough to identify entity
-        @param entity_id can be a list
-        @param latest_only
+        @param entity_meta_list list of entity meta dictionary, shots and assets can be mixed. 
+                                Default the shots and assets of the project.
         @param task_type_code [optional] return version related to task type, can be list.
         @param for_review_only [optional] return only marked for review versions.
-        @param query_entity_limit [optional, default=111] The limit on the entity query
+        @param ent_limit [optional, default=500] the number of entities summarized per query.
+        @param ver_limit [optional] maximum number of versions, default all.
+        @param fields [optional] the version fields to query, default all.
         @return version entities relating to shot or asset entity
         @rtype [ Version ] 
         '''        
-        filters = []
-         
-        filters.append( ('project','is', {'type':'Project','id':self._show_id} ))
+        ver_id_list = []
         
-        query_entity_type = None
         if entity_meta_list:
-            # build list of entities to filter
-            ent_list = []
+            id_hash = {}
             for entity_dict in entity_meta_list:
-                
-                ent_list.append( { 'type':  ENT_2_SG_TYPE[entity_dict['entity_type']], 
-                                   'id':    entity_dict['id'] } )
-                
-            filters.append( ('entity','in', ent_list) ) 
+                id_hash.setdefault( entity_dict['entity_type'], [] ).append( entity_dict['id'] )
             
-            # ensure only one entity type and entity type is one of shot or asset
-            entity_types = [ d['entity_type'] for d in entity_meta_list ]
-            assert len(set(entity_types)) == 1, \
-                "Querying for latest requires one entity_type, given %s" % set(entity_types) 
-            query_entity_type = entity_types[0]
-            assert query_entity_type in (ENT_ASSET, ENT_SHOT), \
-                "Currently only support querying latest for shot and assets. Given '%s'" % query_entity_type
+            for entity_type, entity_id_list in sorted(id_hash.items()):
+                for i in range(0, len(entity_id_list), ent_limit):
+                    ver_id_list.extend( [ ver_id for entity_id, task_code, ver_id in 
+                                            self.latest_version_ids( entity_type, entity_id_list[i:i+ent_limit], 
+                                                                     task_type_code ) ] )
+        else:
+            for entity_type in (ENT_SHOT, ENT_ASSET):
+                ver_id_list.extend( [ ver_id for entity_id, task_code, ver_id in 
+                                        self.latest_version_ids( entity_type, task_type_code=task_type_code ) ] )
         
-        if type(task_type_code) in (str, unicode): 
-            task_type_code = [task_type_code]
-            
-        if task_type_code!=None and len(task_type_code)!=0:
-            filters.append( ('sg_task.Task.content','in', task_type_code))
+        ver_id_list.sort()
         
-        # summarize and group by task and entity and summary by biggest id
-        summary = self._summarize('Version', filters, 
-                             # make assumption that id only ever goes up. Hence, higher id, the later the publish date
-                             summary_fields = [{'field':'id', 'type':'maximum'}],  
-                             grouping       = [{'field':('entity.Shot.code' 
-                                                            if query_entity_type==ENT_SHOT  
-                                                            else 'entity.Asset.code'),
-                                                'type':'exact','direction':'asc'},
-                                               {'field':'sg_task.Task.content','type':'exact','direction':'asc'}] )
-        
-        # now collect all the version ids
-        ver_id_list = []
-        if summary.has_key('groups'):
-            for ent_summary in summary['groups']: 
-                if ent_summary.has_key('groups'):
-                    for v in ent_summary['groups']:                        
-                        ver_id_list.append( v['summaries']['id'] )
-            
+        # keep the newest versions, the biggest ids.
+        if ver_limit and len(ver_id_list) > ver_limit:
+            LOG.warning("Listing the latest %s of %s versions, the result is truncated." % (ver_limit, len(ver_id_list)))
+            ver_id_list = ver_id_list[-ver_limit:]
         
         # now query for the version associate with the biggest id
         result = []
-        if ver_id_list:
-            result = self._find('Version', [ ['id', 'in', ver_id_list] ], 
-                                     DB_FIELDS[ENT_VERSION], limit   = ver_limit )       
-        
+        for i in range(0, len(ver_id_list), ent_limit):
+            result.extend( self.list_entities( ENT_VERSION, ver_id_list[i:i+ent_limit], fields=fields ) )
               
-        return [ (r['id'], r) for r in result ]  
+        return result  
 
     
     
+    def list_entities(self, entity_type, id_list, fields=None):
+        '''
+        List the entities by id, ex: to complete the partial entities.
+        @param entity_type miso entity type
+        @param id_list list of entity ids
+        @param fields [optional] the fields to query, default all.
+        @return list of tuple ( entity id, entity data )
+        '''
+        if not id_list:
+            return []
+        
+        result = self._find( ENT_2_SG_TYPE.get(entity_type, entity_type), 
+                             [ ('id', 'in', list(id_list)) ], 
+                             self._query_fields(entity_type, fields) )
+        
+        return [ (r['id'], r) for r in result ]
+    
+    
     def get_shot_audio(self, shot_entity):
         '''
         Returns the path, and the offset
@@ -585,6 +951,18 @@ class ShotgunSession:
 
         
     
+    def list_entity_codes(self, entity_type):
+        '''
+        The id and code of all the entities of the type in the project, without the other fields.
+        @param entity_type ENT_SHOT or ENT_ASSET
+        @return list of tuple ( entity id, entity code )
+        '''
+        result = self._find( ENT_2_SG_TYPE[entity_type], 
+                             [ ('project', 'is', {'type':'Project','id':self._show_id}) ], ['id', 'code'] )
+        
+        return [ (r['id'], r['code']) for r in result ]
+    
+    
     def batch_list_entities(self, entity_code=None, entity_id=None, search_query=None):
         '''
         batch get the entities
@@ -619,59 +997,126 @@ class ShotgunSession:
         '''
         Purge the cached data.
         '''
-        self.__cached_tasks_types  = None   # stores the raw assets type query from       
+        with self._task_type_lock:
+            self._task_type_catalogue = None
     
     
-    def get_status(self, status):
+    def _list_by_id_or_code(self, entity_type, code_field, id_list=None, code_list=None):
         '''
-        @return the status meta data from the status id or status code
+        @return list of tuple ( entity id, entity data ) of the entities matching either the ids or the codes.
         '''
-        return self._cached_status_types(status)
+        filters = []
+        
+        if id_list:
+            filters.append( ('id', 'in', list(id_list)) )
+        if code_list:
+            filters.append( (code_field, 'in', list(code_list)) )
+        
+        if not filters:
+            return []
+        
+        result = self._find( entity_type, filters, DB_FIELDS[entity_type], filter_operator='any' )
+        
+        return [ (r['id'], r) for r in result ]
     
     
-    def get_user(self, user):
+    def list_users(self, id_list=None, login_list=None):
         '''
-        @return the user meta data from the id or form the code
+        @param id_list [optional] the user ids
+        @param login_list [optional] the user login names
+        @return list of tuple ( user id, user data ), fetched with one query.
         '''
-        return self._cached_users(user)        
-            
+        return self._list_by_id_or_code( 'HumanUser', 'login', id_list, login_list )
     
-    def get_task_type(self, task_ent):
-        raise NotImplementedError
-
+    
+    def list_statuses(self, id_list=None, code_list=None):
+        '''
+        @param id_list [optional] the status ids
+        @param code_list [optional] the status codes, ex: 'rev'
+        @return list of tuple ( status id, status data ), fetched with one query.
+        '''
+        return self._list_by_id_or_code( 'Status', 'code', id_list, code_list )
     
     
-    def _cached_tasks_types(self, task_type_id ):
+    def get_status(self, status):
         '''
-        Return list of task types
-        @return hash 
-        '''      
-        if self.__cached_tasks_types==None:
-            result = self._find('Task',[('task_template','is_not',None)], DB_FIELDS[ENT_TASK_TYPE])
-            unique_name_list = [] 
-            self.__cached_tasks_types = {}
-            for r in result:
-                if r['content'] not in unique_name_list:
-                    unique_name_list.append(r['content'])
-                    self.__cached_tasks_types[r['content']] =  r
-        
-        if task_type_id=='all':            
-            return self.__cached_tasks_types
+        @return the status data from the status id or status code
+        '''
+        if type(status)==int:
+            result = self.list_statuses( id_list=[status] )
+        else:
+            result = self.list_statuses( code_list=[status] )
         
-        elif task_type_id in self.__cached_tasks_types:
-            return self.__cached_tasks_types[task_type_id]
+        if result:
+            return result[0][1]
+    
+    
+    def get_user(self, user):
+        '''
+        @return the user data from the id or form the code
+        '''
+        if type(user)==int:
+            result = self.list_users( id_list=[user] )
         else:
-            LOG.warning("Can not find task type of id %s." % task_type_id)
-            return None
-            
+            result = self.list_users( login_list=[user] )
         
-    def _cached_users(self, user_id ):
+        if result:
+            return result[0][1]
+            
+    
+    def get_task_type(self, task_type_code, entity_type=None):
         '''
-        @return list of user meta
+        @param task_type_code ex: 'Anm'
+        @param entity_type [optional] the entity type of the task, default any.
+        @return the task type data, None if not found.
         '''
-        raise NotImplementedError 
+        catalogue = self._task_types()
+        
+        sg_type_list = [ ENT_2_SG_TYPE[entity_type] ] if entity_type!=None else sorted(catalogue)
+        
+        for sg_type in sg_type_list:
+            if task_type_code in catalogue.get(sg_type, {}):
+                return catalogue[sg_type][task_type_code]
+        
+        LOG.warning("Can not find task type of id %s." % task_type_code)
+        return None
 
     
+    def _task_types(self, max_age=None):
+        '''
+        The task types per entity type and code, built once.  The database groups the template tasks on their 
+        entity type and code, so only one task per task type comes back rather than all the template tasks.
+        @param max_age [optional] seconds, the task types built longer ago are built again.
+        @return dict of shotgun entity type to OrderedDict( task code -> task data ), by code.
+        '''
+        with self._task_type_lock:
+            if self._task_type_catalogue!=None and ( max_age==None or time.time() - self._task_type_time <= max_age ):
+                return self._task_type_catalogue
+            
+            template_entity_type = 'task_template.TaskTemplate.entity_type'
+            
+            # the first task of each task type
+            summary = self._summarize('Task', [('task_template','is_not',None)],
+                                      summary_fields = [{'field':'id', 'type':'minimum'}],
+                                      grouping       = [{'field':template_entity_type, 'type':'exact','direction':'asc'},
+                                                        {'field':'content', 'type':'exact','direction':'asc'}] )
+            
+            task_id_list = [ task_summary['summaries']['id'] for type_summary in summary.get('groups', [])
+                                                                for task_summary in type_summary.get('groups', []) ]
+            
+            result = self._find('Task', [('id','in', task_id_list)], DB_FIELDS[ENT_TASK_TYPE]) if task_id_list else []
+            
+            catalogue = {}
+            
+            for r in sorted( result, key=lambda r: r['content'] ):
+                catalogue.setdefault( r[template_entity_type], collections.OrderedDict() )[r['content']] = r
+            
+            self._task_type_catalogue   = catalogue
+            self._task_type_time        = time.time()
+            
+            return catalogue
+            
+        
     def list_submission_types(self):
         '''
         @return list of submission types
@@ -684,40 +1129,198 @@ class ShotgunSession:
         @return a list of all the status
         @rtype [ (id, meta) ] 
         '''
-        raise NotImplementedError 
+        result = self._find( 'Status', [], DB_FIELDS[ENT_STATUS], order=[{'field_name':'id','direction':'asc'}] )
+        
+        return [ (r['id'], r) for r in result ]
     
  
-    def list_task_types(self, entity_type):
+    def list_task_types(self, entity_type, max_age=None):
         '''
-        @return a list of all task types
+        @param entity_type ENT_SHOT or ENT_ASSET
+        @param max_age [optional] seconds, the task types are queried again if built longer ago.
+        @return the task types of the entity type, by code.
         @rtype [ (id, meta) ]
         '''
-        all_task_types = self._cached_tasks_types('all')
-         
-        return [ (k, all_task_types[k]) for k in all_task_types 
-                    if all_task_types[k]['task_template.TaskTemplate.entity_type'] == ENT_2_SG_TYPE[entity_type] ]
+        return self._task_types(max_age).get( ENT_2_SG_TYPE[entity_type], {} ).items()
      
     
 
-    def set_task_status(self, task_id, status_id, user_id, tech=False):
+    def task_status_request(self, task_id, status_code, tech=False):
+        '''
+        @param task_id
+        @param status_code the status list code, ex: 'ip'
+        @param tech [optional] set the technical status rather than the normal status.
+        @return the shotgun batch request setting the task status, see batch_write.
+        '''
+        return { 'request_type':    'update',
+                 'entity_type':     'Task',
+                 'entity_id':       task_id,
+                 'data':            { 'sg_tech_status' if tech else 'sg_status_list': status_code } }
+    
+    
+    def version_request(self, task_entity, version_num, source_path, comment, user_id, date):
+        '''
+        @param task_entity
+        @type task_entity: miso.entity_factory.Task 
+        @param version_num the number of the new version
+        @param source_path
+        @param comment
+        @param user_id the artist publishing the version
+        @param date seconds since epoch
+        @return the shotgun batch request creating the version, the new version comes back with all its fields.
+        '''
+        parent      = task_entity.parent_entity()
+        
+        return { 'request_type':    'create',
+                 'entity_type':     'Version',
+                 'return_fields':   DB_FIELDS[ENT_VERSION],
+                 'data':            { 'project':            {'type':'Project', 'id':self._show_id},
+                                      'code':               '%s_%s_v%03d' % (parent.entity_code(), 
+                                                                             task_entity.entity_code(), version_num),
+                                      'sg_version_number':  version_num,
+                                      'sg_task':            {'type':'Task', 'id':task_entity.entity_id()},
+                                      'entity':             {'type':ENT_2_SG_TYPE[parent.entity_type()], 
+                                                             'id':parent.entity_id()},
+                                      'description':        comment,
+                                      'sg_path':            source_path,
+                                      'created_by':         {'type':'HumanUser', 'id':user_id},
+                                      'created_at':         datetime.fromtimestamp(date) } }
+    
+    
+    def frame_submission_request(self, 
+                                version_entity, source_path, preview_path,
+                                start_frame, end_frame,
+                                tags,
+                                submit_type, file_type,   
+                                ):
+        '''
+        @param version_entity
+        @type version_entity: miso.entity_factory.Version 
+        @param source_path
+        @param preview_path
+        @param start_frame
+        @param end_frame
+        @param tags list of tag names
+        @param submit_type one of ['playblast','occlusion_playblast','render']
+        @param file_type one of ['movie','sequence','image']
+        @return the shotgun batch request creating the frame submission.
+        '''
+        parent_meta = version_entity._parent_meta
+        
+        return { 'request_type':    'create',
+                 'entity_type':     SG_FRAME_SUBMISSION_TYPE,
+                 'data':            { 'project':            {'type':'Project', 'id':self._show_id},
+                                      'code':               '%s_%s' % (version_entity.entity_code(), submit_type),
+                                      'version':            {'type':'Version', 'id':version_entity.entity_id()},
+                                      'entity':             {'type':ENT_2_SG_TYPE[parent_meta['entity_type']],
+                                                             'id':parent_meta['id']} 
+                                                                if parent_meta['entity_type'] in ENT_2_SG_TYPE else None,
+                                      'path':               {'local_path':source_path},
+                                      'sg_preview_path':    preview_path,
+                                      'sg_first_frame':     start_frame,
+                                      'sg_last_frame':      end_frame,
+                                      'tag_list':           list(tags or []),
+                                      'sg_submit_type':     submit_type,
+                                      'sg_file_type':       file_type } }
+    
+    
+    def latest_version_number(self, task_id):
+        '''
+        The number of the latest version of the task, read from shotgun rather than the kept query results, 
+        to number the next version.
+        @return the version number, 0 if the task has no version.
+        '''
+        # make assumption that id only ever goes up, see latest_version_ids.
+        row = self._sg_call( 'find_one', 'Version', [ ('sg_task','is', {'type':'Task', 'id':task_id}) ],
+                             ['code', 'sg_version_number'], 
+                             order = [{'field_name':'id', 'direction':'desc'}] )
+        
+        return max( _version_number(row), 0 ) if row else 0
+    
+    
+    def version_ids(self, task_id, version_num):
+        '''
+        @return the ids of the versions of the task with the number, to check a new version number is not taken.
+        '''
+        row_list = self._sg_call( 'find', 'Version', [ ('sg_task','is', {'type':'Task', 'id':task_id}) ],
+                                  ['code', 'sg_version_number'] )
+        
+        return [ r['id'] for r in row_list if _version_number(r)==version_num ]
+    
+    
+    def find_written(self, request_list):
+        '''
+        Find the rows of the create requests already written, ex: the batch was written but its reply was lost.
+        A row is matched on the code, and the other text, number and entity link fields of the request.
+        @param request_list the write requests, see batch_write.
+        @return the written row per request, None for the rows not found and the updates, which are safe to 
+                send again.
+        '''
+        result = []
+        
+        for request in request_list:
+            data = request['data']
+            row  = None
+            
+            if request['request_type']=='create' and data.get('code'):
+                filters = []
+                
+                for field, value in sorted(data.items()):
+                    if isinstance(value, (basestring, int, long)):
+                        filters.append( (field, 'is', value) )
+                    
+                    elif isinstance(value, dict) and set(value.keys())==set(['type', 'id']):
+                        filters.append( (field, 'is', value) )
+                
+                row = self._sg_call( 'find_one', request['entity_type'], filters, 
+                                     request.get('return_fields') or data.keys() )
+            
+            result.append(row)
+        
+        return result
+    
+    
+    def batch_write(self, request_list):
+        '''
+        Send the write requests as one shotgun batch, all or none of them are done.  The kept query results, and 
+        the results shared with the other sessions, are dropped, they may be stale now.
+        @param request_list the requests made by task_status_request, version_request and frame_submission_request.
+        @return the written rows, in the order of the requests.
+        @raise WriteError shotgun rejected the batch, ex: invalid field.
+        '''
+        try:
+            result = self._sg_call( 'batch', requests=request_list )
+        except Fault, e:
+            raise WriteError, "Shotgun rejected the batch of %s writes: %s" % (len(request_list), e)
+        
+        if self._coalescer!=None:
+            self._coalescer.clear()
+        
+        if self._result_cache!=None:
+            self._result_cache.clear()
+        
+        return result
+    
+    
+    def set_task_status(self, task_id, status_code, tech=False):
         '''
         Set the task to the status.
         @param task_id
-        @param status_id
+        @param status_code
         @param tech status or normal        
+        @return the updated task row
         '''        
-        raise NotImplementedError
+        return self.batch_write( [ self.task_status_request(task_id, status_code, tech) ] )[0]
         
         
-        
-    def create_version(self, task_entity, source_path, comment, artist, date ):
+    def create_version(self, task_entity, version_num, source_path, comment, user_id, date ):
         '''
         @param task_entity
         @type task_entity: miso.entity_factory.Task 
-        @param source_path
-        @param artist - user code, ie pparker
+        @return the new version row
         '''   
-        raise NotImplementedError
+        return self.batch_write( [ self.version_request(task_entity, version_num, source_path, comment, 
+                                                        user_id, date) ] )[0]
         
         
 
@@ -728,15 +1331,10 @@ class ShotgunSession:
                                 submit_type, file_type,   
                                 ):
         '''
-        @param task_entity
-        @type task_entity: miso.entity_factory.Task 
-        @param source_path
-        @param artist - user code, ie pparker
+        @param version_entity
+        @type version_entity: miso.entity_factory.Version 
+        @return the new frame submission row
         '''
-
-        raise NotImplementedError
-            
-                
-        
-        
-    
\ No newline at end of file
+        return self.batch_write( [ self.frame_submission_request(version_entity, source_path, preview_path,
+                                                                 start_frame, end_frame, tags, 
+                                                                 submit_type, file_type) ] )[0]
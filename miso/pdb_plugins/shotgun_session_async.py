@@ -0,0 +1,153 @@
+'''
+\namespace miso.pdb_plugins.shotgun_session_async
+
+ Non blocking variant of the shotgun plugin, with the same method surface as ShotgunSession.
+
+ Each call is run on a worker thread and returns straight away with the pending result, so that one
+ service thread can have many shotgun requests in flight at once.  The worker threads share the
+ connection pool of the session, see max_connections.
+
+        sg = AsyncShotgunSession( miso.config.prod_db_conn_param[('bbb','prod')] )
+
+        pending = [ sg.list_versions( entity_meta_list=[{'entity_type':ENT_SHOT, 'id':shot_id}] )
+                        for shot_id in shot_id_list ]
+
+        # block until the result is back, the exception of the call is raised here.
+        ver_list = [ p.get() for p in pending ]
+
+ The pending result is multiprocessing.pool.AsyncResult: get(timeout), wait(timeout), ready(), successful().
+'''
+from multiprocessing.pool import ThreadPool
+
+import miso
+from miso.pdb_plugins.shotgun_session import ShotgunSession
+
+LOG = miso.config.get_logger()
+
+# maximum number of shotgun calls in flight.
+MAX_ASYNC_CALLS = 16
+
+# the ShotgunSession methods that query or write to shotgun, these return pending results.
+ASYNC_METHODS = [ 'list_sequences',
+                  'get_sequence',
+                  'list_shots',
+                  'list_updated_entities',
+                  'list_assets',
+                  'list_tasks',
+                  'list_versions',
+                  'list_versions_latest',
+                  'latest_version_ids',
+                  'latest_version_mark',
+                  'get_shot_audio',
+                  'get_shot',
+                  'get_asset',
+                  'list_entities',
+                  'list_entity_codes',
+                  'batch_list_entities',
+                  'get_task',
+                  'list_users',
+                  'list_statuses',
+                  'get_source_path',
+                  'get_task_type',
+                  'list_submission_types',
+                  'list_status_types',
+                  'list_task_types',
+                  'latest_version_number',
+                  'version_ids',
+                  'find_written',
+                  'batch_write',
+                  'set_task_status',
+                  'create_version',
+                  'create_frame_submission' ]
+
+
+class AsyncShotgunSession:
+
+    def __init__(self, show_config=None, session=None, sg_class=None):
+        '''
+        @param show_config the shotgun connection parameters, same as ShotgunSession.
+        @param session [optional] share an existing ShotgunSession rather than connecting again.
+        @param sg_class [optional] the shotgun api class, default the mock shotgun connection factory for the 
+                        'mock_shotgun' type of show, else the shotgun api.
+        '''
+        if session==None:
+            if sg_class==None and show_config.get('type')=='mock_shotgun':
+                from miso.pdb_plugins import mock_shotgun
+                sg_class = mock_shotgun.connector(show_config)
+            
+            session = ShotgunSession( show_config, sg_class=sg_class )
+        
+        self._session = session
+
+        max_async_calls = (show_config or {}).get('max_async_calls', MAX_ASYNC_CALLS)
+        self._pool      = ThreadPool( max_async_calls )
+
+
+    def session(self):
+        '''
+        @return the blocking ShotgunSession doing the calls.
+        '''
+        return self._session
+
+
+    def submit(self, func, *arg_list, **arg_hash):
+        '''
+        Run any function on the worker threads.
+        @return the pending result
+        @rtype: multiprocessing.pool.AsyncResult
+        '''
+        return self._pool.apply_async( func, arg_list, arg_hash )
+
+
+    def close(self):
+        '''
+        Stop the worker threads once the calls in flight are done.
+        '''
+        self._pool.close()
+        self._pool.join()
+
+
+    # the calls without database round trip stay blocking.
+    def db_conn(self):
+        return self._session.db_conn()
+
+
+    def db_access_metric(self):
+        return self._session.db_access_metric()
+
+
+    def query_profiler(self):
+        return self._session.query_profiler()
+
+
+    def get_show(self):
+        return self._session.get_show()
+
+
+    def resolve_sg_entity(self, entity):
+        return self._session.resolve_sg_entity(entity)
+
+
+    def objectfy_entity(self, entity_class, entity_type, entity_id, entity_data):
+        return self._session.objectfy_entity(entity_class, entity_type, entity_id, entity_data)
+
+
+    def clear_cached(self):
+        return self._session.clear_cached()
+
+
+def _async_method(name):
+    '''
+    @return method running the ShotgunSession method of the name on the worker threads.
+    '''
+    def method(self, *arg_list, **arg_hash):
+        return self.submit( getattr(self._session, name), *arg_list, **arg_hash )
+
+    method.__name__ = name
+    method.__doc__  = '%s\n        @return the pending result of ShotgunSession.%s' % (
+                                                        getattr(ShotgunSession, name).__doc__ or '', name )
+    return method
+
+
+for _name in ASYNC_METHODS:
+    setattr( AsyncShotgunSession, _name, _async_method(_name) )
@@ -0,0 +1,303 @@
+'''
+\namespace miso.query_profiler
+
+ The query profiler records the production database queries made by the prod_db plugin, to tell which miso
+ api is responsible for the queries.
+
+ Call count and time per database function are always counted.  Once enabled, each query is also recorded
+ with its entity type, the shape of its filters ( the filter values taken out ), the number of rows, the
+ latency, and the miso method calling the plugin.
+
+        profiler = bbb.query_profiler()
+        profiler.enable()
+
+        bbb.sequence('bunny_010').list_shots()
+
+        # count, rows, time and latency percentiles, grouped by calling miso method and query shape.
+        print profiler.report()
+
+        # load the file in chrome://tracing to see the queries on a timeline, per thread.
+        profiler.dump_chrome_trace('/var/tmp/bbb_queries.json')
+
+        profiler.disable()
+'''
+import os, sys, json, threading, collections, contextlib
+
+# latency percentiles of the summary
+PERCENTILES = [ 50, 90, 99 ]
+
+# upper bounds of the latency histogram buckets, in seconds
+HISTOGRAM_BUCKETS = [ 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0 ]
+
+# maximum number of queries recorded, the oldest ones are dropped first.
+MAX_RECORDS = 100000
+
+# The recorded query.
+# func: the database function, ex: find
+# entity_type: the queried entity type, in the database naming
+# filter_shape: the filters with the values taken out, ex: "entity in [3], project is ?"
+# row_count: number of rows returned
+# start_time: seconds since epoch
+# latency: seconds
+# caller: the miso method calling the plugin, ex: Project.list_tasks
+# api: the outermost miso method of the call, ex: Shot.task
+# thread_id
+QueryRecord = collections.namedtuple( 'QueryRecord', [ 'func', 'entity_type', 'filter_shape', 'row_count', 'start_time',
+                                                       'latency', 'caller', 'api', 'thread_id' ] )
+
+
+def filter_shape(filters):
+    '''
+    @return the filters with their values taken out, so the same query for different entities has the same shape.
+            The length of the list values is kept, ex: [('entity','in',[a, b])] -> "entity in [2]"
+    '''
+    shape_list = []
+
+    for f in filters or []:
+        if isinstance(f, dict):
+            shape_list.append( '(%s)' % filter_shape( f.get('filters') ) )
+
+        elif type(f[2]) in (list, tuple):
+            shape_list.append( '%s %s [%s]' % (f[0], f[1], len(f[2])) )
+
+        else:
+            shape_list.append( '%s %s ?' % (f[0], f[1]) )
+
+    return ', '.join( sorted(shape_list) )
+
+
+def _percentile(sorted_value_list, percent):
+    if not sorted_value_list:
+        return None
+
+    index = int( round( (len(sorted_value_list) - 1) * percent / 100.0 ) )
+
+    return sorted_value_list[index]
+
+
+class QueryProfiler:
+
+    # the modules not considered as miso callers: the plugins and the profiler itself
+    SKIPPED_MODULES = ( 'miso.pdb_plugins', 'miso.query_profiler' )
+
+    def __init__(self, enabled=False, max_records=MAX_RECORDS):
+        '''
+        @param enabled [optional] record the queries from the start.
+        @param max_records [optional] maximum number of queries recorded.
+        '''
+        self._enabled = enabled
+        self._record  = collections.deque( maxlen=max_records )
+        self._metric  = {}
+        self._lock    = threading.Lock()
+
+        # the miso caller of the queries made on behalf of another thread, ex: the page fetching threads
+        self._local   = threading.local()
+
+
+    def enable(self, flag=True):
+        '''
+        Start, or stop, recording the queries.
+        '''
+        self._enabled = flag
+
+
+    def disable(self):
+        self.enable(False)
+
+
+    def is_enabled(self):
+        return self._enabled
+
+
+    def clear(self):
+        '''
+        Forget the recorded queries, the call counts are kept.
+        '''
+        with self._lock:
+            self._record.clear()
+
+
+    def records(self):
+        '''
+        @return the recorded queries, oldest first.
+        @rtype: [ QueryRecord ]
+        '''
+        with self._lock:
+            return list(self._record)
+
+
+    def _miso_caller(self):
+        '''
+        @return tuple ( innermost, outermost ) miso method of the current call stack.
+        '''
+        caller = api = None
+
+        frame = sys._getframe(1)
+        while frame:
+            module_name = frame.f_globals.get('__name__', '')
+
+            if module_name.startswith('miso') and not module_name.startswith(QueryProfiler.SKIPPED_MODULES):
+                owner = frame.f_locals.get('self')
+                name  = '%s.%s' % (type(owner).__name__, frame.f_code.co_name) if owner!=None else frame.f_code.co_name
+
+                if caller==None:
+                    caller = name
+                api = name
+
+            frame = frame.f_back
+
+        return caller, api
+
+
+    def origin(self):
+        '''
+        @return the miso callers of the current thread, to attribute to them the queries made on their behalf by
+                other threads. None if the profiler is disabled.
+        '''
+        if not self._enabled:
+            return None
+
+        return getattr(self._local, 'origin', None) or self._miso_caller()
+
+
+    @contextlib.contextmanager
+    def attribute(self, origin):
+        '''
+        Attribute the queries of the current thread to the origin miso callers, within the with block.
+        @param origin as returned by origin()
+        '''
+        self._local.origin = origin
+        try:
+            yield
+        finally:
+            self._local.origin = None
+
+
+    def record(self, func_name, entity_type, filters, row_count, start_time, latency):
+        '''
+        Count the call, and record the query if the profiler is enabled.
+        @param func_name the database function, ex: find
+        @param entity_type
+        @param filters the query filters
+        @param row_count
+        @param start_time seconds since epoch
+        @param latency seconds
+        '''
+        query = None
+
+        if self._enabled:
+            caller, api = getattr(self._local, 'origin', None) or self._miso_caller()
+            query       = QueryRecord( func_name, entity_type, filter_shape(filters), row_count, start_time,
+                                       latency, caller, api, threading.current_thread().ident )
+
+        with self._lock:
+            if func_name not in self._metric:
+                self._metric[func_name] = {'call_count':0, 'time':0.0}
+
+            self._metric[func_name]['call_count'] += 1
+            self._metric[func_name]['time']       += latency
+
+            if query:
+                self._record.append(query)
+
+
+    def metric(self):
+        '''
+        @return call count and time per database function, ex: {'find': {'call_count':10, 'time':1.2} }
+        @rtype: dict
+        '''
+        with self._lock:
+            return dict( [ (func_name, dict(m)) for func_name, m in self._metric.items() ] )
+
+
+    def summary(self, group_by=('caller', 'func', 'entity_type', 'filter_shape')):
+        '''
+        @param group_by [optional] the QueryRecord fields to group the queries by.
+        @return list of dict, one per group, sorted by total time descending. Each has the group fields, and
+                count, rows, time, max and the latency percentiles p50, p90, p99.
+        '''
+        group_hash = collections.defaultdict(list)
+
+        for query in self.records():
+            group_hash[ tuple([ getattr(query, field) for field in group_by ]) ].append(query)
+
+        result = []
+        for key, query_list in group_hash.items():
+            latency_list = sorted([ q.latency for q in query_list ])
+
+            group = dict( zip(group_by, key) )
+            group.update( { 'count': len(query_list),
+                            'rows':  sum([ q.row_count for q in query_list ]),
+                            'time':  sum(latency_list),
+                            'max':   latency_list[-1] } )
+
+            for percent in PERCENTILES:
+                group['p%s' % percent] = _percentile(latency_list, percent)
+
+            result.append(group)
+
+        result.sort( key=lambda g: g['time'], reverse=True )
+
+        return result
+
+
+    def histogram(self, buckets=HISTOGRAM_BUCKETS, **match):
+        '''
+        @param buckets [optional] upper bounds of the latency buckets in seconds, ascending.
+        @param match [optional] only count the queries with these field values, ex: caller='Project.list_tasks'
+        @return list of tuple ( upper bound, count ), the last bucket upper bound is None for the slower queries.
+        '''
+        count_list = [ 0 ] * (len(buckets) + 1)
+
+        for query in self.records():
+            if any([ getattr(query, field)!=value for field, value in match.items() ]):
+                continue
+
+            bucket_index = len(buckets)
+            for i, upper_bound in enumerate(buckets):
+                if query.latency <= upper_bound:
+                    bucket_index = i
+                    break
+
+            count_list[bucket_index] += 1
+
+        return zip( list(buckets) + [None], count_list )
+
+
+    def report(self, limit=20):
+        '''
+        @param limit [optional] maximum number of groups reported.
+        @return text table of the most expensive queries, grouped by calling miso method and query shape.
+        '''
+        line_list = [ '%6s %8s %9s %9s %9s %-32s %s' % ('count', 'rows', 'time(s)', 'p50(ms)', 'p99(ms)', 'caller', 'query') ]
+
+        for g in self.summary()[:limit]:
+            line_list.append( '%6s %8s %9.3f %9.1f %9.1f %-32s %s %s [%s]' % (
+                                    g['count'], g['rows'], g['time'], g['p50'] * 1000, g['p99'] * 1000, g['caller'],
+                                    g['func'], g['entity_type'], g['filter_shape']) )
+
+        return '\n'.join(line_list)
+
+
+    def dump_chrome_trace(self, path):
+        '''
+        Write the recorded queries in the chrome trace event format, to be loaded in chrome://tracing
+        @param path the json file
+        '''
+        event_list = []
+
+        for q in self.records():
+            event_list.append( { 'name':    '%s %s' % (q.func, q.entity_type),
+                                 'cat':     q.caller or 'miso',
+                                 'ph':      'X',
+                                 'ts':      int(q.start_time * 1e6),
+                                 'dur':     int(q.latency * 1e6),
+                                 'pid':     os.getpid(),
+                                 'tid':     q.thread_id,
+                                 'args':    { 'filters':    q.filter_shape,
+                                              'rows':       q.row_count,
+                                              'caller':     q.caller,
+                                              'api':        q.api } } )
+
+        with open(path, 'w') as f:
+            json.dump( {'traceEvents': event_list, 'displayTimeUnit': 'ms'}, f )
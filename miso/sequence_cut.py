@@ -0,0 +1,170 @@
+'''
+\namespace miso.sequence_cut
+
+ The shots of a sequence in cut order, for the tools walking the edit shot by shot, ex: conform, playblast.
+
+ The shots are ordered by cut order ( sg_cut_order in shotgun ), then by edit in, then by code.  The neighbours
+ of a shot are found by position.
+
+ The edit ranges are indexed as sorted arrays: the edit in frames, and the running maximum of the edit out
+ frames.  The shots overlapping a frame range are found by bisecting both, and only the shots starting
+ within the candidate window are checked, shots may overlap.
+
+        cut = bbb.sequence_cut('bunny_010')
+
+        shot = cut.first_shot()
+        while shot:
+            ...
+            shot = cut.next_shot(shot)
+
+        cut.shot_at_frame(1250)
+
+        # the shots overlapping the frames, by edit in.
+        cut.shots_in_range(1050, 1250)
+
+        # the number of frames of all the shots.
+        cut.duration()
+
+ The cut is built by the project from the shots of the sequence, see Project.sequence_cut, and dropped when
+ the shots are updated.
+'''
+import bisect
+
+
+class SequenceCut:
+
+    def __init__(self, seq_id, shot_list):
+        '''
+        @param seq_id the sequence id
+        @param shot_list all the shots of the sequence, in any order.
+        '''
+        self._seq_id        = seq_id
+        self._shot_list     = sorted( shot_list, key=SequenceCut._cut_key )
+
+        # shot id -> position in the cut
+        self._position      = dict( [ (shot.entity_id(), i) for i, shot in enumerate(self._shot_list) ] )
+
+        # the shots with an edit range, by edit in.
+        edit_list           = sorted( [ (shot.edit_cut(), shot) for shot in self._shot_list
+                                            if None not in shot.edit_cut() ], key=lambda e: e[0] )
+
+        self._edit_in_list  = [ edit_in for (edit_in, edit_out), shot in edit_list ]
+        self._edit_out_list = [ edit_out for (edit_in, edit_out), shot in edit_list ]
+        self._edit_shot     = [ shot for edit_cut, shot in edit_list ]
+
+        # the maximum edit out of the shots up to each position, never decreasing so it can be bisected.
+        self._max_out_list  = []
+        for edit_out in self._edit_out_list:
+            self._max_out_list.append( max(edit_out, self._max_out_list[-1]) if self._max_out_list else edit_out )
+
+        self._duration      = sum([ edit_out - edit_in + 1 for edit_in, edit_out in
+                                        zip(self._edit_in_list, self._edit_out_list) ])
+
+
+    @staticmethod
+    def _cut_key(shot):
+        cut_order       = shot.cut_order()
+        edit_in, _out   = shot.edit_cut()
+
+        # the shots without cut order or edit in go last
+        return ( cut_order==None, cut_order, edit_in==None, edit_in, shot.entity_code() )
+
+
+    def seq_id(self):
+        return self._seq_id
+
+
+    def __len__(self):
+        return len(self._shot_list)
+
+
+    def list_shots(self):
+        '''
+        @return the shots in cut order.
+        @rtype: [ Shot ]
+        '''
+        return list(self._shot_list)
+
+
+    def first_shot(self):
+        return self._shot_list[0] if self._shot_list else None
+
+
+    def last_shot(self):
+        return self._shot_list[-1] if self._shot_list else None
+
+
+    def index(self, shot):
+        '''
+        @return the position of the shot in the cut, None if the shot is not in the sequence.
+        '''
+        return self._position.get( shot.entity_id() )
+
+
+    def _neighbour(self, shot, step):
+        position = self.index(shot)
+
+        if position==None or not 0 <= position + step < len(self._shot_list):
+            return None
+
+        return self._shot_list[position + step]
+
+
+    def prev_shot(self, shot):
+        '''
+        @return the shot before in the cut, None for the first shot.
+        @rtype: Shot
+        '''
+        return self._neighbour(shot, -1)
+
+
+    def next_shot(self, shot):
+        '''
+        @return the shot after in the cut, None for the last shot.
+        @rtype: Shot
+        '''
+        return self._neighbour(shot, 1)
+
+
+    def shots_in_range(self, start_frame, end_frame):
+        '''
+        @param start_frame the first edit frame
+        @param end_frame the last edit frame, included.
+        @return the shots which edit range overlaps the frames, ordered by edit in.
+        @rtype: [ Shot ]
+        '''
+        # the shots starting after the range can not overlap it, nor the shots before the first position
+        # where an edit out reaches the range.
+        lo = bisect.bisect_left(self._max_out_list, start_frame)
+        hi = bisect.bisect_right(self._edit_in_list, end_frame)
+
+        return [ self._edit_shot[i] for i in xrange(lo, hi) if self._edit_out_list[i] >= start_frame ]
+
+
+    def shot_at_frame(self, frame):
+        '''
+        @param frame the edit frame
+        @return the shot which edit range holds the frame, None if the frame falls between shots.
+                The shot starting last, if shots overlap at the frame.
+        @rtype: Shot
+        '''
+        shot_list = self.shots_in_range(frame, frame)
+
+        return shot_list[-1] if shot_list else None
+
+
+    def duration(self):
+        '''
+        @return the number of frames of the shots of the sequence, edit in and edit out included.
+        '''
+        return self._duration
+
+
+    def edit_range(self):
+        '''
+        @return tuple ( first edit in, last edit out ) of the sequence, None if no shot has an edit range.
+        '''
+        if not self._edit_in_list:
+            return None
+
+        return self._edit_in_list[0], self._max_out_list[-1]
@@ -0,0 +1,66 @@
+'''
+Benchmark the Project entity cache lookups.
+
+Fill the project entity cache with a growing number of shots, and time the lookup of
+shots by code and by id.  The lookup latency should stay flat as the cache grows.
+
+    python benchmark_entity_cache.py
+'''
+import time
+
+import miso
+from miso import entity_factory
+
+
+class BenchProdDb:
+    '''
+    Bare minimum prod_db plugin, only enough to objectfy shots without a database.
+    '''
+    def get_show(self):
+        return {'id': 1, 'code': 'bench', 'label': 'Benchmark'}
+
+    def objectfy_entity(self, entity_class, entity_type, entity_id, entity_data):
+        return entity_class( entity_id      = entity_id,
+                             entity_code    = entity_data['code'],
+                             entity_data    = entity_data,
+                             edit_in        = 1001,
+                             edit_out       = 1100,
+                             seq_order      = entity_id,
+                             parent_seq_id  = 1 )
+
+
+def bench_lookup(cache_size, lookup_count=2000):
+    '''
+    @param cache_size number of shots in the entity cache
+    @param lookup_count number of lookups to time
+    @return the average lookup time in micro seconds, by code and by id.
+    '''
+    proj = entity_factory.Project( BenchProdDb() )
+
+    for shot_id in range(cache_size):
+        proj._objectfy_entity( entity_type = miso.ENT_SHOT,
+                               entity_id   = shot_id,
+                               entity_data = {'code': 'sh%06d' % shot_id} )
+
+    step = max(1, cache_size / lookup_count)
+    probe_id_list = [ i * step % cache_size for i in range(lookup_count) ]
+
+    stime = time.time()
+    for shot_id in probe_id_list:
+        assert proj.shot('sh%06d' % shot_id).entity_id() == shot_id
+    by_code = (time.time() - stime) / lookup_count * 1e6
+
+    stime = time.time()
+    for shot_id in probe_id_list:
+        assert proj.shot(shot_id=shot_id).entity_id() == shot_id
+    by_id = (time.time() - stime) / lookup_count * 1e6
+
+    return by_code, by_id
+
+
+if __name__ == "__main__":
+    print "%12s %18s %18s" % ('cached', 'by code (us)', 'by id (us)')
+
+    for cache_size in [ 100, 1000, 10000, 100000 ]:
+        by_code, by_id = bench_lookup(cache_size)
+        print "%12s %18.2f %18.2f" % (cache_size, by_code, by_id)
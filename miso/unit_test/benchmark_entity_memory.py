@@ -0,0 +1,119 @@
+'''
+Benchmark the memory held by the Version entities, default entities against compact entities.
+
+Objectfy 100k versions from shotgun like rows, and measure the size of the entity objects and
+their raw data.
+
+    python benchmark_entity_memory.py
+'''
+import sys, datetime
+
+import miso
+from miso import entity_factory
+
+
+class BenchProdDb:
+    '''
+    Bare minimum prod_db plugin, only enough to objectfy versions without a database.
+    '''
+    def get_show(self):
+        return {'id': 1, 'code': 'bench', 'label': 'Benchmark'}
+
+    def objectfy_entity(self, entity_class, entity_type, entity_id, entity_data):
+        return entity_class( entity_id      = entity_id,
+                             entity_code    = entity_data['code'],
+                             entity_data    = entity_data,
+                             version_num    = entity_data['sg_version_number'],
+                             artist         = entity_data['created_by'],
+                             publish_date   = entity_data['created_at'],
+                             description    = entity_data['description'],
+                             status         = entity_data['sg_status_list'],
+                             for_review     = None,
+                             task           = {'entity_type':miso.ENT_TASK, 'id':entity_data['sg_task']['id']},
+                             department     = None,
+                             parent_meta    = {'entity_type':miso.ENT_SHOT, 'id':entity_data['entity']['id']} )
+
+
+def version_data(ver_id):
+    '''
+    @return a row like the one shotgun returns for a version.
+    '''
+    shot_id = ver_id / 100
+
+    # strings decoded from the json response are not shared between rows.
+    return { 'type':                   ''.join('Version'),
+             'id':                     ver_id,
+             'code':                   'sh%04d_anm_v%03d' % (shot_id, ver_id % 100),
+             'sg_version_number':      ver_id % 100,
+             'sg_version_type':        ''.join('playblast'),
+             'description':            ''.join('wip, camera tweak'),
+             'created_at':             datetime.datetime(2014, 1, 1),
+             'created_by':             {'type':''.join('HumanUser'), 'id':7, 'name':''.join('Pat Parker')},
+             'sg_status_list':         ''.join('rev'),
+             'sg_path':                None,
+             'sg_task':                {'type':''.join('Task'), 'id':shot_id * 10, 'name':''.join('Anm')},
+             'sg_task.Task.step':      None,
+             'entity':                 {'type':''.join('Shot'), 'id':shot_id, 'name':'sh%04d' % shot_id},
+             'updated_at':             datetime.datetime(2014, 1, 1),
+            }
+
+
+def deep_size(obj, seen=None):
+    '''
+    @return the size in bytes of the object and everything it holds, the project is not followed.
+    '''
+    if seen==None:
+        seen = set()
+
+    if id(obj) in seen or isinstance(obj, entity_factory.Project):
+        return 0
+
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum([ deep_size(k, seen) + deep_size(v, seen) for k, v in obj.iteritems() ])
+
+    elif isinstance(obj, (list, tuple)):
+        size += sum([ deep_size(v, seen) for v in obj ])
+
+    elif isinstance(obj, entity_factory.Entity):
+        if hasattr(obj, '__dict__'):
+            size += deep_size(obj.__dict__, seen)
+
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                size += deep_size(getattr(obj, name, None), seen)
+
+    return size
+
+
+def bench_memory(version_count, compact):
+    '''
+    @return the average bytes per version entity.
+    '''
+    proj = entity_factory.Project( BenchProdDb(), compact=compact )
+
+    seen = set()
+    total_size = 0
+
+    for ver_id in range(version_count):
+        ver = proj._objectfy_entity( entity_type = miso.ENT_VERSION,
+                                     entity_id   = ver_id,
+                                     entity_data = version_data(ver_id) )
+        total_size += deep_size(ver, seen)
+
+    return total_size / float(version_count)
+
+
+if __name__ == "__main__":
+    version_count = 100000
+
+    default_size = bench_memory(version_count, compact=False)
+
+    entity_factory.compact_entity_raw_fields[miso.ENT_VERSION] = ['id', 'code', 'sg_status_list', 'updated_at']
+    compact_size = bench_memory(version_count, compact=True)
+
+    print "%10s %18s %22s" % ('mode', 'bytes per version', 'MB per %sk versions' % (version_count / 1000))
+    print "%10s %18.0f %22.1f" % ('default', default_size, default_size * version_count / 1024.0 / 1024.0)
+    print "%10s %18.0f %22.1f" % ('compact', compact_size, compact_size * version_count / 1024.0 / 1024.0)
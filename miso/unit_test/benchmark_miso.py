@@ -0,0 +1,126 @@
+'''
+Benchmark the common miso workflows against the offline mock shotgun.
+
+Each workflow runs on a new project session, with a cold entity cache, and records the number of
+shotgun calls and the wall time.  The simulated latency per call makes the round trips show in the time.
+
+    python benchmark_miso.py [seq_count] [shot_count] [version_count] [latency]
+
+    python benchmark_miso.py 40 50 5 0.02
+'''
+import sys, time
+
+import miso
+from miso import entity_factory
+from miso.pdb_plugins import shotgun_session, mock_shotgun
+
+
+def bench_project(show_config):
+    '''
+    @return a new project session on the mock shotgun, and the mock show data.
+    '''
+    connector = mock_shotgun.connector(show_config)
+    proj      = entity_factory.Project( shotgun_session.ShotgunSession( show_config, sg_class = connector ) )
+
+    return proj, connector.show_data
+
+
+def list_shots(proj):
+    '''
+    List all the shots of the project, then the shots of each sequence.
+    '''
+    proj.list_shots()
+
+    for seq in proj.list_sequences():
+        seq.list_shots()
+
+
+def latest_version_per_shot(proj):
+    '''
+    The latest version of each shot of the first sequence, one shot at a time.
+    '''
+    for shot in proj.list_sequences()[0].list_shots():
+        shot.list_versions(latest_only=True)
+
+
+def latest_version_bulk(proj):
+    '''
+    The latest version of all the shots of the first sequence, in one call.
+    '''
+    shot_list = proj.list_sequences()[0].list_shots()
+
+    proj.list_versions( entity_list=shot_list, latest_only=True )
+
+
+def latest_cut(proj):
+    '''
+    The latest version of every shot of the show, then again once the versions are published for one shot.
+    '''
+    shot_list = proj.list_shots()
+
+    proj.list_versions( entity_list=shot_list, latest_only=True )
+
+    proj.latest_version_engine().invalidate( shot_list[:1] )
+    proj.list_versions( entity_list=shot_list, latest_only=True )
+
+
+def task_lookup(proj):
+    '''
+    The 'Anm' task of each shot of the first sequence.
+    '''
+    for shot in proj.list_sequences()[0].list_shots():
+        shot.task('Anm')
+
+
+def task_lookup_prefetch(proj):
+    '''
+    The 'Anm' task of each shot of the first sequence, the tasks prefetched with the shots.
+    '''
+    for shot in proj.list_sequences()[0].list_shots( prefetch=['tasks'] ):
+        shot.task('Anm')
+
+
+WORKFLOW_LIST = [ list_shots,
+                  latest_version_per_shot,
+                  latest_version_bulk,
+                  latest_cut,
+                  task_lookup,
+                  task_lookup_prefetch ]
+
+
+def bench_workflow(workflow, show_config):
+    '''
+    @return tuple ( number of shotgun calls, wall time in seconds ) of the workflow.
+    '''
+    proj, show_data = bench_project(show_config)
+
+    show_data.reset_call_count()
+
+    stime = time.time()
+    workflow(proj)
+    elapsed_time = time.time() - stime
+
+    return sum( show_data.call_count().values() ), elapsed_time
+
+
+if __name__ == "__main__":
+    arg_list = sys.argv[1:]
+
+    show_config = { 'type':             'mock_shotgun',
+                    'name':             'Big Buck Bunny',
+                    'url':              'mock://',
+                    'user':             None,
+                    'key':              None,
+                    'seq_count':        int(arg_list[0])    if len(arg_list) > 0 else 15,
+                    'shot_count':       int(arg_list[1])    if len(arg_list) > 1 else 20,
+                    'version_count':    int(arg_list[2])    if len(arg_list) > 2 else 3,
+                    'latency':          float(arg_list[3])  if len(arg_list) > 3 else 0.01 }
+
+    print "show: %(seq_count)s sequences x %(shot_count)s shots x %(version_count)s versions, " \
+          "latency %(latency)ss per call" % show_config
+
+    print "%26s %12s %12s" % ('workflow', 'calls', 'time (s)')
+
+    for workflow in WORKFLOW_LIST:
+        call_count, elapsed_time = bench_workflow(workflow, show_config)
+        print "%26s %12s %12.3f" % (workflow.__name__, call_count, elapsed_time)
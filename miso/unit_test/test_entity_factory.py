@@ -1,8 +1,11 @@
 from pprint import pprint, pformat
 
-import unittest, os, sys, logging
+import unittest, os, sys, logging, tempfile, shutil, threading, datetime, hashlib, sqlite3, json
 import miso
 import miso.config
+from miso import entity_factory
+from miso.entity_snapshot import EntitySnapshot
+from miso.entity_cache import EntityCache
 
 LOG = miso.config.get_logger()
 
@@ -23,6 +26,7 @@ class TestProdb(unittest.TestCase):
         test finish, clean up any dummy files
         '''
         print "DB Access Summary: ", pformat(self.proj.db_access_metric())
+        print "Entity Cache Summary: ", pformat(self.proj.cache_metric())
         
 
     def test_list_sequences(self):
@@ -79,12 +83,253 @@ class TestProdb(unittest.TestCase):
         
         
         
+    def test_get_cached_shot_by_code(self):
+        shot_list = self.proj.list_shots('bunny_010')
+        
+        find_count = self.proj.db_access_metric()['find']['call_count']
+        
+        # shot already cached by the list, lookup by code should not query the database
+        shot = self.proj.shot( shot_list[0].entity_code() )
+        
+        assert shot==shot_list[0]
+        assert self.proj.db_access_metric()['find']['call_count'] == find_count
+        
+        
+    def test_cache_policy(self):
+        self.proj.clear_cache()
+        self.proj.set_cache_policy(miso.ENT_SHOT, max_entries=2)
+        
+        try:
+            shot_list = self.proj.list_shots('bunny_010')
+            
+            metric = self.proj.cache_metric()[miso.ENT_SHOT]
+            
+            assert metric['size'] == min(2, len(shot_list))
+            assert metric['eviction'] >= len(shot_list) - 2
+            
+            # the most recently cached shot is still cached, and is a hit
+            hit_count = metric['hit']
+            self.proj.shot( shot_id = shot_list[-1].entity_id() )
+            
+            assert self.proj.cache_metric()[miso.ENT_SHOT]['hit'] == hit_count + 1
+            
+            # an expired entity found by code is one miss
+            cache = EntityCache( {miso.ENT_SHOT: {'max_age':-1}} )
+            cache.put( miso.ENT_SHOT, shot_list[0].entity_id(), shot_list[0] )
+            
+            assert cache.find_by_code( miso.ENT_SHOT, shot_list[0].entity_code() ) == []
+            assert cache.metric()[miso.ENT_SHOT]['miss'] == 1
+            assert cache.metric()[miso.ENT_SHOT]['expired'] == 1
+            
+        finally:
+            self.proj.set_cache_policy(miso.ENT_SHOT)
+        
+        # without bounds the type is unbounded again
+        assert self.proj._entity_cache.policy(miso.ENT_SHOT) == None
+        
+        
+    def test_snapshot(self):
+        snapshot_dir = tempfile.mkdtemp()
+        
+        try:
+            snapshot = EntitySnapshot( os.path.join(snapshot_dir, 'bbb.sqlite') )
+            
+            # first session fetch all and fill the snapshot
+            proj = entity_factory.Project( self.proj._prod_db, snapshot )
+            shot_list = proj.list_shots('bunny_010')
+            
+            assert snapshot.watermark(miso.ENT_SHOT) != None
+            
+            # the snapshot keeps data only, the rows are JSON text
+            conn = sqlite3.connect( snapshot.path() )
+            try:
+                entity_data = conn.execute( 'SELECT entity_data FROM entity LIMIT 1' ).fetchone()[0]
+            finally:
+                conn.close()
+            
+            assert json.loads(entity_data)
+            
+            # second session start warm from the snapshot
+            warm_proj = entity_factory.Project( self.proj._prod_db, snapshot )
+            
+            find_count = warm_proj.db_access_metric()['find']['call_count']
+            
+            warm_shot_list = warm_proj.list_shots('bunny_010')
+            
+            assert [ s.entity_id() for s in warm_shot_list ] == [ s.entity_id() for s in shot_list ]
+            assert warm_proj.db_access_metric()['find']['call_count'] == find_count, \
+                    "Listing shots of a warm project should not query database."
+        
+        finally:
+            shutil.rmtree(snapshot_dir)
+        
+        
+    def _mock_session(self, **param):
+        '''
+        @return a shotgun session on a small mock show of its own, for the tests adding to the show data.
+        '''
+        from miso.pdb_plugins import shotgun_session, mock_shotgun
+        
+        show_config = dict( miso.config.prod_db_conn_param[('bbb','prod')], **param )
+        
+        return shotgun_session.ShotgunSession( show_config, sg_class=mock_shotgun.connector(show_config) )
+        
+        
+    def test_snapshot_refresh(self):
+        session      = self._mock_session( seq_count=2, shot_count=3 )
+        show_data    = session._sg_class.show_data
+        snapshot_dir = tempfile.mkdtemp()
+        
+        try:
+            snapshot = EntitySnapshot( os.path.join(snapshot_dir, 'bbb.sqlite') )
+            entity_factory.Project( session, snapshot )
+            
+            proj      = entity_factory.Project( session, snapshot )
+            seq       = proj.list_sequences()[0]
+            shot_list = seq.list_shots()
+            
+            new_code  = show_data.rows('Shot')[0]['code'] + '_new'
+            assert proj.batch_list_entities( entity_code_list=[ new_code ] ) == []
+            
+            # another session adds a shot, updated in the same second as the watermark.
+            shot_row = show_data.rows('Shot')[0]
+            show_data.add_row( 'Shot', dict( shot_row, id   = show_data.new_id('Shot'), 
+                                                       code = shot_row['code'] + '_new',
+                                                       name = shot_row['code'] + '_new' ) )
+            
+            # the cached shots are trusted for the refresh interval
+            assert seq.list_shots() == shot_list
+            
+            entity_factory.mirror_refresh_interval = 0
+            try:
+                assert [ s.entity_code() for s in seq.list_shots() ] == \
+                        sorted( [ s.entity_code() for s in shot_list ] + [ shot_row['code'] + '_new' ] )
+                
+                # the shots of the last second of the watermark are not listed as updated again
+                assert proj.sync( [miso.ENT_SHOT] ) == []
+                
+                assert [ s.entity_code() for s in proj.batch_list_entities( entity_code_list=[ new_code ] ) ] == \
+                        [ new_code ]
+            finally:
+                entity_factory.mirror_refresh_interval = miso.config.mirror_refresh_interval
+        
+        finally:
+            shutil.rmtree(snapshot_dir)
+        
+        
+    def test_sync(self):
+        shot = self.proj.shot('bunny_010_0010')
+        
+        # first sync fetch all the shots, and patch the cached shot in place
+        self.proj.sync( [miso.ENT_SHOT] )
+        
+        assert self.proj.shot('bunny_010_0010') is shot
+        
+        # nothing updated since, only shots updated after the previous sync are returned
+        for updated_shot in self.proj.sync( [miso.ENT_SHOT] ):
+            assert updated_shot.entity_type() == miso.ENT_SHOT
+        
+        
+    def test_sync_rename(self):
+        session   = self._mock_session( seq_count=1, shot_count=2 )
+        show_data = session._sg_class.show_data
+        proj      = entity_factory.Project( session )
+        
+        proj.sync( [miso.ENT_SHOT] )
+        shot     = proj.list_shots()[0]
+        old_code = shot.entity_code()
+        
+        # another session renames the shot
+        shot_row = show_data.row( 'Shot', shot.entity_id() )
+        show_data.update_row( 'Shot', shot.entity_id(), 
+                              { 'code':         old_code + '_rename',
+                                'updated_at':   max([ r['updated_at'] for r in show_data.rows('Shot') ]) + 
+                                                datetime.timedelta(seconds=2) } )
+        
+        assert proj.sync( [miso.ENT_SHOT] ) == [ shot ]
+        assert shot.entity_code() == old_code + '_rename'
+        
+        # the shot is only found under its new code
+        assert proj._entity_cache.find_by_code( miso.ENT_SHOT, old_code + '_rename' ) == [ shot ]
+        assert proj._entity_cache.find_by_code( miso.ENT_SHOT, old_code ) == []
+        
+        
     def test_get_shot_cut(self):
         shot = self.proj.shot('bunny_010_0010')
         assert type( shot.edit_cut() ) in (tuple, list)
         
+        
+    def test_sequence_cut(self):
+        seq = self.proj.sequence('bunny_010')
+        cut = seq.cut()
+        
+        shot_list = cut.list_shots()
+        assert sorted(shot_list) == sorted( seq.list_shots() )
+        assert [ s.cut_order() for s in shot_list ] == sorted([ s.cut_order() for s in shot_list ])
+        
+        # walk the cut without querying
+        find_count = self.proj.db_access_metric()['find']['call_count']
+        
+        shot = cut.first_shot()
+        walked = []
+        while shot:
+            walked.append(shot)
+            shot = shot.next_shot()
+        
+        assert walked == shot_list
+        assert walked[1].prev_shot() is walked[0] and walked[0].prev_shot() == None
+        
+        edit_in, edit_out = walked[1].edit_cut()
+        assert seq.shot_at_frame(edit_in) is walked[1] and seq.shot_at_frame(edit_out) is walked[1]
+        assert cut.shot_at_frame( cut.edit_range()[0] - 1 ) == None
+        
+        assert self.proj.db_access_metric()['find']['call_count'] == find_count
+        
+        
+    def test_shots_in_range(self):
+        seq       = self.proj.sequence('bunny_020')
+        shot_list = seq.list_shots()
+        
+        first_in, last_out = seq.cut().edit_range()
+        
+        for start_frame, end_frame in [ (first_in - 10, first_in), (first_in + 50, first_in + 250), 
+                                        (last_out, last_out + 10), (last_out + 1, last_out + 10) ]:
+            expected = [ s for s in shot_list if s.edit_cut()[0] <= end_frame and s.edit_cut()[1] >= start_frame ]
+            
+            assert sorted(seq.shots_in_range(start_frame, end_frame)) == sorted(expected)
+        
+        assert seq.cut_duration() == sum([ s.edit_cut()[1] - s.edit_cut()[0] + 1 for s in shot_list ])
+        assert self.proj.cut_duration()['bunny_020'] == seq.cut_duration()
+        
 
 
+    def test_batch_list_entities(self):
+        self.proj.clear_cache()
+        
+        code_list = [ 'Fern', 'bunny_020_0010', 'Alice', 'no_such_entity' ]
+        
+        result = self.proj.batch_list_entities( entity_code_list=code_list )
+        assert [ e.entity_code() for e in result ] == code_list[:3]
+        
+        # the searches are answered from the code index, the entities from cache
+        find_count = self.proj.db_access_metric()['find']['call_count']
+        
+        assert [ e.entity_code() for e in self.proj.batch_list_entities( search_query='^bunny_020_001' ) ] == \
+                                                                                    [ 'bunny_020_0010' ]
+        assert [ e.entity_code() for e in self.proj.batch_list_entities( search_query='e' ) ] == [ 'Alice', 'Apple', 'Fern' ]
+        assert self.proj.db_access_metric()['find']['call_count'] == find_count + 1
+        
+        # the ids are per entity type
+        shot_id_list = [ s.entity_id() for s in self.proj.list_shots('bunny_010')[:2] ]
+        
+        assert self.proj.batch_list_entities( entity_id_list=shot_id_list[::-1], entity_type=miso.ENT_SHOT ) == \
+                    self.proj.list_shots('bunny_010')[:2][::-1]
+        assert self.proj.batch_list_entities( entity_id_list=[ result[0].entity_id() ], entity_type=miso.ENT_ASSET ) == \
+                    [ result[0] ]
+        
+        self.assertRaises( AssertionError, self.proj.batch_list_entities, entity_id_list=[ result[0].entity_id() ] )
+        
+        
     def test_list_assets(self):
         char = self.proj.list_assets('Character')[0]
 
@@ -116,6 +361,243 @@ class TestProdb(unittest.TestCase):
      
         
         
+    def test_prefetch_tasks(self):
+        self.proj.clear_cache()
+        
+        shot_list = self.proj.sequence('bunny_010').list_shots( prefetch=['tasks'] )
+        
+        find_count = self.proj.db_access_metric()['find']['call_count']
+        
+        # tasks of all the shots were fetched with the shots, no more query
+        for shot in shot_list:
+            assert shot.task('Anm').parent_entity() == shot
+        
+        assert self.proj.db_access_metric()['find']['call_count'] == find_count
+        
+        # the parents are chunked, one query per HYDRATE_BATCH_SIZE parents
+        self.proj.clear_cache()
+        shot_list  = self.proj.sequence('bunny_020').list_shots()
+        batch_size = entity_factory.Project.HYDRATE_BATCH_SIZE
+        
+        entity_factory.Project.HYDRATE_BATCH_SIZE = 8
+        try:
+            find_count = self.proj.db_access_metric()['find']['call_count']
+            self.proj.prefetch_tasks(shot_list)
+            
+            assert self.proj.db_access_metric()['find']['call_count'] == find_count + (len(shot_list) + 7) / 8
+            assert shot_list[-1].task('Anm').parent_entity() == shot_list[-1]
+        finally:
+            entity_factory.Project.HYDRATE_BATCH_SIZE = batch_size
+        
+        
+    def test_query_profiler(self):
+        self.proj.clear_cache()
+        
+        profiler = self.proj.query_profiler()
+        profiler.clear()
+        profiler.enable()
+        
+        try:
+            for shot in self.proj.sequence('bunny_010').list_shots():
+                shot.task('Anm')
+        finally:
+            profiler.disable()
+        
+        # the task queries are attributed to the miso method making them
+        task_query = [ g for g in profiler.summary() if g['entity_type']=='Task' ][0]
+        
+        assert task_query['caller'] == 'Project.prefetch_tasks'
+        assert task_query['filter_shape'] == 'entity in [1]'
+        assert task_query['count'] == len( self.proj.sequence('bunny_010').list_shots() )
+        
+        assert sum([ count for upper_bound, count in profiler.histogram() ]) == len( profiler.records() )
+        
+        LOG.info( profiler.report() )
+        
+        trace_dir = tempfile.mkdtemp()
+        try:
+            profiler.dump_chrome_trace( os.path.join(trace_dir, 'trace.json') )
+        finally:
+            shutil.rmtree(trace_dir)
+        
+        
+    def test_query_memo(self):
+        coalescer = self.proj._prod_db.query_coalescer()
+        coalescer.set_memo_ttl(60)
+        
+        try:
+            shot_meta = [ {'entity_type':miso.ENT_SHOT, 'id':self.proj.shot('bunny_010_0010').entity_id()} ]
+            
+            ver_list  = self.proj._prod_db.list_versions( entity_meta_list=shot_meta )
+            
+            find_count = self.proj.db_access_metric()['find']['call_count']
+            
+            # the identical query is answered from the kept result
+            assert self.proj._prod_db.list_versions( entity_meta_list=shot_meta ) == ver_list
+            assert self.proj.db_access_metric()['find']['call_count'] == find_count
+            
+        finally:
+            coalescer.set_memo_ttl(0)
+        
+        
+    def test_result_cache(self):
+        from miso.pdb_plugins import shotgun_session, mock_shotgun
+        from miso.pdb_plugins.mock_result_server import MockResultServer
+        from miso.pdb_plugins import result_cache
+        
+        cache_dir = tempfile.mkdtemp()
+        server    = MockResultServer()
+        server.start()
+        
+        try:
+            for cache_url in [ 'memory', 'file://%s' % cache_dir, 'redis://127.0.0.1:%s' % server.port() ]:
+                show_config = dict( miso.config.prod_db_conn_param[('bbb','prod')], result_cache=cache_url )
+                
+                # the tools of a workstation, each with its own session.
+                session_list = [ shotgun_session.ShotgunSession( show_config, sg_class=mock_shotgun.connector(show_config) ) 
+                                    for i in range(2) ]
+                
+                # the in process cache is not shared by the sessions.
+                if cache_url=='memory':
+                    session_list[1]._result_cache = session_list[0].result_cache()
+                
+                shot_list = session_list[0].list_shots('all')
+                
+                find_count = lambda: session_list[1].db_access_metric().get('find', {}).get('call_count', 0)
+                
+                assert session_list[1].list_shots('all') == shot_list
+                assert find_count() == 0, "The query should be answered by the shared cache of %s." % cache_url
+                
+                # dropped by a write, ex: of the other session.
+                session_list[0].result_cache().clear()
+                
+                session_list[1].list_shots('all')
+                assert find_count() == 1
+        
+            # the server gone, the queries go to shotgun.
+            server.stop()
+            
+            session_list[1].list_shots('all')
+            assert session_list[1].result_cache().metric()['error'] > 0
+            
+            # the results are data only, the dates are read back as kept.
+            row_list = [ {'id':1, 'code':'bunny_010_0010', 'updated_at':datetime.datetime(2014, 1, 1, 10, 30, 5, 12),
+                          'sg_sequence':{'type':'Sequence', 'id':1, 'name':u'bunny_010'}, 'tag_list':[] } ]
+            
+            assert result_cache.loads( result_cache.dumps(row_list) ) == row_list
+            
+            # a folder of the namespace open to the others is refused, ex: made by another user beforehand.
+            other_dir = os.path.join( cache_dir, hashlib.sha1('other').hexdigest() )
+            os.mkdir(other_dir)
+            os.chmod(other_dir, 0o777)
+            
+            self.assertRaises( IOError, result_cache.FileResultCache, cache_dir, 'other' )
+            
+        finally:
+            server.stop()
+            shutil.rmtree(cache_dir)
+        
+        
+    def test_concurrent_project(self):
+        self.proj.clear_cache()
+        
+        result = []
+        
+        def worker():
+            proj = miso.get_project('bbb')
+            result.append( (proj, proj.shot('bunny_010_0010'), proj.sequence('bunny_010').list_shots()) )
+        
+        thread_list = [ threading.Thread(target=worker) for i in range(8) ]
+        
+        for t in thread_list:
+            t.start()
+        for t in thread_list:
+            t.join()
+        
+        assert len(result) == 8
+        
+        # one project session, and one object per entity across the threads
+        for proj, shot, shot_list in result:
+            assert proj is self.proj
+            assert shot is result[0][1]
+            assert [ id(s) for s in shot_list ] == [ id(s) for s in result[0][2] ]
+        
+        created, idle = self.proj._prod_db.connection_pool().size()
+        assert created == idle
+        
+        
+    def test_async_project(self):
+        async_proj = miso.get_async_project('bbb')
+        
+        shot_code_list = [ 'bunny_010_0010', 'bunny_020_0010', 'bunny_030_0010' ]
+        
+        shot_list = async_proj.gather( [ async_proj.shot(shot_code) for shot_code in shot_code_list ] )
+        
+        assert [ shot.entity_code() for shot in shot_list ] == shot_code_list
+        
+        # the facade shares the project session and its cache
+        assert shot_list[0] is self.proj.shot('bunny_010_0010')
+        
+        ver_list = async_proj.submit( shot_list[0].task('Anm').list_versions ).get(timeout=60)
+        assert ver_list.filter(version=1)
+        
+        
+    def test_async_session(self):
+        from miso.pdb_plugins.shotgun_session_async import AsyncShotgunSession
+        
+        sg = AsyncShotgunSession( dict( miso.config.prod_db_conn_param[('bbb','prod')], type='mock_shotgun' ) )
+        
+        try:
+            seq_list = sg.list_sequences().get(timeout=60)
+            assert [ seq_id for seq_id, seq_data in seq_list ] == \
+                    [ seq_id for seq_id, seq_data in self.proj._prod_db.list_sequences() ]
+            
+            # the calls are in flight at the same time, the results in the order of the calls
+            pending_list = [ sg.list_tasks( entity_type=miso.ENT_SHOT, entity_id=shot.entity_id() ) 
+                                for shot in self.proj.list_shots('bunny_010') ]
+            
+            for shot, pending in zip( self.proj.list_shots('bunny_010'), pending_list ):
+                assert set([ task_data['entity']['id'] for task_id, task_data in pending.get(timeout=60) ]) == \
+                        set([ shot.entity_id() ])
+        finally:
+            sg.close()
+        
+        
+    def test_list_versions_fields(self):
+        self.proj.clear_cache()
+        
+        shot_list = self.proj.sequence('bunny_010').list_shots()
+        ver_list  = self.proj.list_versions( shot_list, fields=['sg_status_list'] )
+        
+        assert ver_list and all([ ver.is_partial() for ver in ver_list ])
+        
+        # the first read of a field not fetched completes all the partial versions with one query
+        find_count = self.proj.db_access_metric()['find']['call_count']
+        
+        ver_list[0].description()
+        
+        assert self.proj.db_access_metric()['find']['call_count'] == find_count + 1
+        assert not any([ ver.is_partial() for ver in ver_list ])
+        
+        [ ver.artist() for ver in ver_list ]
+        assert self.proj.db_access_metric()['find']['call_count'] == find_count + 1
+
+        # the threads reading partial versions of the same batch share its query
+        proj      = entity_factory.Project( self._mock_session(latency=0.1) )
+        ver_list  = proj.list_versions( proj.sequence('bunny_010').list_shots(), fields=['sg_status_list'] )
+        
+        find_count  = proj.db_access_metric()['find']['call_count']
+        thread_list = [ threading.Thread( target=ver.description ) for ver in ver_list[:4] ]
+        
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        
+        assert proj.db_access_metric()['find']['call_count'] == find_count + 1
+        assert not any([ ver.is_partial() for ver in ver_list ])
+        
+        
     def test_get_asset(self):
         asset_obj = self.proj.asset('Alice', asset_type = 'Character')
         asset_obj = self.proj.asset('Fern')
@@ -145,6 +627,34 @@ class TestProdb(unittest.TestCase):
         tt_asset = self.proj.list_task_types( miso.ENT_ASSET )
         
         LOG.info( "Asset task types: %s" % [ t.entity_code() for t in tt_asset ] ) 
+        
+        assert [ t.entity_code() for t in tt_shot ] == ['Anm', 'Light', 'snd']
+        assert [ t.entity_code() for t in tt_asset ] == ['Mod', 'Rig']
+        
+        # the catalogue is built once, the task type of a task is found by its parent entity type.
+        find_count = self.proj.db_access_metric()['find']['call_count']
+        
+        assert self.proj.list_task_types(miso.ENT_SHOT) == tt_shot
+        assert self.proj.shot('bunny_010_0010').task('Light').task_type() is tt_shot[1]
+        assert self.proj.db_access_metric()['find']['call_count'] == find_count
+        
+        # a new session loads the catalogue from the local snapshot.
+        snapshot_dir = tempfile.mkdtemp()
+        
+        try:
+            snapshot = EntitySnapshot( os.path.join(snapshot_dir, 'bbb.sqlite') )
+            entity_factory.Project( self.proj._prod_db, snapshot ).list_task_types(miso.ENT_ASSET)
+            
+            self.proj._prod_db.clear_cached()
+            
+            warm_proj       = entity_factory.Project( self.proj._prod_db, snapshot )
+            summarize_count = warm_proj.db_access_metric()['summarize']['call_count']
+            
+            assert [ t.entity_code() for t in warm_proj.list_task_types(miso.ENT_ASSET) ] == ['Mod', 'Rig']
+            assert warm_proj.db_access_metric()['summarize']['call_count'] == summarize_count
+        
+        finally:
+            shutil.rmtree(snapshot_dir)
                
         
         
@@ -163,6 +673,55 @@ class TestProdb(unittest.TestCase):
         assert asset_ver.parent().entity_code() == 'Buck'    
 
 
+    def test_list_versions_paged(self):
+        shot = self.proj.shot('bunny_010_0010')
+        
+        ver_id_list = sorted([ v.entity_id() for v in shot.list_versions() ])
+        
+        # fetch again in pages of 2 rows, the result should be complete
+        page_size = self.proj._prod_db._page_size
+        self.proj._prod_db._page_size = 2
+        
+        try:
+            paged_ver_id_list = sorted([ v.entity_id() for v in shot.list_versions() ])
+        finally:
+            self.proj._prod_db._page_size = page_size
+        
+        assert paged_ver_id_list == ver_id_list
+        
+
+    def test_list_versions_lazy(self):
+        shot_list = self.proj.list_shots('bunny_010')
+        
+        result      = self.proj.list_versions( shot_list )
+        lazy_result = self.proj.list_versions( shot_list, lazy=True )
+        
+        assert len(lazy_result) == len(result)
+        
+        # page through the lazy result
+        page_ver_list = []
+        for page in lazy_result.pages(5):
+            assert len(page) <= 5
+            page_ver_list += [ v for v in page ]
+        
+        assert [ v.entity_id() for v in page_ver_list ] == [ v.entity_id() for v in result ]
+        assert lazy_result.list_tasks() == result.list_tasks()
+        assert len(lazy_result[:3]) == min(3, len(result))
+        
+
+    def test_filter_versions(self):
+        result = self.proj.list_versions( self.proj.list_shots('bunny_010') )
+        
+        for entity_code in result.list_entities():
+            for task_code in result.list_tasks():
+                expected = [ v for v in result if v.parent().entity_code()==entity_code and 
+                                                  v.task() and v.task().entity_code()==task_code ]
+                
+                assert ( result.filter(entity_code=entity_code, task_code=task_code) or [] ) == expected
+        
+        assert result.filter(entity_code='no_such_entity') == None
+        
+
     def test_list_latest_versions(self):
         latest_result = self.proj.shot('bunny_150_0200').list_versions(latest_only=True)
         
@@ -174,7 +733,127 @@ class TestProdb(unittest.TestCase):
         
         assert anm_latest_ver.version() == latest_result.filter(task_code='Anm')[0].version()
         
+        # a version limit keeps the newest of the latest versions
+        shot_meta   = [ {'entity_type': miso.ENT_SHOT, 'id': self.proj.shot('bunny_150_0200').entity_id()} ]
+        latest_ids  = sorted([ v.entity_id() for v in latest_result ])
+        limited_ids = [ ver_id for ver_id, ver_data in self.proj._prod_db.list_versions_latest( shot_meta, ver_limit=2 ) ]
+        
+        assert sorted(limited_ids) == latest_ids[-2:]
+        
+
+    def test_batch_lookup(self):
+        self.proj.clear_cache()
+        
+        ver_list = self.proj.list_versions( self.proj.sequence('bunny_010').list_shots() )
+        
+        find_count = self.proj.db_access_metric()['find']['call_count']
+        
+        # the task, artist and status of each row of the version table
+        row_list = [ ( ver.task().entity_code(), ver.artist(as_string=False).entity_code(), ver.status().label() ) 
+                        for ver in ver_list ]
+        
+        # the tasks are fetched with the versions, the artists and the statuses with one query each
+        assert self.proj.db_access_metric()['find']['call_count'] == find_count + 2
+        assert row_list[0][1:] == ( 'pparker', 'Pending Review' )
+        
+        status_list = self.proj.get_statuses( [ 'apr', self.proj.get_status('rev').entity_id(), 'no_such_status' ] )
+        
+        assert [ s and s.entity_code() for s in status_list ] == [ 'apr', 'rev', None ]
+        
+        
+    def test_latest_version_engine(self):
+        engine = self.proj.latest_version_engine()
+        engine.invalidate()
+        
+        # shots and assets mixed, in more chunks than workers
+        entity_list = self.proj.list_shots() + [ self.proj.asset('Alice'), self.proj.asset('Fern') ]
+        
+        latest_result = self.proj.list_versions( entity_list, latest_only=True )
+        assert len(latest_result) == len( engine.latest_version_ids(entity_list) )
+        
+        shot = self.proj.shot('bunny_150_0200')
+        assert shot.task('Anm').latest_version() in latest_result
+        
+        # the kept ids answer the entities not updated since, after one check per chunk
+        summarize_count = self.proj.db_access_metric()['summarize']['call_count']
+        metric          = engine.metric()
+        
+        anm_list = engine.latest_versions( entity_list, task_type_code='Anm' )
+        
+        check_count = engine.metric()['check'] - metric['check']
+        
+        assert check_count == 3
+        assert engine.metric()['miss'] == metric['miss']
+        assert self.proj.db_access_metric()['summarize']['call_count'] == summarize_count + check_count
+        assert anm_list == [ v for v in latest_result if v.task().entity_code()=='Anm' ]
+        
+        # a forgotten entity is summarized again
+        engine.invalidate( [ shot ] )
+        engine.latest_versions( entity_list )
+        
+        assert self.proj.db_access_metric()['summarize']['call_count'] == summarize_count + 2 * check_count + 1
+        
+        # a version published by another session is seen, the updated_at of the shot has not moved.
+        proj  = entity_factory.Project( self._mock_session( seq_count=2, shot_count=4 ) )
+        other = entity_factory.Project( self._mock_session( seq_count=2, shot_count=4 ) )
+        
+        shot_code = proj.list_shots()[0].entity_code()
+        pre_ver   = proj.shot(shot_code).task('Anm').latest_version()
+        
+        new_ver = other.create_version( other.shot(shot_code).task('Anm'), '/tmp/anm.mov', 'publish', artist='pparker' )
+        
+        assert new_ver.number() == pre_ver.number() + 1
+        assert proj.shot(shot_code).task('Anm').latest_version().entity_id() == new_ver.entity_id()
+        assert new_ver.entity_id() in [ v.entity_id() for v in proj.list_versions( proj.list_shots(), latest_only=True ) ]
+        
 
+    def test_version_parent_fanout(self):
+        proj = entity_factory.Project( self.proj._prod_db )
+        
+        # a playlist of shot and asset versions, none of the parents cached.
+        meta_list = [ {'entity_type':miso.ENT_SHOT, 'id':s.entity_id()} for s in self.proj.list_shots('bunny_050') ] + \
+                    [ {'entity_type':miso.ENT_ASSET, 'id':self.proj.asset(code).entity_id()} for code in ['Alice', 'Fern'] ]
+        
+        ver_list = [ proj._objectfy_entity( miso.ENT_VERSION, ver_id, ver_data ) 
+                        for ver_id, ver_data in proj._prod_db.list_versions( entity_meta_list=meta_list ) ]
+        
+        find_count = proj.db_access_metric()['find']['call_count']
+        
+        result = entity_factory.VersionResult( proj, ver_list )
+        
+        # one query for the shots, one for the assets and one for the tasks.
+        assert proj.db_access_metric()['find']['call_count'] == find_count + 3
+        assert set( result.list_entities() ) == set( [ s.entity_code() for s in self.proj.list_shots('bunny_050') ] + 
+                                                     ['Alice', 'Fern'] )
+        
+        entity_list = proj.get_entities_from_meta( meta_list + [ {'entity_type':miso.ENT_SHOT, 'id':-1} ] )
+        
+        assert [ e.entity_id() for e in entity_list[:-1] ] == [ m['id'] for m in meta_list ]
+        assert entity_list[-1] == None
+        
+        
+    def test_list_versions_include(self):
+        proj        = entity_factory.Project( self.proj._prod_db )
+        shot_list   = self.proj.list_shots('bunny_080')
+        find_count  = lambda: proj.db_access_metric().get('find', {}).get('call_count', 0)
+        start_count = find_count()
+        
+        result = proj.list_versions( shot_list, lazy=True, include=['task', 'parent', 'artist'] )
+        
+        # one query for the versions, the tasks, the shots and the artists.
+        assert find_count() == start_count + 4
+        
+        for ver in result:
+            assert ver.task().entity_id() == ver._task_meta['id']
+            assert ver.parent().entity_id() == ver._parent_meta['id']
+            assert ver.artist(as_string=False) != None
+        
+        assert find_count() == start_count + 4
+        
+        latest = proj.list_versions( shot_list, latest_only=True, include=['task', 'parent', 'artist'] )
+        assert len(latest) and latest[0].task().entity_id() == latest[0]._task_meta['id']
+        
+        
     def test_batch_list_versions(self):
         '''
         list version for multiple objects
@@ -201,6 +880,98 @@ class TestProdb(unittest.TestCase):
 
 
 
+    def test_write_queue(self):
+        from miso.pdb_plugins import mock_shotgun
+        
+        task        = self.proj.shot('bunny_030_0010').task('Anm')
+        pre_num     = task.latest_version().number()
+        batch_count = self.proj.db_access_metric().get('batch', {}).get('call_count', 0)
+        
+        # the publishes of a farm job, numbered one after the other and sent in one batch.
+        pending_list = [ self.proj.queue_create_version( task, '/tmp/anm_v%s.mov' % i, 'farm publish', artist='pparker' ) 
+                            for i in range(3) ]
+        
+        self.proj.write_queue().flush()
+        
+        assert [ p.get().number() for p in pending_list ] == [ pre_num + 1, pre_num + 2, pre_num + 3 ]
+        assert self.proj.db_access_metric()['batch']['call_count'] == batch_count + 1
+        
+        # the new version is read back without waiting for a sync.
+        assert task.latest_version() == pending_list[-1].get()
+        
+        show_data = self.proj._prod_db._sg_class.show_data
+        
+        # a lost connection is retried
+        show_data.fail_next('batch', 1)
+        
+        pending = self.proj.queue_set_task_status( task, 'apr' )
+        assert task.status().entity_code() == 'apr'
+        
+        self.proj.write_queue().flush()
+        assert pending.get() == task
+        assert self.proj.write_queue().metric()['retry'] == 1
+        
+        # a rejected write is not retried, and the status is set back.
+        show_data.fail_next('batch', 1, mock_shotgun.Fault('rejected'))
+        
+        pending = self.proj.queue_set_task_status( task, 'ip' )
+        assert task.status().entity_code() == 'ip'
+        
+        self.proj.write_queue().flush()
+        
+        self.assertRaises( miso.WriteError, pending.get )
+        assert task.status().entity_code() == 'apr'
+        
+        # a batch written but which reply is lost is not written again.
+        pre_num = task.latest_version().number()
+        show_data.fail_next('batch', 1, lose_reply=True)
+        
+        new_ver = self.proj.create_version( task, '/tmp/anm_lost.mov', 'lost reply', artist='pparker' )
+        
+        assert new_ver.number() == pre_num + 1
+        assert self.proj._prod_db.version_ids( task.entity_id(), new_ver.number() ) == [ new_ver.entity_id() ]
+        
+        # the number is read from database, another session may have published since.
+        proj  = entity_factory.Project( self._mock_session( seq_count=2, shot_count=4 ) )
+        other = entity_factory.Project( self._mock_session( seq_count=2, shot_count=4 ) )
+        
+        shot_code = proj.list_shots()[-1].entity_code()
+        pre_num   = proj.shot(shot_code).task('Anm').latest_version().number()
+        
+        other.create_version( other.shot(shot_code).task('Anm'), '/tmp/anm.mov', 'publish', artist='pparker' )
+        
+        assert proj.create_version( proj.shot(shot_code).task('Anm'), '/tmp/anm.mov', 'publish', 
+                                    artist='pparker' ).number() == pre_num + 2
+        
+        
+    def test_write_queue_exit(self):
+        import subprocess
+        
+        # the queued writes are sent at exit, the exit handler registered first is called last.
+        script = '''
+import atexit
+pending_list = []
+def check():
+    print [ ( p.ready() and p.successful() ) for p in pending_list ]
+atexit.register(check)
+
+import miso
+proj = miso.get_project('bbb')
+task = proj.shot('bunny_040_0010').task('Anm')
+pending_list.append( proj.queue_create_version( task, '/tmp/anm_exit.mov', 'exit', artist='pparker' ) )
+'''
+        env = dict( os.environ, MISO_MOCK_SHOTGUN='1', 
+                    PYTHONPATH=os.pathsep.join( [ os.path.dirname(os.path.dirname(miso.__file__)) ] + sys.path ) )
+        
+        proc = subprocess.Popen( [ sys.executable, '-c', script ], env=env, 
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE )
+        out, err = proc.communicate()
+        
+        assert proc.returncode == 0 and 'Traceback' not in err, err
+        assert out.strip() == '[True]', out
+        
+        
+        
 READ_TEST_SUITE = unittest.TestSuite()
 WRITE_TEST_SUITE = unittest.TestSuite()
 BATCH_READ_TEST_SUITE = unittest.TestSuite()
@@ -211,26 +982,51 @@ READ_TEST_SUITE.addTest( TestProdb('test_list_sequences') )
 READ_TEST_SUITE.addTest( TestProdb('test_get_sequence') )
 READ_TEST_SUITE.addTest( TestProdb('test_list_shots') )
 READ_TEST_SUITE.addTest( TestProdb('test_get_shot') )
+READ_TEST_SUITE.addTest( TestProdb('test_get_cached_shot_by_code') )
+READ_TEST_SUITE.addTest( TestProdb('test_cache_policy') )
+READ_TEST_SUITE.addTest( TestProdb('test_snapshot') )
+READ_TEST_SUITE.addTest( TestProdb('test_sync') )
+READ_TEST_SUITE.addTest( TestProdb('test_sync_rename') )
+READ_TEST_SUITE.addTest( TestProdb('test_snapshot_refresh') )
 READ_TEST_SUITE.addTest( TestProdb('test_get_shot_cut') )
+READ_TEST_SUITE.addTest( TestProdb('test_sequence_cut') )
+READ_TEST_SUITE.addTest( TestProdb('test_shots_in_range') )
 READ_TEST_SUITE.addTest( TestProdb('test_list_task') )
+READ_TEST_SUITE.addTest( TestProdb('test_prefetch_tasks') )
+READ_TEST_SUITE.addTest( TestProdb('test_query_memo') )
+READ_TEST_SUITE.addTest( TestProdb('test_concurrent_project') )
+READ_TEST_SUITE.addTest( TestProdb('test_result_cache') )
+READ_TEST_SUITE.addTest( TestProdb('test_async_project') )
+READ_TEST_SUITE.addTest( TestProdb('test_async_session') )
+READ_TEST_SUITE.addTest( TestProdb('test_list_versions_fields') )
+READ_TEST_SUITE.addTest( TestProdb('test_batch_lookup') )
+READ_TEST_SUITE.addTest( TestProdb('test_query_profiler') )
        
 READ_TEST_SUITE.addTest( TestProdb('test_get_asset') )
 READ_TEST_SUITE.addTest( TestProdb('test_list_assets') )
    
 READ_TEST_SUITE.addTest( TestProdb('test_list_task_types') )   
 READ_TEST_SUITE.addTest( TestProdb('test_list_versions') )
+READ_TEST_SUITE.addTest( TestProdb('test_list_versions_paged') )
+READ_TEST_SUITE.addTest( TestProdb('test_list_versions_lazy') )
+READ_TEST_SUITE.addTest( TestProdb('test_filter_versions') )
 READ_TEST_SUITE.addTest( TestProdb('test_list_latest_versions') )
+READ_TEST_SUITE.addTest( TestProdb('test_latest_version_engine') )
+READ_TEST_SUITE.addTest( TestProdb('test_version_parent_fanout') )
+READ_TEST_SUITE.addTest( TestProdb('test_list_versions_include') )
 
   
 # READ_TEST_SUITE.addTest( TestProdb('test_list_clips_from_version') )
 #  
 #   
 # ####### batch read test ########
-# BATCH_READ_TEST_SUITE.addTest( TestProdb('test_batch_list_entities') )
+BATCH_READ_TEST_SUITE.addTest( TestProdb('test_batch_list_entities') )
 # BATCH_READ_TEST_SUITE.addTest( TestProdb('test_batch_list_versions') )
 # BATCH_READ_TEST_SUITE.addTest( TestProdb('test_batch_list_latest_for_sequence') )
 # 
 # ####### write test ########
+WRITE_TEST_SUITE.addTest( TestProdb('test_write_queue') )
+WRITE_TEST_SUITE.addTest( TestProdb('test_write_queue_exit') )
 # WRITE_TEST_SUITE.addTest( TestProdb('test_create_version') )
 # WRITE_TEST_SUITE.addTest( TestProdb('test_create_frame_submission') )
 
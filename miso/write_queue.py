@@ -0,0 +1,337 @@
+'''
+\namespace miso.write_queue
+
+ Queue the writes to the production database and send them together, as one batch request.
+
+ A write is queued with the callbacks updating the caller's state, and returns straight away with the
+ pending result.  A background thread sends the queued writes once write_batch_size writes are queued, or
+ write_flush_interval seconds after the first one, see miso.config.  For example, a farm job publishing
+ hundreds of frame submissions pays a few round trips rather than one per submission.
+
+        queue = WriteQueue( lambda request_list: sg.batch(request_list) )
+
+        pending_list = [ queue.submit( request ) for request in request_list ]
+
+        queue.flush()                       # send now, rather than wait for the batch to fill
+        pending_list[0].get()               # the result of the write, the exception is raised here
+
+ The batch is sent again on failure, after backoff, 2 x backoff, ... seconds, up to max_retries times.  A batch
+ rejected by the database ( WriteError ) is not sent again as is, its writes are sent one by one so that one
+ invalid write does not fail the others.  A batch may have been written with its reply lost on the way back,
+ so before it is sent again the writes already done are looked up with written_func, and only the others
+ are sent.
+
+ The writes are sent in the order queued, one batch at a time.  The queued writes are sent when the process
+ exits, see close.
+'''
+import sys, time, threading, atexit, weakref
+
+from miso import WriteError
+from miso.config import get_logger, write_batch_size, write_flush_interval, write_max_retries, write_retry_backoff
+
+LOG = get_logger()
+
+# the open write queues, closed at exit so their queued writes are sent.
+_OPEN_QUEUES = weakref.WeakSet()
+
+
+def _close_all():
+    for queue in list(_OPEN_QUEUES):
+        try:
+            queue.close()
+        except:
+            LOG.warning("Failed to send the queued writes at exit: %s" % sys.exc_info()[1])
+
+atexit.register(_close_all)
+
+
+class _PendingWrite(object):
+    '''
+    The result of a queued write, as multiprocessing.pool.AsyncResult: get(timeout), wait(timeout), ready(),
+    successful().
+    '''
+    __slots__ = ('request', 'on_success', 'on_failure', 'value', 'error', 'done')
+
+    def __init__(self, request, on_success, on_failure):
+        self.request    = request
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.value      = None
+        self.error      = None
+        self.done       = threading.Event()
+
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+
+
+    def ready(self):
+        return self.done.is_set()
+
+
+    def successful(self):
+        assert self.ready(), "The write is not sent yet."
+
+        return self.error==None
+
+
+    def get(self, timeout=None):
+        '''
+        @param timeout [optional] seconds to wait for the write to be sent.
+        @return the result of the write, as returned by the on_success callback.
+        '''
+        self.done.wait(timeout)
+
+        if not self.done.is_set():
+            raise RuntimeError, "Timed out waiting for the write to be sent."
+
+        if self.error!=None:
+            raise self.error[0], self.error[1], self.error[2]
+
+        return self.value
+
+
+class WriteQueue:
+
+    def __init__(self,  write_func,
+                        batch_size      = None,
+                        flush_interval  = None,
+                        max_retries     = None,
+                        retry_backoff   = None,
+                        written_func    = None ):
+        '''
+        @param write_func function given the list of write requests, returning the list of their results.
+                          All or none of the writes are done.
+        @param written_func [optional] function given the list of write requests, returning the result of each 
+                            write already done, None for the others.  Called before a failed batch is sent 
+                            again.  Without it, a batch written but which reply was lost is written twice.
+        @param batch_size [optional] default config.write_batch_size
+        @param flush_interval [optional] default config.write_flush_interval
+        @param max_retries [optional] default config.write_max_retries
+        @param retry_backoff [optional] default config.write_retry_backoff
+        '''
+        self._write_func        = write_func
+        self._batch_size        = batch_size     or write_batch_size
+        self._flush_interval    = flush_interval if flush_interval!=None else write_flush_interval
+        self._max_retries       = max_retries    if max_retries!=None    else write_max_retries
+        self._retry_backoff     = retry_backoff  if retry_backoff!=None  else write_retry_backoff
+        self._written_func      = written_func
+
+        self._queue             = []                # [ ( queued time, _PendingWrite ) ]
+        self._thread            = None
+        self._closed            = False
+        self._metric            = {'batch':0, 'write':0, 'retry':0, 'failed':0}
+
+        self._cond              = threading.Condition( threading.Lock() )
+
+        # held while a batch is taken from the queue and sent, the batches go one at a time and in order.
+        self._send_lock         = threading.Lock()
+
+        _OPEN_QUEUES.add(self)
+
+
+    def submit(self, request, on_success=None, on_failure=None):
+        '''
+        Queue the write, it is sent with the next batch.
+        @param request the write request, as given to the write function.
+        @param on_success [optional] function given the result of the write, returning the value of the pending
+                          result.  Called from the sending thread.
+        @param on_failure [optional] function given the error of the write, ex: to undo an optimistic update.
+        @rtype: _PendingWrite
+        '''
+        pending = _PendingWrite(request, on_success, on_failure)
+
+        with self._cond:
+            assert not self._closed, "Failed to queue the write, the write queue is closed."
+
+            self._queue.append( (time.time(), pending) )
+
+            if self._thread==None:
+                self._thread = threading.Thread( target=self._run, name='miso_write_queue' )
+                self._thread.daemon = True
+                self._thread.start()
+
+            self._cond.notify()
+
+        return pending
+
+
+    def __len__(self):
+        '''
+        @return number of writes waiting to be sent.
+        '''
+        with self._cond:
+            return len(self._queue)
+
+
+    def _take(self, count=None):
+        with self._cond:
+            count = len(self._queue) if count==None else count
+            taken, self._queue = self._queue[:count], self._queue[count:]
+
+        return [ pending for queued_time, pending in taken ]
+
+
+    def _run(self):
+        '''
+        Send the batches once full, or flush_interval after their first write was queued.
+        '''
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+
+                if self._closed:
+                    return
+
+                while 0 < len(self._queue) < self._batch_size and not self._closed:
+                    remaining = self._queue[0][0] + self._flush_interval - time.time()
+                    if remaining <= 0:
+                        break
+
+                    self._cond.wait(remaining)
+
+            with self._send_lock:
+                batch = self._take(self._batch_size)
+                if batch:
+                    self._send(batch)
+
+
+    def flush(self):
+        '''
+        Send all the queued writes now, and wait for them to be sent.
+        '''
+        with self._send_lock:
+            batch = self._take()
+
+            for i in range(0, len(batch), self._batch_size):
+                self._send( batch[i:i+self._batch_size] )
+
+
+    def _send(self, batch):
+        '''
+        Send the batch, again after backoff if it fails, and resolve the pending results.
+        '''
+        attempt = 0
+        failed  = False
+
+        while True:
+            try:
+                # the failed batch may have been written, only send the writes not found.
+                if failed and self._written_func:
+                    batch = self._resolve_written(batch)
+                    if not batch:
+                        return
+
+                result_list = self._write_func( [ pending.request for pending in batch ] )
+                break
+
+            except WriteError:
+                # find the rejected writes, the others go through.
+                if len(batch) > 1:
+                    LOG.warning("Batch of %s writes rejected, sending the writes one by one." % len(batch))
+
+                    for pending in batch:
+                        self._send( [ pending ] )
+                    return
+
+                self._fail(batch, sys.exc_info())
+                return
+
+            except Exception:
+                failed = True
+
+                if attempt >= self._max_retries:
+                    self._fail(batch, sys.exc_info())
+                    return
+
+                LOG.warning("Failed to send the batch of %s writes, retrying in %s seconds." % (
+                                                                len(batch), self._retry_backoff * 2 ** attempt))
+
+                time.sleep( self._retry_backoff * 2 ** attempt )
+                attempt += 1
+
+                with self._cond:
+                    self._metric['retry'] += 1
+
+        with self._cond:
+            self._metric['batch'] += 1
+            self._metric['write'] += len(batch)
+
+        for pending, result in zip(batch, result_list):
+            self._resolve(pending, result)
+
+
+    def _resolve(self, pending, result):
+        try:
+            pending.value = pending.on_success(result) if pending.on_success else result
+        except:
+            pending.error = sys.exc_info()
+
+        pending.done.set()
+
+
+    def _resolve_written(self, batch):
+        '''
+        Resolve the writes of the batch already done.
+        @return the writes not done, to be sent.
+        '''
+        remaining = []
+
+        for pending, result in zip( batch, self._written_func( [ pending.request for pending in batch ] ) ):
+            if result==None:
+                remaining.append(pending)
+            else:
+                self._resolve(pending, result)
+
+        if len(remaining) < len(batch):
+            LOG.warning("%s writes of the failed batch were written, not sending them again." % (
+                                                                                    len(batch) - len(remaining)))
+            with self._cond:
+                self._metric['write'] += len(batch) - len(remaining)
+
+        return remaining
+
+
+    def _fail(self, batch, error):
+        LOG.warning("Failed to send %s writes: %s" % (len(batch), error[1]))
+
+        with self._cond:
+            self._metric['failed'] += len(batch)
+
+        for pending in batch:
+            pending.error = error
+
+            if pending.on_failure:
+                try:
+                    pending.on_failure(error[1])
+                except:
+                    LOG.warning("Failed to undo the write: %s" % sys.exc_info()[1])
+
+            pending.done.set()
+
+
+    def metric(self):
+        '''
+        @return number of batches and writes sent, batches sent again ( retry ), and writes failed.
+        @rtype: dict
+        '''
+        with self._cond:
+            return dict(self._metric)
+
+
+    def close(self):
+        '''
+        Send the queued writes and stop the background thread.  Called at exit for the queues not closed.
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+
+        if thread!=None:
+            thread.join()
+
+        self.flush()
+
+        _OPEN_QUEUES.discard(self)